@@ -2,11 +2,12 @@
 import random
 import math
 import itertools
-import threading
 # third-party
+try:
+    import numpy as np
+except ImportError:
+    np = None # getAttitudes() falls back to pure Python
 # local
-import SimEngine
-import Wireless
 import Utils as u
 
 class DotBot(object):
@@ -14,28 +15,58 @@ class DotBot(object):
     A single DotBot.
     '''
     
-    def __init__(self,dotBotId,floorplan):
+    BUMPTSMARGIN = 1e-9 # s, margin absorbing rounding errors when pruning obstacles further than the next bump
+    
+    # no per-instance __dict__: a swarm holds many DotBots
+    __slots__ = [
+        'dotBotId','floorplan','simEngine','wireless',
+        'x','y','posTs','startTs','lastCommandIdReceived',
+        'headingRequested','headingInaccuracy','headingActual','dx','dy',
+        'speedRequested','speedInaccuracy','speedActual',
+        'next_bump_x','next_bump_y','next_bump_ts','trajectoryVersion',
+        'seed','rng','clock','turns',
+    ]
+    
+    def __init__(self,dotBotId,floorplan,simEngine,wireless,seed=None,clock=None,turns=None):
+        '''
+        The inaccuracies are drawn from a random stream of the DotBot's own, derived from seed (see _random()). None
+        for the global random module.
+        
+        clock, if set, quantizes timestamps to the ticks of the DotBot's clock (e.g. Protocol.quantize): the DotBot
+        then starts and stops moving on those ticks, the timestamps of its reports being exact. None for exact times.
+        
+        turns, if set, tells when a moving DotBot turns by itself, and to which heading (e.g. Protocol.nextTurn, see
+        there). None for DotBots which only change heading when commanded.
+        '''
         
         # store params
         self.dotBotId                  = dotBotId
         self.floorplan                 = floorplan
+        self.simEngine                 = simEngine
+        self.wireless                  = wireless
+        self.seed                      = seed
+        self.clock                     = clock
+        self.turns                     = turns
         
         # local variables
-        self.simEngine                 = SimEngine.SimEngine()
-        self.wireless                  = Wireless.Wireless()
         self.x                         = None  # the "real" position, sometimes in the past. Set to None to ensure single initialization
         self.y                         = None
         self.posTs                     = 0     # timestamp, in s, of when was at position
+        self.startTs                   = 0     # timestamp, in s, of when I last received a command, reported with the next bump
         self.lastCommandIdReceived     = None  # set to None as not a valid command Id
         self.headingRequested          = 0     # the heading, a float between 0 and 360 degrees (0 indicates North) as requested by the orchestrator
         self.headingInaccuracy         = 0     # innaccuracy, in degrees of the heading. Actual error computed as uniform(-,+)
         self.headingActual             = 0     # actual heading, taking into account inaccuracy
+        self.dx                        = math.cos(math.radians(self.headingActual-90)) # unit vector of the actual heading, updated with it
+        self.dy                        = math.sin(math.radians(self.headingActual-90))
         self.speedRequested            = 0     # speed, in m/s, as requested by the orchestrator
         self.speedInaccuracy           = 0     # innaccuracy, in m/s of the speed. Actual error computed as uniform(-,+)
         self.speedActual               = 0     # actual speed, taking into account inaccuracy
         self.next_bump_x               = None  # coordinate the DotBot will bump into next
         self.next_bump_y               = None
         self.next_bump_ts              = None  # time at which DotBot will bump
+        self.trajectoryVersion         = 0     # incremented each time the trajectory changes (new bump scheduled, bumped)
+        self.rng                       = None  # created on first use, see _random()
 
     #======================== public ==========================================
         
@@ -54,12 +85,43 @@ class DotBot(object):
         Received a packet from the orchestrator
         '''
         
+        # apply the command which is for me, if new
+        if not self.applyCommand(packet):
+            return
+        
+        # compute when/where next bump will happen, remember and schedule
+        self._moveOn()
+    
+    def applyCommand(self,packet):
+        '''
+        Apply the heading and speed the orchestrator packet contains for me.
+        
+        \return True if the command is new (next bump needs to be computed), False if duplicate
+        '''
+        
         # extract portion of orchestrator message which is for me (shorthand)
         myMsg = packet[self.dotBotId]
         
         # disregard duplicate command
-        if myMsg['commandId']==self.lastCommandIdReceived:
-            return
+        # Note: packed frames carry no commandId (see Protocol.DownstreamFrames), a command is then a duplicate if it
+        #       is the one I last applied. The orchestrator gives a DotBot which bumped a new heading.
+        if myMsg['commandId'] is None:
+            if (
+                myMsg['heading']==self.headingRequested and
+                myMsg['speed']==self.speedRequested
+            ):
+                return False
+        elif myMsg['commandId']==self.lastCommandIdReceived:
+            return False
+        
+        # move to where I am now, as the new command starts now
+        # Note: over lossy links, a DotBot which bumped may only receive its next command cycles later
+        now = self._now()
+        if now!=self.posTs:
+            self.x     += (now-self.posTs)*self.dx*self.speedActual
+            self.y     += (now-self.posTs)*self.dy*self.speedActual
+            self.posTs  = now
+        self.startTs    = now
         
         # remember what I was asked
         self.lastCommandIdReceived     = myMsg['commandId']
@@ -70,19 +132,32 @@ class DotBot(object):
         self._setHeading(myMsg['heading'])
         self._setSpeed(  myMsg['speed'])
         
-        # compute when/where next bump will happen
-        (bump_x,bump_y,bump_ts) = self._computeNextBump()
-
-
-
-
+        return True
+    
+    def setNextBump(self,bump_x,bump_y,bump_ts,heading=None):
+        '''
+        Remember when/where the next bump will happen, and schedule it.
+        
+        With turns, also schedule the turn from heading, the heading I move in (None for the one requested), if it
+        comes before the bump.
+        '''
+        
         # remember
         self.next_bump_x  = bump_x
         self.next_bump_y  = bump_y
         self.next_bump_ts = bump_ts
+        self.trajectoryVersion += 1
+        self._recordTrajectory()
         
         # schedule
-        self.simEngine.schedule(self.next_bump_ts,self._bump)
+        # Note: the bump is dropped if the trajectory changes before (I turn)
+        self.simEngine.schedule(self.next_bump_ts,self._bump,self.trajectoryVersion)
+        if self.turns is not None and self.speedActual!=0:
+            (turnTs,turnHeading) = self.turns(
+                self.dotBotId,self.posTs,self.headingRequested if heading is None else heading,
+            )
+            if turnTs<self.next_bump_ts:
+                self.simEngine.schedule(turnTs,self._turn,self.trajectoryVersion,turnHeading)
     
     def getAttitude(self):
         '''
@@ -96,12 +171,13 @@ class DotBot(object):
         x                = self.x
         y                = self.y
         posTs            = self.posTs
-        headingActual    = self.headingActual
+        dx               = self.dx
+        dy               = self.dy
         speedActual      = self.speedActual
 
         # update position
-        newX                 = x + (now-posTs)*math.cos(math.radians(headingActual-90))*speedActual
-        newY                 = y + (now-posTs)*math.sin(math.radians(headingActual-90))*speedActual
+        newX                 = x + (now-posTs)*dx*speedActual
+        newY                 = y + (now-posTs)*dy*speedActual
 
 
         # do NOT write back any results to the DotBot's state as race condition possible
@@ -115,29 +191,99 @@ class DotBot(object):
             'next_bump_y': self.next_bump_y,
         }
     
+    #=== checkpoint
+    
+    CHECKPOINTSLOTS = [slot for slot in __slots__ if slot not in ['dotBotId','floorplan','simEngine','wireless','seed','rng','clock','turns']]
+    
+    def getCheckpoint(self):
+        '''
+        \return the state of the DotBot, as plain data (see Simulation.checkpoint())
+        '''
+        return {
+            'state':   {slot: getattr(self,slot) for slot in self.CHECKPOINTSLOTS},
+            'rng':     self.rng.getstate() if isinstance(self.rng,random.Random) else None,
+        }
+    
+    def setCheckpoint(self,checkpoint):
+        for (slot,value) in checkpoint['state'].items():
+            setattr(self,slot,value)
+        if checkpoint['rng'] is not None:
+            self._random() # create the stream
+            self.rng.setstate(checkpoint['rng'])
+    
     #======================== private =========================================
     
-    def _bump(self):
+    def _bump(self,trajectoryVersion):
         '''
         Bump sensor triggered
         '''
         
+        # the trajectory this bump was computed for was replaced
+        if trajectoryVersion!=self.trajectoryVersion:
+            return
+        
         # update my position
         self.x               = self.next_bump_x
         self.y               = self.next_bump_y
         self.posTs           = self.next_bump_ts
         # stop moving
         self.speedActual     = 0
+        self.trajectoryVersion += 1
+        self._recordTrajectory()
 
         assert self.simEngine.currentTime() == self.next_bump_ts
 
+        # record
+        if self.simEngine.trace is not None:
+            self.simEngine.trace.record('bump',self.posTs,self.dotBotId,self.x,self.y)
+
         # report bump to orchestrator
         self.wireless.toOrchestrator({
             'dotBotId':      self.dotBotId,
             'bumpTs':        self.simEngine.currentTime(),
-
+            'startTs':       self.startTs,
         })
     
+    def _turn(self,trajectoryVersion,heading):
+        '''
+        Turn by myself, while moving (see Protocol.nextTurn).
+        '''
+        
+        # I bumped since
+        if trajectoryVersion!=self.trajectoryVersion:
+            return
+        
+        # move to where I am now, rounded as the position of a bump
+        # Note: on a tick of my clock, the orchestrator then finds the same position
+        now         = self.simEngine.currentTime()
+        self.x      = round(self.x+(now-self.posTs)*self.dx*self.speedActual,3)
+        self.y      = round(self.y+(now-self.posTs)*self.dy*self.speedActual,3)
+        self.posTs  = now
+        
+        # move on in the new heading
+        self._setHeading(heading)
+        self._moveOn(heading)
+    
+    def _moveOn(self,heading=None):
+        '''
+        Compute when/where next bump will happen, remember and schedule it.
+        '''
+        profiler = self.simEngine.profiler
+        if profiler is None:
+            (bump_x,bump_y,bump_ts) = self._computeNextBump()
+        else:
+            ((bump_x,bump_y,bump_ts),_) = profiler.call('DotBot._computeNextBump',self._computeNextBump)
+        self.setNextBump(bump_x,bump_y,bump_ts,heading)
+    
+    def _recordTrajectory(self):
+        trace = self.simEngine.trace
+        if trace is not None:
+            trace.record(
+                'trajectory',
+                self.posTs,self.dotBotId,self.x,self.y,self.headingActual,self.speedActual,
+                self.next_bump_x,self.next_bump_y,self.next_bump_ts,
+            )
+    
     def _setHeading(self,heading):
         '''
         Change the heading of the DotBot.
@@ -147,9 +293,11 @@ class DotBot(object):
         assert heading>=0
         assert heading<360
         if self.headingInaccuracy: # cut computation in two cases for efficiency
-            self.headingActual = heading + (-1+(2*random.random()))*self.headingInaccuracy
+            self.headingActual = heading + (-1+(2*self._random()))*self.headingInaccuracy
         else:
             self.headingActual = heading
+        self.dx                = math.cos(math.radians(self.headingActual-90))
+        self.dy                = math.sin(math.radians(self.headingActual-90))
     
     def _setSpeed(self,speed):
         '''
@@ -158,10 +306,32 @@ class DotBot(object):
         Assumes applying new speed is infinitely fast.
         '''
         if self.speedInaccuracy: # cut computation in two cases for efficiency
-            self.speedActual = speed + (-1+(2*random.random()))*self.speedInaccuracy
+            self.speedActual = speed + (-1+(2*self._random()))*self.speedInaccuracy
         else:
             self.speedActual = speed
 
+    def _now(self):
+        '''
+        \return the current time, on the ticks of my clock
+        '''
+        now = self.simEngine.currentTime()
+        if self.clock is not None:
+            now = self.clock(now)
+        return now
+    
+    def _random(self):
+        '''
+        \return a float in [0,1) from the DotBot's random stream
+        
+        The stream is only created when first needed, DotBots without inaccuracy never draw.
+        '''
+        if self.rng is None:
+            if self.seed is None:
+                self.rng = random
+            else:
+                self.rng = random.Random('{0}/dotbot/{1}'.format(self.seed,self.dotBotId))
+        return self.rng.random()
+    
     def _computeNextBump(self):
 
         # compute when/where next bump will happen with frame
@@ -172,8 +342,15 @@ class DotBot(object):
         bump_y     = bump_y_frame
         bump_ts    = bump_ts_frame
         
-        # loop through obstables, lookign for closer bump coordinates
-        for obstacle in self.floorplan.obstacles:
+        # length of the trajectory to the frame, to convert positions along it into time
+        framedistance = u.distance((self.x,self.y),(bump_x_frame,bump_y_frame))
+
+        # loop through obstables along the trajectory, lookign for closer bump coordinates
+        for (pos,obstacle) in self.floorplan.obstaclesAlong(self.x,self.y,bump_x_frame,bump_y_frame):
+            
+            # stop when the remaining obstacles are further away than the closest bump found so far
+            if self.posTs+(pos*framedistance/self.speedActual)>bump_ts+self.BUMPTSMARGIN:
+                break
             
             # coordinates of obstacble upper left and lower right corner
             ax     = obstacle['x']
@@ -189,9 +366,13 @@ class DotBot(object):
             if (bump_xo!=None) and (bump_tso<=bump_ts):
                     (bump_x,bump_y,bump_ts) = (bump_xo,bump_yo,bump_tso)
 
+        # the bump sensor triggers on a tick of my clock
+        if self.clock is not None:
+            bump_ts = self.clock(bump_ts)
+
         # FIXME: remove this
-        bump_x     = self.x + (bump_ts-self.posTs)*math.cos(math.radians(self.headingActual-90))*self.speedActual
-        bump_y     = self.y + (bump_ts-self.posTs)*math.sin(math.radians(self.headingActual-90))*self.speedActual
+        bump_x     = self.x + (bump_ts-self.posTs)*self.dx*self.speedActual
+        bump_y     = self.y + (bump_ts-self.posTs)*self.dy*self.speedActual
         bump_x     = round(bump_x,3)
         bump_y     = round(bump_y, 3)
 
@@ -376,3 +557,49 @@ class DotBot(object):
         else:
 
             return (None,None,None)
+
+#=== view of the swarm, for the UI
+
+def getAttitudes(dotbots,now):
+    '''
+    DotBot.getAttitude() of all dotbots at time now, as columns: each field is gathered in one pass over the DotBots,
+    and the positions are extrapolated in one vectorized pass if numpy is available.
+    
+    \return dict with the keys of DotBot.getAttitude(), each a column of floats (NaN for unknown next bumps): a numpy
+    array if numpy is available, a list otherwise
+    '''
+    
+    # gather state
+    x                    = [dotbot.x             for dotbot in dotbots]
+    y                    = [dotbot.y             for dotbot in dotbots]
+    posTs                = [dotbot.posTs         for dotbot in dotbots]
+    dx                   = [dotbot.dx            for dotbot in dotbots]
+    dy                   = [dotbot.dy            for dotbot in dotbots]
+    speed                = [dotbot.speedActual   for dotbot in dotbots]
+    heading              = [dotbot.headingActual for dotbot in dotbots]
+    nextx                = [dotbot.next_bump_x   for dotbot in dotbots]
+    nexty                = [dotbot.next_bump_y   for dotbot in dotbots]
+    
+    # update position
+    if np is not None:
+        (x,y,posTs,dx,dy,speed,heading,nextx,nexty) = np.array(
+            [x,y,posTs,dx,dy,speed,heading,nextx,nexty],dtype=float, # None is NaN
+        )
+        elapsed          = now-posTs
+        returnVal        = {
+            'x':           x+elapsed*dx*speed,
+            'y':           y+elapsed*dy*speed,
+        }
+    else:
+        returnVal        = {
+            'x':           [x+(now-posTs)*dx*speed for (x,posTs,dx,speed) in zip(x,posTs,dx,speed)],
+            'y':           [y+(now-posTs)*dy*speed for (y,posTs,dy,speed) in zip(y,posTs,dy,speed)],
+        }
+        nextx            = [math.nan if v is None else v for v in nextx]
+        nexty            = [math.nan if v is None else v for v in nexty]
+    returnVal['heading']     = heading
+    returnVal['speed']       = speed
+    returnVal['next_bump_x'] = nextx
+    returnVal['next_bump_y'] = nexty
+    
+    return returnVal
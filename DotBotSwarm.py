@@ -0,0 +1,325 @@
+# built-in
+import math
+# third-party
+import numpy as np
+# local
+import Utils as u
+
+class DotBotSwarm(object):
+    '''
+    Vectorized (NumPy) backend computing the next bump of many DotBots at once.
+
+    The DotBot objects remain the reference for the state of each DotBot. When a downstream packet is received, the
+    position, heading and speed of the DotBots it commands are gathered into arrays. The intersections with the frame,
+    and with the obstacles the obstacle index of the floorplan lists along their trajectories, are then computed in
+    vectorized passes, rather than one DotBot at a time.
+
+    Results are exactly those of DotBot._computeNextBump(): the vectorized passes follow its arithmetic, and the
+    few steps NumPy does not round as Python does (squares, rounding of halfway values) are done in Python.
+    This pays off when many DotBots are commanded at once (e.g. Orchestrator.startExploration(), or the DotBots which
+    bumped during a cycle of a large swarm), see benchmarks/BenchSuite.py (swarm). Smaller batches are handed to the
+    scalar path.
+    '''
+
+    MINBATCH    = 128  # DotBots, below which they compute their next bump one by one (DotBot._computeNextBump())
+    ROUNDLENGTH = 4    # m, of trajectory searched for obstacles in the first round, doubled at every round
+    EPSILON     = 1e-6 # m, margin absorbing the rounding errors on the positions sampled along the trajectories
+
+    def __init__(self,dotbots,floorplan,simEngine=None):
+
+        # store params
+        self.dotbots         = dotbots
+        self.floorplan       = floorplan
+        self.simEngine       = simEngine
+
+        # local variables
+        self._obstacles      = np.array(
+            [
+                (o['x'],o['y'],o['x']+o['width'],o['y']+o['height'])
+                for o in floorplan.obstacles
+            ],
+            dtype = float,
+        ).reshape(-1,4) # one row per obstacle: upper-left corner (ax,ay), lower-right corner (bx,by)
+        self._buildCells()
+
+    #======================== public ==========================================
+
+    def fromOrchestrator(self,packet,dotBotIds):
+        '''
+        Received a packet from the orchestrator, on behalf of the DotBots in dotBotIds.
+        '''
+
+        # apply the commands, keep the DotBots which need a new bump
+        dotbots = [self.dotbots[i] for i in dotBotIds if self.dotbots[i].applyCommand(packet)]
+        if not dotbots:
+            return
+
+        # compute all next bumps at once
+        profiler = None if self.simEngine is None else self.simEngine.profiler
+        if profiler is None:
+            (bump_x,bump_y,bump_ts) = self.computeNextBumps(dotbots)
+        else:
+            ((bump_x,bump_y,bump_ts),_) = profiler.call('DotBotSwarm.computeNextBumps',self.computeNextBumps,dotbots)
+
+        # hand results back to the DotBots
+        for (dotbot,x,y,ts) in zip(dotbots,bump_x,bump_y,bump_ts):
+            dotbot.setNextBump(x,y,ts)
+
+    def computeNextBumps(self,dotbots):
+        '''
+        \return (bump_x,bump_y,bump_ts) lists, with the next bump of each DotBot
+        '''
+
+        # few DotBots: the vectorized passes cost more than they save
+        if len(dotbots)<self.MINBATCH:
+            return tuple(list(v) for v in zip(*[dotbot._computeNextBump() for dotbot in dotbots]))
+
+        # gather state into arrays
+        x                = np.array([dotbot.x             for dotbot in dotbots],dtype=float)
+        y                = np.array([dotbot.y             for dotbot in dotbots],dtype=float)
+        posTs            = np.array([dotbot.posTs         for dotbot in dotbots],dtype=float)
+        heading          = np.array([dotbot.headingActual for dotbot in dotbots],dtype=float)
+        speed            = np.array([dotbot.speedActual   for dotbot in dotbots],dtype=float)
+
+        # frame
+        (frame_x,frame_y,frame_ts) = self._computeNextBumpsFrame(dotbots,x,y,posTs,heading,speed)
+
+        # obstacles
+        bump_ts          = self._computeNextBumpsObstacles(x,y,posTs,speed,frame_x,frame_y,frame_ts)
+
+        # position at time of bump, on the ticks of the DotBot's clock (see DotBot._computeNextBump)
+        (bump_x,bump_y)  = ([],[])
+        for (i,dotbot) in enumerate(dotbots):
+            if dotbot.clock is not None:
+                bump_ts[i] = dotbot.clock(bump_ts[i])
+            bump_x      += [round(dotbot.x+(bump_ts[i]-dotbot.posTs)*dotbot.dx*dotbot.speedActual,3)]
+            bump_y      += [round(dotbot.y+(bump_ts[i]-dotbot.posTs)*dotbot.dy*dotbot.speedActual,3)]
+
+        return (bump_x,bump_y,bump_ts)
+
+    #======================== private =========================================
+
+    def _buildCells(self):
+        '''
+        Store the obstacle index of the floorplan as arrays: the obstacles touching cell c (row*numCols+col) are
+        self._cellObstacles[self._cellStarts[c]:self._cellStarts[c+1]]. Without index, a single cell holds them all.
+        '''
+        obstacleIndex        = self.floorplan.obstacleIndex()
+        if obstacleIndex is None:
+            self._cellSize   = max(self.floorplan.width,self.floorplan.height,1)
+            self._firstRound = math.inf # a single round
+            (numCols,numRows,index) = (1,1,{(0,0): list(range(len(self.floorplan.obstacles)))})
+        else:
+            self._cellSize   = self.floorplan.CELLSIZE
+            self._firstRound = self.ROUNDLENGTH
+            (numCols,numRows,index) = obstacleIndex
+        self._numCols        = numCols
+        self._numRows        = numRows
+        cells                = [index.get((col,row),[]) for row in range(numRows) for col in range(numCols)]
+        self._cellStarts     = np.cumsum([0]+[len(cell) for cell in cells])
+        self._cellObstacles  = np.array([idx for cell in cells for idx in cell],dtype=int)
+
+    def _computeNextBumpsFrame(self,dotbots,x,y,posTs,heading,speed):
+        '''
+        Vectorized version of DotBot._computeNextBumpFrame().
+
+        DotBots whose trajectory crosses the perimeter at more than two points (through a corner) are handed to it.
+        '''
+
+        # shorthand
+        width            = self.floorplan.width
+        height           = self.floorplan.height
+        horizontal       = np.isin(heading,[ 90,270])
+        vertical         = np.isin(heading,[  0,180])
+
+        # intersections of the trajectory (y = a*x + b) with the 4 walls
+        a                = np.array([math.tan(math.radians(h-90)) for h in heading.tolist()])
+        with np.errstate(divide='ignore',invalid='ignore',over='ignore'):
+            b            = y - (a*x)
+            north_x      = np.where(vertical,  x,self._round3((0     -b)/a))
+            south_x      = np.where(vertical,  x,self._round3((height-b)/a))
+            west_y       = np.where(horizontal,y,self._round3(0*a+b))
+            east_y       = np.where(horizontal,y,self._round3(width*a+b))
+
+        # the intersection points on the floorplan perimeter, in the order DotBot._computeNextBumpFrame() lists them
+        int_x            = np.stack([north_x,south_x,np.zeros_like(x),np.full_like(x,width)],axis=1)
+        int_y            = np.stack([np.zeros_like(y),np.full_like(y,height),west_y,east_y],axis=1)
+        valid            = np.stack([
+            ~horizontal & (0<=north_x) & (north_x<=width),
+            ~horizontal & (0<=south_x) & (south_x<=width),
+            ~vertical   & (0<=west_y)  & (west_y<=height),
+            ~vertical   & (0<=east_y)  & (east_y<=height),
+        ],axis=1)
+
+        # pick the correct one of the two given the heading of the robot
+        rows             = np.arange(len(x))
+        first            = np.argmax(valid,axis=1)
+        last             = 3-np.argmax(valid[:,::-1],axis=1)
+        (x0,y0)          = (int_x[rows,first],int_y[rows,first])
+        (x1,y1)          = (int_x[rows,last], int_y[rows,last])
+        pick0            = np.select(
+            [heading==0,(0<heading)&(heading<180),heading==180],
+            [y0<y1,     x1<x0,                    y1<y0       ],
+            x0<x1,
+        )
+        bump_x           = np.where(pick0,x0,x1).tolist()
+        bump_y           = np.where(pick0,y0,y1).tolist()
+
+        # compute time to bump
+        frame_ts         = [
+            ts+u.distance((rx,ry),(bx,by))/s
+            for (rx,ry,ts,s,bx,by) in zip(x.tolist(),y.tolist(),posTs.tolist(),speed.tolist(),bump_x,bump_y)
+        ]
+
+        # round
+        frame_x          = self._round3(np.array(bump_x))
+        frame_y          = self._round3(np.array(bump_y))
+
+        # through a corner
+        for i in np.flatnonzero(valid.sum(axis=1)!=2).tolist():
+            (frame_x[i],frame_y[i],frame_ts[i]) = dotbots[i]._computeNextBumpFrame()
+
+        return (frame_x,frame_y,frame_ts)
+
+    def _computeNextBumpsObstacles(self,x,y,posTs,speed,frame_x,frame_y,frame_ts):
+        '''
+        Vectorized version of the obstacle loop of DotBot._computeNextBump().
+
+        The trajectories are searched in rounds, each round ROUNDLENGTH further than the previous one. A round
+        samples the trajectories every half cell, and collects the obstacles touching the cells around the samples,
+        which include all the cells the trajectories cross. DotBots stop being searched once they bump before the
+        end of the round. The time of the earliest bumps is then computed in Python, as DotBot._computeNextBump().
+
+        \return the time of the next bump, frame included, as a list
+        '''
+
+        returnVal        = list(frame_ts)
+        if not len(self._obstacles):
+            return returnVal
+
+        # shorthand
+        cellsize         = self._cellSize
+        deltax           = frame_x-x
+        deltay           = frame_y-y
+        dist             = np.hypot(deltax,deltay)
+        bump_u1          = np.full(len(x),np.inf)
+
+        # unit vector of the trajectory, to sample it
+        with np.errstate(divide='ignore',invalid='ignore'):
+            ux           = np.where(dist>0,deltax/dist,0)
+            uy           = np.where(dist>0,deltay/dist,0)
+
+        # the earliest bump of each DotBot, as a position along its trajectory
+        active           = np.flatnonzero(dist>0)
+        covered          = np.zeros(len(x))
+        roundlength      = self._firstRound
+        while len(active):
+
+            # sample the next portion of each trajectory, every half cell, end included
+            start        = covered[active]
+            end          = np.minimum(start+roundlength,dist[active])
+            counts       = np.floor((end-start)/(cellsize/2)).astype(int)+2
+            owner        = np.repeat(active,counts)
+            step         = np.arange(counts.sum())-np.repeat(np.cumsum(counts)-counts,counts)
+            d            = np.minimum(covered[owner]+step*(cellsize/2),np.repeat(end,counts))
+            px           = x[owner]+d*ux[owner]
+            py           = y[owner]+d*uy[owner]
+
+            # the piece between two consecutive samples is shorter than a cell, so it touches at most 2 columns and
+            # 2 rows of cells; EPSILON absorbs the rounding errors on the samples
+            last         = owner[:-1]==owner[1:]
+            owner        = owner[:-1][last]
+            bounds       = []
+            for (p,n) in ((px,self._numCols),(py,self._numRows)):
+                (lo,hi)  = (np.minimum(p[:-1],p[1:])[last],np.maximum(p[:-1],p[1:])[last])
+                bounds  += [np.clip(np.floor((lo-self.EPSILON)/cellsize).astype(int),0,n-1)]
+                bounds  += [np.clip(np.floor((hi+self.EPSILON)/cellsize).astype(int),0,n-1)]
+            (colLo,colHi,rowLo,rowHi) = bounds
+            block        = np.stack([
+                rowLo*self._numCols+colLo,
+                rowLo*self._numCols+colHi,
+                rowHi*self._numCols+colLo,
+                rowHi*self._numCols+colHi,
+            ],axis=1)
+
+            # each cell once per piece, and not again if the previous piece of the same trajectory touched it
+            keep         = np.ones(block.shape,dtype=bool)
+            keep[:,1]    = colHi!=colLo
+            keep[:,2]    = rowHi!=rowLo
+            keep[:,3]    = keep[:,1] & keep[:,2]
+            seen         = np.zeros((len(block)-1,4),dtype=bool)
+            for j in range(4):
+                seen    |= block[1:]==block[:-1,j:j+1]
+            keep[1:]    &= ~(seen & (owner[1:]==owner[:-1])[:,None])
+            cell         = block[keep]
+            owner        = np.repeat(owner,keep.sum(axis=1))
+
+            # the obstacles in those cells
+            numObstacles = self._cellStarts[cell+1]-self._cellStarts[cell]
+            pairs        = np.repeat(owner,numObstacles)
+            idx          = (
+                np.repeat(self._cellStarts[cell],numObstacles)+
+                np.arange(numObstacles.sum())-np.repeat(np.cumsum(numObstacles)-numObstacles,numObstacles)
+            )
+            obstacles    = self._obstacles[self._cellObstacles[idx]]
+
+            # bumps, keep the earliest
+            (u1,hit)     = self._liangBarsky(x[pairs],y[pairs],deltax[pairs],deltay[pairs],obstacles)
+            pairs        = pairs[hit]
+            u1           = u1[hit]
+            np.minimum.at(bump_u1,pairs,u1)
+
+            # done with the DotBots which bump before the end of the searched portion, or reached the frame
+            covered[active] = end
+            done         = (end>=dist[active]) | (bump_u1[active]*dist[active]<end-self.EPSILON)
+            active       = active[~done]
+            roundlength *= 2
+
+        # the earliest bumps, as DotBot._computeNextBump(); its distances never decrease with u1, so the earliest bump
+        # of a DotBot is the one with the smallest u1
+        (xs,ys,ts,s)     = (x.tolist(),y.tolist(),posTs.tolist(),speed.tolist())
+        (dxs,dys)        = (deltax.tolist(),deltay.tolist())
+        for i in np.flatnonzero(np.isfinite(bump_u1)).tolist():
+            (rx,ry,t)    = (xs[i],ys[i],float(bump_u1[i]))
+            tso          = ts[i]+u.distance((rx,ry),(rx+t*dxs[i],ry+t*dys[i]))/s[i]
+            if tso<=returnVal[i]:
+                returnVal[i] = tso
+
+        return returnVal
+
+    def _liangBarsky(self,rx,ry,deltax,deltay,obstacles):
+        '''
+        Vectorized version of the Liang-Barsky algorithm in DotBot._computeNextBumpObstacle().
+
+        \return (u1,hit), u1 the position along the trajectory where the DotBot bumps into the obstacle, if hit
+        '''
+
+        (ax,ay,bx,by)    = obstacles.T
+
+        u1               = np.full(len(rx),-np.inf)
+        u2               = np.full(len(rx), np.inf)
+        outside          = np.zeros(len(rx),dtype=bool)
+
+        #                   left      right    bottom       top
+        for (p,q) in [(-deltax,rx-ax),(deltax,bx-rx),(-deltay,ry-ay),(deltay,by-ry)]:
+
+            # line parallel to and outside boundary
+            outside     |= (p==0) & (q<0)
+
+            with np.errstate(divide='ignore',invalid='ignore'):
+                t        = q/p
+            u1           = np.where((p<0) & (t>u1),t,u1)
+            u2           = np.where((p>0) & (t<u2),t,u2)
+
+        return (u1,(~outside) & (u1>=0) & (u1<=u2) & (u2<=1))
+
+    def _round3(self,v):
+        '''
+        \return v rounded to 3 decimals, as Python's round(), which NumPy only differs from on halfway values
+        '''
+        returnVal        = np.round(v,3)
+        with np.errstate(invalid='ignore'):
+            halfway      = np.abs(v*1000-np.floor(v*1000)-0.5)<1e-6
+        for i in np.flatnonzero(halfway).tolist():
+            returnVal[i] = round(float(v[i]),3)
+        return returnVal
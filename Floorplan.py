@@ -1,4 +1,5 @@
 # built-in
+import math
 # third-party
 # local
 
@@ -7,10 +8,22 @@ class Floorplan(object):
     The floorplan the DotBots move in.
     '''
     
-    def __init__(self,drawing):
+    CELLSIZE = 1 # m, side of a cell of the obstacle index
     
+    def __init__(self,drawing,indexObstacles=True,mergeObstacles=False):
+        '''
+        If mergeObstacles is True, adjacent obstacle characters are merged into larger rectangles.
+        '''
+    
+        # store params
+        self.indexObstacles  = indexObstacles
+        self.mergeObstacles  = mergeObstacles
+        
         # local variables
         (self.width,self.height,self.obstacles) = self._parseDrawing(drawing)
+        self._numCols        = max(1,math.ceil(self.width/self.CELLSIZE))
+        self._numRows        = max(1,math.ceil(self.height/self.CELLSIZE))
+        self._obstacleIndex  = self._buildObstacleIndex() # (col,row) -> indices of the obstacles touching that cell
     
     #======================== public ==========================================
     
@@ -21,15 +34,162 @@ class Floorplan(object):
             'obstacles': self.obstacles,
         }
     
+    def obstaclesAlong(self,x0,y0,x1,y1):
+        '''
+        Walk through the cells of the obstacle index crossed by segment (x0,y0)->(x1,y1), starting at (x0,y0)
+        (Amanatides-Woo grid traversal).
+        
+        Yields (u,obstacle) tuples, u being the position along the segment (0 at (x0,y0), 1 at (x1,y1)) where it
+        enters the cell the obstacle was found in. u never decreases, each obstacle is yielded at most once.
+        Obstacles are indexed in every cell they touch (borders included), so any obstacle the segment touches at
+        position u is yielded with a u'<=u.
+        
+        If indexObstacles is False, yields all obstacles, with u=0.
+        '''
+        
+        if not self.indexObstacles:
+            for obstacle in self.obstacles:
+                yield (0,obstacle)
+            return
+        
+        # shorthand
+        index            = self._obstacleIndex
+        obstacles        = self.obstacles
+        cellsize         = self.CELLSIZE
+        
+        # cell the segment starts in
+        col              = min(max(int(math.floor(x0/cellsize)),0),self._numCols-1)
+        row              = min(max(int(math.floor(y0/cellsize)),0),self._numRows-1)
+        
+        # position along the segment where it crosses the next vertical/horizontal cell border
+        dx               = x1-x0
+        dy               = y1-y0
+        if   dx>0:
+            stepCol      = 1
+            uNextCol     = ((col+1)*cellsize-x0)/dx
+            uDeltaCol    = cellsize/dx
+        elif dx<0:
+            stepCol      = -1
+            uNextCol     = (col*cellsize-x0)/dx
+            uDeltaCol    = -cellsize/dx
+        else:
+            stepCol      = 0
+            uNextCol     = math.inf
+            uDeltaCol    = math.inf
+        if   dy>0:
+            stepRow      = 1
+            uNextRow     = ((row+1)*cellsize-y0)/dy
+            uDeltaRow    = cellsize/dy
+        elif dy<0:
+            stepRow      = -1
+            uNextRow     = (row*cellsize-y0)/dy
+            uDeltaRow    = -cellsize/dy
+        else:
+            stepRow      = 0
+            uNextRow     = math.inf
+            uDeltaRow    = math.inf
+        
+        # walk
+        seen             = set()
+        u                = 0
+        while True:
+            
+            # yield the obstacles in this cell
+            for idx in index.get((col,row),()):
+                if idx not in seen:
+                    seen.add(idx)
+                    yield (u,obstacles[idx])
+            
+            # move to next cell
+            if uNextCol<uNextRow:
+                u         = uNextCol
+                col      += stepCol
+                uNextCol += uDeltaCol
+            else:
+                u         = uNextRow
+                row      += stepRow
+                uNextRow += uDeltaRow
+            
+            # stop at end of segment or when leaving the floorplan
+            if u>1:
+                break
+            if col<0 or col>=self._numCols or row<0 or row>=self._numRows:
+                break
+    
+    def obstacleIndex(self):
+        '''
+        \return (numCols,numRows,index) of the obstacle index walked by obstaclesAlong(), index mapping (col,row) to
+        the indices (in obstacles) of the obstacles touching that cell, None if indexObstacles is False.
+        '''
+        if not self.indexObstacles:
+            return None
+        return (self._numCols,self._numRows,self._obstacleIndex)
+    
     #======================== private =========================================
     
     def _parseDrawing(self,drawing):
         lines     = [line for line in drawing.splitlines() if line]
         width     = max([len(line) for line in lines])
         height    = len(lines)
+        if self.mergeObstacles:
+            obstacles = self._mergeObstacles(lines)
+        else:
+            obstacles = []
+            for (y,line) in enumerate(lines):
+                for (x,c) in enumerate(line):
+                    if c=='#':
+                        obstacles += [{'x': x, 'y':  y, 'width': 1, 'height': 1}]
+        return (width,height,obstacles)
+    
+    def _mergeObstacles(self,lines):
+        '''
+        Cover the obstacle characters of the drawing with (near-minimal) non-overlapping rectangles.
+        
+        Greedy: in reading order, each character not yet covered starts a rectangle, which is first extended as far
+        as possible to the right, then as far as possible downwards (as long as the full width is free obstacle).
+        '''
+        
+        # free[y][x] is True for obstacle characters not covered by a rectangle yet
+        free      = [[c=='#' for c in line] for line in lines]
+        
+        def isFree(x,y):
+            return y<len(free) and x<len(free[y]) and free[y][x]
+        
         obstacles = []
-        for (y,line) in enumerate(lines):
-            for (x,c) in enumerate(line):
-                if c=='#':
-                    obstacles += [{'x': x, 'y':  y, 'width': 1, 'height': 1}]
-        return (width,height,obstacles)
\ No newline at end of file
+        for y in range(len(free)):
+            for x in range(len(free[y])):
+                if not free[y][x]:
+                    continue
+                
+                # extend to the right
+                w  = 1
+                while isFree(x+w,y):
+                    w += 1
+                
+                # extend downwards
+                h  = 1
+                while all(isFree(x+i,y+h) for i in range(w)):
+                    h += 1
+                
+                # mark as covered
+                for j in range(h):
+                    for i in range(w):
+                        free[y+j][x+i] = False
+                
+                obstacles += [{'x': x, 'y':  y, 'width': w, 'height': h}]
+        return obstacles
+    
+    def _buildObstacleIndex(self):
+        index     = {}
+        for (idx,obstacle) in enumerate(self.obstacles):
+            
+            # all cells whose (closed) square touches the (closed) obstacle
+            minCol = max(int(math.ceil( obstacle['x']                      /self.CELLSIZE))-1,0)
+            maxCol = min(int(math.floor((obstacle['x']+obstacle['width'])  /self.CELLSIZE)),  self._numCols-1)
+            minRow = max(int(math.ceil( obstacle['y']                      /self.CELLSIZE))-1,0)
+            maxRow = min(int(math.floor((obstacle['y']+obstacle['height']) /self.CELLSIZE)),  self._numRows-1)
+            
+            for col in range(minCol,maxCol+1):
+                for row in range(minRow,maxRow+1):
+                    index.setdefault((col,row),[]).append(idx)
+        return index
@@ -1,17 +1,87 @@
 # built-in
 import random
 import math
-import threading
-import copy
 import time
+import array
+import copy
 # third-party
+try:
+    import numpy as np
+except ImportError:
+    np = None # getViewPositions() falls back to pure Python
 # local
-import SimEngine
-import Wireless
 import Utils as u
 
-class ExceptionOpenLoop(Exception):
-    pass
+class LineGraph(object):
+    '''
+    The lines of the map, linked when close to one another (see MapBuilder._areLinesClose).
+
+    Close lines are found through a grid hash of the line endpoints, with cells of size MapBuilder.MINFEATURESIZE. The
+    number of lines with a free end is kept up to date as lines are added and removed.
+    '''
+
+    def __init__(self,mapBuilder):
+
+        # store params
+        self.mapBuilder      = mapBuilder
+
+        # local variables
+        self.numOpenLines    = 0    # number of lines with fewer than 2 close lines (i.e. with a free end)
+        self._cellsize       = mapBuilder.MINFEATURESIZE
+        self._grid           = {}   # (col,row) -> set of lines with an endpoint in that cell
+        self._neighbours     = {}   # line -> set of close lines
+
+    #======================== public ==========================================
+
+    def addLine(self,line):
+
+        # find close lines
+        neighbours                   = set()
+        for cell in self._endpointCells(line):
+            (col,row)                = cell
+            for othercell in [(col+i,row+j) for i in [-1,0,1] for j in [-1,0,1]]:
+                for other in self._grid.get(othercell,()):
+                    if self.mapBuilder._areLinesClose(line,other):
+                        neighbours.add(other)
+
+        # register in grid hash
+        for cell in self._endpointCells(line):
+            self._grid.setdefault(cell,set()).add(line)
+
+        # link to close lines
+        self._neighbours[line]       = neighbours
+        if len(neighbours)<2:
+            self.numOpenLines       += 1
+        for other in neighbours:
+            self._neighbours[other].add(line)
+            if len(self._neighbours[other])==2:
+                self.numOpenLines   -= 1
+
+    def removeLine(self,line):
+
+        # unlink from close lines
+        neighbours                   = self._neighbours.pop(line)
+        if len(neighbours)<2:
+            self.numOpenLines       -= 1
+        for other in neighbours:
+            self._neighbours[other].discard(line)
+            if len(self._neighbours[other])==1:
+                self.numOpenLines   += 1
+
+        # unregister from grid hash
+        for cell in self._endpointCells(line):
+            self._grid[cell].discard(line)
+            if not self._grid[cell]:
+                del self._grid[cell]
+
+    #======================== private =========================================
+
+    def _endpointCells(self,line):
+        (lax,lay,lbx,lby)            = line
+        return set([
+            (int(math.floor(lax/self._cellsize)),int(math.floor(lay/self._cellsize))),
+            (int(math.floor(lbx/self._cellsize)),int(math.floor(lby/self._cellsize))),
+        ])
 
 class MapBuilder(object):
     '''
@@ -23,150 +93,286 @@ class MapBuilder(object):
     PERIOD         = 1 # s, in simulated time
     MINFEATURESIZE = 1 # shortest wall, narrowest opening
 
-    def __init__(self):
+    def __init__(self,simEngine,periodic=True):
+        '''
+        If not periodic, the map is only consolidated when consolidate() is called.
+        '''
 
         # store params
+        self.simEngine       = simEngine
 
         # local variables
-        self.simEngine       = SimEngine.SimEngine()
-        self.dataLock        = threading.RLock()
         self.discoMap = {
             'complete': False,    # is the map complete?
-            'dots':     [],       # each bump becomes a dot
-            'lines':    [],       # closeby dots are aggregated into a line
+            'dots':     set(),    # each bump becomes a dot
+            'lines':    set(),    # closeby dots are aggregated into a line
         }
+        self._newDots        = [] # dots notified since the last consolidation
+        self._dotsByRow      = {} # y -> set of x of the dots on that row
+        self._dotsByCol      = {} # x -> set of y of the dots on that column
+        self._linesByRow     = {} # y -> set of horizontal lines on that row
+        self._linesByCol     = {} # x -> set of vertical lines on that column
+        self._lineGraph      = LineGraph(self)
+        self._snapshot       = None
+        self._publishSnapshot()
 
         # schedule first housekeeping activity
-        self.simEngine.schedule(self.simEngine.currentTime()+self.PERIOD,self._houseKeeping)
+        if periodic:
+            self.simEngine.schedule(self.simEngine.currentTime()+self.PERIOD,self._houseKeeping)
 
     #======================== public ==========================================
 
     def notifBump(self,x,y):
 
-        with self.dataLock:
-            self.discoMap['dots'] += [(x,y)]
+        self._newDots += [(x,y)]
+
+    def consolidate(self):
+        '''
+        Add the dots notified since the last consolidation to the map, decide whether it is complete.
+        '''
+
+        # shorthand
+        profiler = self.simEngine.profiler
+
+        # consolidate map
+        if profiler is None:
+            changed = self._consolidateMap()
+        else:
+            (changed,_) = profiler.call('MapBuilder._consolidateMap',self._consolidateMap)
+
+        if changed:
+            # decide whether map completed
+            if profiler is None:
+                self.discoMap['complete'] = self._isMapComplete()
+            else:
+                (self.discoMap['complete'],_) = profiler.call('MapBuilder._isMapComplete',self._isMapComplete)
+
+            # publish for readers in other threads
+            self._publishSnapshot()
 
     def getMap(self):
+        '''
+        \return the latest published snapshot of the map: a dict with keys 'version', 'complete', 'dots' and 'lines'
+        (tuples). The same dict is returned until the map changes. It is shared, do not modify it.
 
-        with self.dataLock:
-            return copy.deepcopy(self.discoMap)
+        Lock-free, safe to call from any thread: snapshots are never modified once published, only replaced.
+        '''
+        return self._snapshot
+
+    def getMapVersion(self):
+        '''
+        \return the version of the latest published snapshot, incremented each time the map changes
+        '''
+        return self._snapshot['version']
+
+    def getCheckpoint(self):
+        '''
+        \return the state of the MapBuilder, as plain data (see Simulation.checkpoint())
+        '''
+        return copy.deepcopy({
+            'mapBuilder':    {k: v for (k,v) in vars(self).items() if k not in ['simEngine','_lineGraph']},
+            'lineGraph':     {k: v for (k,v) in vars(self._lineGraph).items() if k!='mapBuilder'},
+        })
+
+    def setCheckpoint(self,checkpoint):
+        checkpoint           = copy.deepcopy(checkpoint)
+        vars(self).update(checkpoint['mapBuilder'])
+        vars(self._lineGraph).update(checkpoint['lineGraph'])
 
     #======================== private =========================================
 
     def _houseKeeping(self):
 
-        with self.dataLock:
-            # consolidate map
-            self._consolidateMap()
-
-            # decide whether map completed
-            self.discoMap['complete'] = self._isMapComplete()
+        # consolidate map
+        self.consolidate()
 
         # schedule next consolidation activity
         self.simEngine.schedule(self.simEngine.currentTime()+self.PERIOD,self._houseKeeping)
 
-    def _consolidateMap(self):
+    def _publishSnapshot(self):
+        previous           = self._snapshot
+        if previous is None:
+            version        = 0
+        else:
+            version        = previous['version']+1
+        self._snapshot     = {
+            'version':  version,
+            'complete': self.discoMap['complete'],
+            'dots':     tuple(self.discoMap['dots']),
+            'lines':    tuple(self.discoMap['lines']),
+        }
+        if self.simEngine.trace is not None:
+            self._recordSnapshot(previous)
 
-        # result list of lines
-        reslines                             = []
+    def _recordSnapshot(self,previous):
+        '''
+        Record the published snapshot in the trace: its size, and the dots and lines added/removed since previous.
+        '''
 
-        # remove duplicate dots
-        self.discoMap['dots']                = list(set(self.discoMap['dots']))
+        # shorthand
+        trace              = self.simEngine.trace
+        now                = self.simEngine.currentTime()
+        snapshot           = self._snapshot
+
+        trace.record('map',now,snapshot['version'],len(snapshot['dots']),len(snapshot['lines']),snapshot['complete'])
+        for kind in ['dots','lines']:
+            old            = set(previous[kind]) if previous is not None else set()
+            new            = set(snapshot[kind])
+            for (added,elems) in [(True,new-old),(False,old-new)]:
+                for elem in sorted(elems):
+                    if kind=='dots':
+                        elem = elem+(math.nan,math.nan)
+                    trace.record('mapdelta',now,snapshot['version'],added,*elem)
+        if snapshot['complete'] and not (previous is not None and previous['complete']):
+            trace.record('complete',now)
 
-        # horizontal
-        for direction in ['horizontal','vertical']:
+    def _consolidateMap(self):
+        '''
+        Add the dots notified since the last consolidation to the map, and rebuild the lines of the rows and columns
+        they fall on. Rows and columns without new dots are left untouched, as consolidating them again would not
+        change them.
 
-            refs                             = []
-            if direction=='horizontal':
-                refs                        += [y   for (x,y)             in self.discoMap['dots']]               # all dots
-                refs                        += [lay for (lax,lay,lbx,lby) in self.discoMap['lines'] if lay==lby ] # all horizontal lines
-            else:
-                refs                        += [x   for (x,y)             in self.discoMap['dots']]               # all dots
-                refs                        += [lax for (lax,lay,lbx,lby) in self.discoMap['lines'] if lax==lbx ] # all vertical lines
-            refs                             = set(refs)
+        \return True if the map changed
+        '''
 
-            for ref in refs:
+        # add new dots, noting which rows/columns need to be consolidated
+        dirtyRows                            = set()
+        dirtyCols                            = set()
+        for (x,y) in self._newDots:
+            if (x,y) in self.discoMap['dots']:
+                continue
+            self.discoMap['dots'].add((x,y))
+            self._dotsByRow.setdefault(y,set()).add(x)
+            self._dotsByCol.setdefault(x,set()).add(y)
+            dirtyRows.add(y)
+            dirtyCols.add(x)
+        self._newDots                        = []
+
+        # nothing to do if no new dots
+        if not (dirtyRows or dirtyCols):
+            return False
+
+        # rebuild the lines of the dirty rows/columns
+        for ref in dirtyRows:
+            self._consolidateRef('horizontal',ref)
+        for ref in dirtyCols:
+            self._consolidateRef('vertical',ref)
 
-                # select all the dots which are aligned at this ref
-                if direction=='horizontal':
-                    thesedots                = [x for (x,y) in self.discoMap['dots'] if y==ref]
-                else:
-                    thesedots                = [y for (x,y) in self.discoMap['dots'] if x==ref]
+        # remove dots which fall inside a line
+        # Note: dots in other rows/columns were already checked against the (unchanged) lines there
+        for ref in dirtyRows:
+            for x in self._dotsOnLines('horizontal',ref):
+                self._removeDot(x,ref)
+        for ref in dirtyCols:
+            for y in self._dotsOnLines('vertical',ref):
+                self._removeDot(ref,y)
 
-                # select the lines we already know of at this ref
-                if direction=='horizontal':
-                    theselines               = [(lax,lay,lbx,lby) for (lax,lay,lbx,lby) in self.discoMap['lines'] if lay==ref and lby==ref]
-                else:
-                    theselines               = [(lax,lay,lbx,lby) for (lax,lay,lbx,lby) in self.discoMap['lines'] if lax==ref and lbx==ref]
+        return True
 
-                # remove dots which fall inside a line
-                if direction=='horizontal':
-                    thesedots                = [x for (x,y) in self._removeDotsOnLines([(x,ref) for x in thesedots] ,theselines)]
-                else:
-                    thesedots                = [y for (x,y) in self._removeDotsOnLines([(ref,y) for y in thesedots] ,theselines)]
+    def _consolidateRef(self,direction,ref):
+        '''
+        Rebuild the lines of a row (direction 'horizontal') or column (direction 'vertical') from its dots and lines.
+        '''
 
-                # add vertices of all lines to the dots
-                for (lax,lay,lbx,lby) in theselines:
-                    if direction=='horizontal':
-                        thesedots           += [lax]
-                        thesedots           += [lbx]
-                    else:
-                        thesedots           += [lay]
-                        thesedots           += [lby]
+        # select all the dots which are aligned at this ref
+        if direction=='horizontal':
+            thesedots                = list(self._dotsByRow.get(ref,[]))
+        else:
+            thesedots                = list(self._dotsByCol.get(ref,[]))
 
-                # remove duplicates (in case dot falls on vertice of existing line)
-                thesedots                    = list(set(thesedots))
+        # select the lines we already know of at this ref
+        if direction=='horizontal':
+            oldlines                 = self._linesByRow.get(ref,set())
+        else:
+            oldlines                 = self._linesByCol.get(ref,set())
+        theselines                   = list(oldlines)
 
-                # sort dots by increasing value
-                thesedots                    = sorted(thesedots)
+        # remove dots which fall inside a line
+        if direction=='horizontal':
+            thesedots                = [x for (x,y) in self._removeDotsOnLines([(x,ref) for x in thesedots] ,theselines)]
+        else:
+            thesedots                = [y for (x,y) in self._removeDotsOnLines([(ref,y) for y in thesedots] ,theselines)]
 
-                # create line between close dots
-                for (idx,v) in enumerate(thesedots):
-                    if idx==len(thesedots)-1:
-                        continue
-                    vnext                    = thesedots[idx+1]
+        # add vertices of all lines to the dots
+        for (lax,lay,lbx,lby) in theselines:
+            if direction=='horizontal':
+                thesedots           += [lax]
+                thesedots           += [lbx]
+            else:
+                thesedots           += [lay]
+                thesedots           += [lby]
 
-                    if vnext-v<=self.MINFEATURESIZE:
+        # remove duplicates (in case dot falls on vertice of existing line)
+        thesedots                    = list(set(thesedots))
 
-                        if direction=='horizontal':
-                            theselines      += [(v,ref,vnext,ref)]
-                        else:
-                            theselines      += [(ref,v,ref,vnext)]
+        # sort dots by increasing value
+        thesedots                    = sorted(thesedots)
 
-                # remove line duplicates (caused by short lines which turn into close points)
-                theselines                   = list(set(theselines))
+        # create line between close dots
+        for (idx,v) in enumerate(thesedots):
+            if idx==len(thesedots)-1:
+                continue
+            vnext                    = thesedots[idx+1]
+
+            if vnext-v<=self.MINFEATURESIZE:
 
-                # join the lines that touch
                 if direction=='horizontal':
-                    theselines = sorted(theselines,key = lambda l: l[0])
+                    theselines      += [(v,ref,vnext,ref)]
                 else:
-                    theselines = sorted(theselines,key = lambda l: l[1])
-                idx = 0
-                while idx<len(theselines)-1:
-                    (lax,lay,lbx,lby)        = theselines[idx]
-                    (nax,nay,nbx,nby)        = theselines[idx+1]
-                    if direction=='horizontal':
-                        condition            = (lbx==nax)
-                    else:
-                        condition            = (lby==nay)
-                    if condition:
-                        theselines[idx]      = (lax,lay,nbx,nby)
-                        theselines.pop(idx+1)
-                    else:
-                        idx                 += 1
-
-                # store
-                reslines                    += theselines
-
-        # store
-        self.discoMap['lines']               = reslines
+                    theselines      += [(ref,v,ref,vnext)]
 
-        # remove duplicate dots
-        self.discoMap['dots']                = list(set(self.discoMap['dots']))
+        # remove line duplicates (caused by short lines which turn into close points)
+        theselines                   = list(set(theselines))
 
-        # remove dots which fall inside a line
-        self.discoMap['dots']                = self._removeDotsOnLines(self.discoMap['dots'],self.discoMap['lines'])
+        # join the lines that touch
+        if direction=='horizontal':
+            theselines = sorted(theselines,key = lambda l: l[0])
+        else:
+            theselines = sorted(theselines,key = lambda l: l[1])
+        idx = 0
+        while idx<len(theselines)-1:
+            (lax,lay,lbx,lby)        = theselines[idx]
+            (nax,nay,nbx,nby)        = theselines[idx+1]
+            if direction=='horizontal':
+                condition            = (lbx==nax)
+            else:
+                condition            = (lby==nay)
+            if condition:
+                theselines[idx]      = (lax,lay,nbx,nby)
+                theselines.pop(idx+1)
+            else:
+                idx                 += 1
 
+        # store
+        newlines                     = set(theselines)
+        for line in oldlines-newlines:
+            self.discoMap['lines'].discard(line)
+            self._lineGraph.removeLine(line)
+        for line in newlines-oldlines:
+            self.discoMap['lines'].add(line)
+            self._lineGraph.addLine(line)
+        if direction=='horizontal':
+            self._linesByRow[ref]    = newlines
+        else:
+            self._linesByCol[ref]    = newlines
+
+    def _dotsOnLines(self,direction,ref):
+        '''
+        \return the dots of a row (direction 'horizontal') or column (direction 'vertical') which fall on one of its lines
+        '''
+        if direction=='horizontal':
+            values                   = self._dotsByRow.get(ref,set())
+            lines                    = self._linesByRow.get(ref,set())
+            return [x for x in values if any(lax<=x and x<=lbx for (lax,lay,lbx,lby) in lines)]
+        else:
+            values                   = self._dotsByCol.get(ref,set())
+            lines                    = self._linesByCol.get(ref,set())
+            return [y for y in values if any(lay<=y and y<=lby for (lax,lay,lbx,lby) in lines)]
+
+    def _removeDot(self,x,y):
+        self.discoMap['dots'].discard((x,y))
+        self._dotsByRow[y].discard(x)
+        self._dotsByCol[x].discard(y)
 
     def _removeDotsOnLines(self,dots,lines):
         idx = 0
@@ -194,6 +400,10 @@ class MapBuilder(object):
         return dots
 
     def _isMapComplete(self):
+        '''
+        The map is complete when all dots have been turned into lines, and the lines form closed loops: each line is
+        close to at least two other lines (no free end). Each group of connected lines then contains a loop.
+        '''
 
         while True: # "loop" only once
 
@@ -202,47 +412,22 @@ class MapBuilder(object):
                 returnVal = False
                 break
 
-            # keep looping until no more todo lines
-            alllines = copy.deepcopy(self.discoMap['lines'])
-            try:
-
-                while alllines:
-                    loop      = self._walkloop(alllines,alllines[0])
-                    for line in loop:
-                        alllines.remove(line)
+            # map is never complete before the first line is found
+            if not self.discoMap['lines']:
+                returnVal = False
+                break
 
-            except ExceptionOpenLoop:
+            # map is not complete if a line has a free end
+            if self._lineGraph.numOpenLines:
                 returnVal = False
                 break
 
-            # if I get here, map is complete
+            # map is complete
             returnVal = True
             break
 
         return returnVal
 
-    def _walkloop(self,alllines,startline):
-
-        loop  = []
-        loop += [startline]
-        while True:
-            # add close line to loop
-            foundCloseLine = False
-            for line in alllines:
-                if (self._areLinesClose(loop[-1],line)) and (line not in loop):
-                    foundCloseLine = True
-                    loop          += [line]
-                    break
-
-            # abort if no next line to hop to
-            if foundCloseLine==False:
-
-                raise ExceptionOpenLoop()
-            # success! last line in loop is close to first line
-            if len(loop)>2 and self._areLinesClose(loop[-1],loop[0]):
-
-                return loop
-
     def _areLinesClose(self,line1,line2):
 
         (l1ax,l1ay,l1bx,l1by) = line1
@@ -267,31 +452,82 @@ class MapBuilder(object):
 
         return returnVal
 
+class DotBotsView(object):
+    '''
+    The orchestrator's view of the DotBots, stored as one typed array per field (rather than one dict per DotBot).
+    
+    Fields are accessed as view.x[dotBotId]. view[dotBotId] returns a dict copy of the fields of one DotBot.
+    '''
+    
+    FIELDS = ['x','y','posTs','heading','dx','dy','speed','commandId']
+    
+    def __init__(self,positions):
+        
+        # local variables
+        numDotBots           = len(positions)
+        self.x               = array.array('d',[x for (x,y) in positions])
+        self.y               = array.array('d',[y for (x,y) in positions])
+        self.posTs           = array.array('d',[0])*numDotBots # time at which the DotBot was at (x,y)
+        self.heading         = array.array('d',[0])*numDotBots
+        self.dx              = array.array('d',[math.cos(math.radians(-90))])*numDotBots # unit vector of the heading, updated with it
+        self.dy              = array.array('d',[math.sin(math.radians(-90))])*numDotBots
+        self.speed           = array.array('d',[0])*numDotBots
+        self.commandId       = array.array('q',[0])*numDotBots
+    
+    def __len__(self):
+        return len(self.x)
+    
+    def __getitem__(self,dotBotId):
+        return {field: getattr(self,field)[dotBotId] for field in self.FIELDS}
+
 class Orchestrator(object):
     '''
     The central orchestrator of the expedition.
     '''
 
-    def __init__(self,positions,floorplan):
+    def __init__(self,positions,floorplan,simEngine,wireless,headings=None,turns=None,cycle=None,rng=None):
+        '''
+        rng is the random.Random instance the headings are drawn from, None for the global random module.
+
+        headings lists the headings the DotBots can be commanded (e.g. Protocol.HEADINGS), None for any integer heading.
+        turns, if set, tells when the DotBots turn by themselves, and to which heading (e.g. Protocol.nextTurn): the
+        orchestrator follows those turns to locate bumps. None for DotBots which only change heading when commanded.
+
+        If cycle is set, the orchestrator works in slots (see PROTOCOL.md): every cycle seconds, it handles the bumps
+        reported during the cycle, consolidates the map, and broadcasts one downstream frame. Otherwise, it reacts to
+        each bump as it is reported.
+        '''
 
         # store params
         self.positions         = positions
         self.floorplan         = floorplan
+        self.simEngine         = simEngine
+        self.wireless          = wireless
+        self.headings          = headings
+        self.turns             = turns
+        self.cycle             = cycle
+        self.rng               = random if rng is None else rng
 
         # local variables
-        self.simEngine         = SimEngine.SimEngine()
-        self.wireless          = Wireless.Wireless()
-        self.dotbotsview       = [ # the Orchestrator's internal view of the DotBots
+        self.dotbotsview       = DotBotsView(self.positions) # the Orchestrator's internal view of the DotBots
+        self.downstreamFrame   = [ # the commands for all DotBots, as broadcast, updated in place
             {
-                'x':           x,
-                'y':           y,
-                'posTs':       0,
-                'heading':     0,
-                'speed':       0,
-                'commandId':   0,
-            } for (x,y) in self.positions
+                'commandId':   self.dotbotsview.commandId[dotBotId],
+                'heading':     self.dotbotsview.heading[dotBotId],
+                'speed':       self.dotbotsview.speed[dotBotId],
+            } for dotBotId in range(len(self.dotbotsview))
         ]
-        self.mapBuilder        = MapBuilder()
+        self.changedCommands   = [] # dotBotIds whose command changed since the last downstream frame
+        self.reportedBumps     = [] # bumps reported during the current cycle (slotted only)
+        self.mapBuilder        = MapBuilder(self.simEngine,periodic=(cycle is None))
+
+        # send the commands which changed once all events at the same time have been handled
+        # Note: several DotBots bumping at the same time hence get their commands in one frame
+        self.simEngine.subscribeBatchEnd(self._sendDownstreamCommands)
+
+        # schedule first cycle
+        if self.cycle is not None:
+            self.simEngine.schedule(self.simEngine.currentTime()+self.cycle,self._endOfCycle)
 
     #======================== public ==========================================
 
@@ -299,76 +535,206 @@ class Orchestrator(object):
         '''
         Simulation engine, start exploring
         '''
-        for dotbot in self.dotbotsview:
-            dotbot['heading'] = random.randint(0,359)
-            dotbot['speed']   = 1
-
-        self._sendDownstreamCommands()
+        for dotBotId in range(len(self.dotbotsview)):
+            self._setHeading(dotBotId,self._pickHeading())
+            self.dotbotsview.speed[dotBotId] = 1
+            self._updateCommand(dotBotId)
 
     def fromDotBot(self,msg):
         '''
         A DotBot indicates its bump sensor was activated at a certain time
         '''
-        
+
+        if self.cycle is not None:
+            # handled at the end of the cycle
+            self.reportedBumps += [msg]
+        else:
+            self._handleBump(msg)
+
+    def getView(self):
+
+        (xs,ys)     = self.getViewPositions()
+
+        return {
+            'dotbots': [
+                {
+                    'x': x,
+                    'y': y,
+                } for (x,y) in zip(xs,ys)
+            ],
+            'discomap': self.mapBuilder.getMap(),
+        }
+
+    def getViewPositions(self):
+        '''
+        \return (xs,ys), where the orchestrator thinks the DotBots are now (lists of floats)
+
+        Vectorized over the swarm if numpy is available.
+        '''
+
+        # do NOT write back any results to the DotBot's state as race condition possible
+
         # shorthand
-        dotbot               = self.dotbotsview[msg['dotBotId']]
-        
+        now         = self.simEngine.currentTime()
+        view        = self.dotbotsview
+
+        # compute updated position
+        if np is not None:
+            x       = np.frombuffer(view.x,    dtype=float)
+            y       = np.frombuffer(view.y,    dtype=float)
+            elapsed = now-np.frombuffer(view.posTs,dtype=float)
+            speed   = np.frombuffer(view.speed,dtype=float)
+            xs      = (x+elapsed*np.frombuffer(view.dx,dtype=float)*speed).tolist()
+            ys      = (y+elapsed*np.frombuffer(view.dy,dtype=float)*speed).tolist()
+        else:
+            xs      = [x+(now-posTs)*dx*speed for (x,posTs,dx,speed) in zip(view.x,view.posTs,view.dx,view.speed)]
+            ys      = [y+(now-posTs)*dy*speed for (y,posTs,dy,speed) in zip(view.y,view.posTs,view.dy,view.speed)]
+
+        return (xs,ys)
+
+    def getCheckpoint(self):
+        '''
+        \return the state of the orchestrator, map included, as plain data (see Simulation.checkpoint())
+        '''
+        return {
+            'dotbotsview':       {field: getattr(self.dotbotsview,field)[:] for field in self.dotbotsview.FIELDS},
+            'downstreamFrame':   copy.deepcopy(self.downstreamFrame),
+            'changedCommands':   list(self.changedCommands),
+            'reportedBumps':     copy.deepcopy(self.reportedBumps),
+            'rng':               self.rng.getstate() if isinstance(self.rng,random.Random) else None,
+            'mapBuilder':        self.mapBuilder.getCheckpoint(),
+        }
+
+    def setCheckpoint(self,checkpoint):
+        for (field,column) in checkpoint['dotbotsview'].items():
+            getattr(self.dotbotsview,field)[:] = column
+        self.downstreamFrame[:]                = copy.deepcopy(checkpoint['downstreamFrame']) # in place, the wireless medium holds it
+        self.changedCommands                   = list(checkpoint['changedCommands'])
+        self.reportedBumps                     = copy.deepcopy(checkpoint['reportedBumps'])
+        if checkpoint['rng'] is not None:
+            self.rng.setstate(checkpoint['rng'])
+        self.mapBuilder.setCheckpoint(checkpoint['mapBuilder'])
+
+    #======================== private =========================================
+
+    def _endOfCycle(self):
+        '''
+        Slotted only: handle the bumps reported during the cycle, consolidate the map, send the commands.
+        '''
+
+        for msg in self.reportedBumps:
+            self._handleBump(msg)
+        self.reportedBumps   = []
+
+        self.mapBuilder.consolidate()
+
+        # one frame per cycle, even if no command changed (DotBots which missed a command get it again)
+        self._sendDownstreamCommands(always=True)
+
+        # schedule next cycle
+        self.simEngine.schedule(self.simEngine.currentTime()+self.cycle,self._endOfCycle)
+
+    def _handleBump(self,msg):
+        '''
+        Locate the obstacle a DotBot bumped into, and send it in a new direction.
+        '''
+
+        # shorthand
+        view                 = self.dotbotsview
+        dotBotId             = msg['dotBotId']
+        startTs              = msg['startTs']
+        bumpTs               = msg['bumpTs']
+        (x,y)                = (view.x[dotBotId],view.y[dotBotId])
+        (dx,dy)              = (view.dx[dotBotId],view.dy[dotBotId])
+        speed                = view.speed[dotBotId]
+
+        # follow the turns the DotBot took by itself, rounded as the DotBot does (see DotBot._turn)
+        # Note: the DotBot started moving when it received its command, which is later than when it was sent if the
+        #       command got lost
+        if self.turns is not None:
+            heading          = view.heading[dotBotId]
+            while True:
+                (turnTs,heading) = self.turns(dotBotId,startTs,heading)
+                if turnTs>=bumpTs:
+                    break
+                x            = round(x+(turnTs-startTs)*dx*speed,3)
+                y            = round(y+(turnTs-startTs)*dy*speed,3)
+                dx           = math.cos(math.radians(heading-90))
+                dy           = math.sin(math.radians(heading-90))
+                startTs      = turnTs
+
         # compute new theoretical position
-        dotbot['x']         += (msg['bumpTs']-dotbot['posTs'])*math.cos(math.radians(dotbot['heading']-90))*dotbot['speed']
-        dotbot['y']         += (msg['bumpTs']-dotbot['posTs'])*math.sin(math.radians(dotbot['heading']-90))*dotbot['speed']
-        dotbot['posTs']      = msg['bumpTs']
+        x                    = x+(bumpTs-startTs)*dx*speed
+        y                    = y+(bumpTs-startTs)*dy*speed
 
         # round
-        dotbot['x']          = round(dotbot['x'],3)
-        dotbot['y']          = round(dotbot['y'],3)
+        view.x[dotBotId]     = round(x,3)
+        view.y[dotBotId]     = round(y,3)
+
+        # the DotBot waits for its next command, which starts now
+        # Note: later than bumpTs if the report got lost
+        view.posTs[dotBotId] = self.simEngine.currentTime()
 
         # notify the self.mapBuilder the obstacle location
-        self.mapBuilder.notifBump(dotbot['x'],dotbot['y'])
+        self.mapBuilder.notifBump(view.x[dotBotId],view.y[dotBotId])
 
         # adjust the heading of the DotBot which bumped (avoid immediately bumping into the same wall)
-        dotbot['heading']    = random.randint(  0,359)
+        # Note: with packed frames, the DotBot discards the heading it last received as a duplicate
+        self._setHeading(dotBotId,self._pickHeading(exclude=view.heading[dotBotId]))
 
         # set the DotBot's speed
-        dotbot['speed']      = 1
+        view.speed[dotBotId] = 1
 
         # bump command Id so DotBot knows this is not a duplicate command
-        dotbot['commandId'] += 1
+        view.commandId[dotBotId] += 1
+        self._updateCommand(dotBotId)
 
-        # send commands to the robots
-        self._sendDownstreamCommands()
+    def _setHeading(self,dotBotId,heading):
+        view                   = self.dotbotsview # shorthand
+        view.heading[dotBotId] = heading
+        view.dx[dotBotId]      = math.cos(math.radians(heading-90))
+        view.dy[dotBotId]      = math.sin(math.radians(heading-90))
 
-    def getView(self):
+    def _pickHeading(self,exclude=None):
+        if self.headings is None:
+            return self.rng.randint(0,359)
+        return self.rng.choice([heading for heading in self.headings if heading!=exclude])
 
-        # do NOT write back any results to the DotBot's state as race condition possible
+    def _updateCommand(self,dotBotId):
+        '''
+        Copy the command of a DotBot into the downstream frame.
+        '''
 
-        # compute updated position
-        now         = self.simEngine.currentTime() # shorthand
+        # shorthand
+        view                 = self.dotbotsview
+        command              = self.downstreamFrame[dotBotId]
 
-        return {
-            'dotbots': [
-                {
-                    'x': db['x']+(now-db['posTs'])*math.cos(math.radians(db['heading']-90))*db['speed'],
-                    'y': db['y']+(now-db['posTs'])*math.sin(math.radians(db['heading']-90))*db['speed'],
-                } for db in self.dotbotsview
-            ],
-            'discomap': self.mapBuilder.getMap(),
-        }
+        command['commandId'] = view.commandId[dotBotId]
+        command['heading']   = view.heading[dotBotId]
+        command['speed']     = view.speed[dotBotId]
 
-    #======================== private =========================================
+        self.changedCommands += [dotBotId]
 
-    def _sendDownstreamCommands(self):
+        # record
+        trace                = self.simEngine.trace
+        if trace is not None:
+            trace.record(
+                'command',
+                self.simEngine.currentTime(),dotBotId,command['commandId'],command['heading'],command['speed'],
+                view.x[dotBotId],view.y[dotBotId],view.posTs[dotBotId],
+            )
+
+    def _sendDownstreamCommands(self,always=False):
         '''
-        Send the next heading and speed commands to the robots
+        Send the next heading and speed commands to the robots, if any changed (or always)
         '''
 
-        # format msg
-        msg = [
-            {
-                'commandId': dotbot['commandId'],
-                'heading':   dotbot['heading'],
-                'speed':     dotbot['speed'],
-            } for dotbot in self.dotbotsview
-        ]
+        if not (self.changedCommands or always):
+            return
 
         # hand over to wireless
-        self.wireless.toDotBots(msg)
+        # Note: frame contains the commands for all DotBots, changedCommands indicates which ones are new
+        self.wireless.toDotBots(self.downstreamFrame,self.changedCommands)
+
+        # new frame starts
+        self.changedCommands = []
@@ -0,0 +1,178 @@
+# built-in
+import struct
+import math
+import random
+# third-party
+# local
+
+# Encoding of the frames exchanged over the air, see PROTOCOL.md.
+#
+# Downstream, the orchestrator broadcasts the commands of all DotBots, 4 bits per DotBot (2 DotBots per byte, even
+# dotBotId in the high nibble). A command is one of 8 headings (N, NE, E, SE, S, SW, W, NW) at full speed, or stop.
+# A frame carries at most MAXFRAMELEN bytes, i.e. the commands of ROBOTSPERFRAME DotBots: larger swarms need several
+# frames, the commands of DotBot i being in frame i//ROBOTSPERFRAME.
+#
+# Upstream, a DotBot reports a bump in a 160-bit frame, its dotBotId being the source address in the header. The 4 data
+# bytes tell, in ms, how long before sending the frame it bumped, and how long it moved (since it received its
+# command) before it bumped: the orchestrator gets both timestamps back from the time it receives the frame, for any
+# report up to 65.535 s old, after a move of up to 65.535 s. The orchestrator dead-reckons where the DotBot bumped from these timestamps, and must find
+# exactly the position the DotBot is at, as the map matches the rows and columns of bumps exactly: the DotBots start
+# and stop moving on the ms ticks of their clock (see quantize()), which the timestamps then carry exactly.
+#
+# With the 8 headings, DotBots which only change heading when they bump keep bumping into the same few positions (a
+# lattice starting at the initial position), and the map never completes. With selfTurns (a simSetting, off by
+# default), a moving DotBot also turns by itself, when and to where nextTurn() says. The orchestrator draws the same
+# turns again from the timestamps of the report. See PROTOCOL.md.
+
+#======================== downstream ==========================================
+
+HEADINGS           = [0,45,90,135,180,225,270,315] # code i is heading HEADINGS[i], 0 being North
+STOP               = 8                             # code "same position"
+SPEED              = 1                             # m/s, speed of a DotBot which is not stopped
+MAXFRAMELEN        = 255                           # bytes
+ROBOTSPERFRAME     = 2*MAXFRAMELEN
+NUMRETRANSMISSIONS = 5                             # each downstream frame is transmitted 5 times (constructive interference)
+
+def encodeCommand(heading,speed):
+    '''
+    \return the 4-bit code of a command
+    '''
+    if speed==0:
+        return STOP
+    assert speed==SPEED
+    return HEADINGS.index(heading)
+
+def decodeCommand(code):
+    '''
+    \return the (heading,speed) of a 4-bit code
+    '''
+    if code==STOP:
+        return (0,0)
+    return (HEADINGS[code],SPEED)
+
+def newDownstreamBuffer(numDotBots):
+    '''
+    \return the (concatenated) payload of the downstream frames, all DotBots stopped
+    '''
+    return bytearray([(STOP<<4)|STOP]*((numDotBots+1)//2))
+
+def setCommand(buf,dotBotId,code):
+    '''
+    Write the 4-bit code of a DotBot in the downstream buffer, in place.
+    '''
+    (i,odd)     = divmod(dotBotId,2)
+    if odd:
+        buf[i]  = (buf[i]&0xf0)|code
+    else:
+        buf[i]  = (buf[i]&0x0f)|(code<<4)
+
+def getCommand(buf,dotBotId):
+    '''
+    \return the 4-bit code of a DotBot in the downstream buffer
+    '''
+    (i,odd)     = divmod(dotBotId,2)
+    if odd:
+        return buf[i]&0x0f
+    return buf[i]>>4
+
+def encodeDownstream(commands):
+    '''
+    \return the list of downstream frames (bytes) carrying commands, a list of dicts with keys 'heading' and 'speed'
+    '''
+    buf         = newDownstreamBuffer(len(commands))
+    for (dotBotId,command) in enumerate(commands):
+        setCommand(buf,dotBotId,encodeCommand(command['heading'],command['speed']))
+    return splitDownstream(buf)
+
+def splitDownstream(buf):
+    return [bytes(buf[i:i+MAXFRAMELEN]) for i in range(0,len(buf),MAXFRAMELEN)]
+
+class DownstreamFrames(object):
+    '''
+    The downstream frames, as heard by the DotBots.
+
+    Indexing by dotBotId decodes the command of that DotBot, in the same format as the orchestrator's frame, except that
+    commandId is None: the 4-bit code has no room for it.
+    '''
+
+    def __init__(self,frames):
+
+        # store params
+        self.frames     = frames
+
+    def __getitem__(self,dotBotId):
+        (frameIdx,pos)  = divmod(dotBotId,ROBOTSPERFRAME)
+        (heading,speed) = decodeCommand(getCommand(self.frames[frameIdx],pos))
+        return {
+            'commandId': None,
+            'heading':   heading,
+            'speed':     speed,
+        }
+
+#======================== upstream ============================================
+
+TICKS              = 1000                     # ticks per second of the DotBot clock, the resolution of upstream timestamps
+UPSTREAMHEADER     = '<I12x'                  # source address (the dotBotId), rest of the header and CRC
+UPSTREAMDATA       = 'HH'                     # ms since the bump, ms the DotBot moved before it bumped
+UPSTREAMFRAME      = struct.Struct(UPSTREAMHEADER+UPSTREAMDATA)
+UPSTREAMFRAMELEN   = UPSTREAMFRAME.size       # 20 bytes
+UPSTREAMDATALEN    = struct.calcsize('<'+UPSTREAMDATA) # 4 bytes
+UPSTREAMSLOT       = 0.002                    # s, one DotBot reports at a time, 2 ms per DotBot
+
+def quantize(ts):
+    '''
+    \return ts (s) on the ticks of the DotBot clock
+
+    Upstream timestamps on the ticks decode to exactly the same floats.
+    '''
+    return round(ts*TICKS)/TICKS
+
+def encodeUpstream(msg,now):
+    '''
+    \return the frame reporting msg, sent at now (s)
+
+    Raises struct.error if the bump is more than 65.535 s before now, or the move which led to it longer.
+    '''
+    bumpTicks  = round(msg['bumpTs']*TICKS)
+    return UPSTREAMFRAME.pack(msg['dotBotId'],round(now*TICKS)-bumpTicks,bumpTicks-round(msg['startTs']*TICKS))
+
+def decodeUpstream(frame,now):
+    '''
+    \return the msg frame reports, received at now (s), the time it was sent at
+    '''
+    (dotBotId,sinceBump,moved) = UPSTREAMFRAME.unpack(frame)
+    bumpTicks  = round(now*TICKS)-sinceBump
+    startTicks = bumpTicks-moved
+    return {
+        'dotBotId':      dotBotId,
+        'startTs':       startTicks/TICKS,
+        'bumpTs':        bumpTicks/TICKS,
+    }
+
+#======================== turns ===============================================
+
+MAXLEG             = 8*TICKS                  # ticks, longest a DotBot moves in one heading before it turns
+
+def nextTurn(dotBotId,startTs,heading):
+    '''
+    \return (turnTs,heading) of the turn of a DotBot which moves in heading since startTs, unless it bumps before
+
+    Drawn from the dotBotId, startTs and heading only: no command needs to get through for the orchestrator to know.
+    '''
+    code        = HEADINGS.index(heading)
+    startTicks  = round(startTs*TICKS)
+    rng         = random.Random((dotBotId<<40)|(startTicks<<3)|code)
+    turnTs      = (startTicks+rng.randint(1,MAXLEG))/TICKS
+    return (turnTs,HEADINGS[(code+rng.randint(1,len(HEADINGS)-1))%len(HEADINGS)])
+
+#======================== airtime =============================================
+
+BITRATE            = 8*UPSTREAMFRAMELEN/UPSTREAMSLOT   # bps, 160 bits in 2 ms
+FRAMEOVERHEAD      = UPSTREAMFRAMELEN-UPSTREAMDATALEN  # bytes per frame which are not data, 16
+
+def downstreamAirtime(numBytes):
+    '''
+    \return the time (s) it takes to broadcast numBytes of commands, all frames and retransmissions included
+    '''
+    numFrames   = math.ceil(numBytes/MAXFRAMELEN)
+    return NUMRETRANSMISSIONS*8*(numBytes+numFrames*FRAMEOVERHEAD)/BITRATE
@@ -0,0 +1,401 @@
+# built-in
+import threading
+import time
+import bisect
+import array
+import math
+# third-party
+# local
+import SimEngine
+import Floorplan
+import DotBot
+import Orchestrator
+import Trace
+
+class Replay(object):
+    '''
+    Replay of a recorded run (see Trace.py), without simulating it again.
+
+    Has the same elements as a Simulation, as far as SimUI is concerned (floorplan, simEngine, dotBots, orchestrator),
+    so the UI serves a replay the same way it serves a live simulation.
+
+    The state (real DotBots, orchestrator's view, map) is rebuilt at any time by replaying the recorded changes from
+    the closest keyframe, a copy of the state taken every KEYFRAMEEVENTS changes (at least one per DotBot, so that
+    keyframes take as much memory as the changes they save replaying).
+    '''
+
+    KEYFRAMEEVENTS = 1000
+    REALFIELDS     = ['x','y','posTs','heading','dx','dy','speed','next_bump_x','next_bump_y','next_bump_ts','trajectoryVersion']
+
+    def __init__(self,tracePath,headless=False):
+        '''
+        In headless mode, no thread is started and the replay is driven by calling seek().
+        '''
+
+        # read the trace
+        with Trace.TraceReader(tracePath) as reader:
+            self.meta        = reader.meta
+            self._events     = {
+                'trajectory':  reader.read('trajectory'),
+                'command':     reader.read('command'),
+                'mapdelta':    reader.read('mapdelta'),
+                'map':         reader.read('map'),
+            }
+        simSetting           = self.meta['simSetting']
+        (x,y)                = simSetting['initialPosition']
+        numDotBots           = simSetting['numDotBots']
+
+        # elements, as in a Simulation
+        self.simSetting      = simSetting
+        self.simEngine       = ReplayEngine(self,headless=headless)
+        self.floorplan       = Floorplan.Floorplan(
+            simSetting['floorplanDrawing'],
+            mergeObstacles   = simSetting.get('mergeObstacles',False),
+        )
+        self.dotBots         = [ReplayDotBot(self,dotBotId) for dotBotId in range(numDotBots)]
+        self.orchestrator    = ReplayOrchestrator(self,[(x,y)]*numDotBots)
+
+        # state at the start of the run
+        self.real            = {field: array.array('d',[math.nan])*numDotBots for field in self.REALFIELDS}
+        self.real['x']       = array.array('d',[x])*numDotBots
+        self.real['y']       = array.array('d',[y])*numDotBots
+        self.real['posTs']   = array.array('d',[0])*numDotBots
+        self.real['heading'] = array.array('d',[0])*numDotBots
+        self.real['dx']      = array.array('d',[math.cos(math.radians(-90))])*numDotBots
+        self.real['dy']      = array.array('d',[math.sin(math.radians(-90))])*numDotBots
+        self.real['speed']   = array.array('d',[0])*numDotBots
+        self.real['trajectoryVersion'] = array.array('d',[0])*numDotBots
+        self.dots            = set()
+        self.lines           = set()
+        self.mapVersion      = 0
+        self.mapComplete     = False
+        self._snapshot       = None  # map as returned by getMap(), rebuilt when the map changes
+        self._now            = 0     # time the state corresponds to
+        self._indexes        = {kind: 0 for kind in self._events} # per kind of event, number of events applied
+        self._initial        = self._keyframe()
+        self.endTs           = max([events['ts'][-1] for events in self._events.values() if len(events['ts'])]+[0])
+
+        # keyframes
+        times                = sorted(self._events['trajectory']['ts']+self._events['command']['ts'])
+        step                 = max(self.KEYFRAMEEVENTS,numDotBots)
+        self._keyframeTimes  = sorted(set(times[step::step]))
+        self._keyframes      = []
+        for ts in self._keyframeTimes:
+            self._applyUntil(ts)
+            self._keyframes += [self._keyframe()]
+        self._restore(self._initial)
+        self.seek(0)
+
+    #======================== public ==========================================
+
+    def seek(self,ts):
+        '''
+        Bring the state to simulated time ts: all the changes at or before ts are applied.
+
+        Moving forward (e.g. playing) applies the changes since the current time, otherwise the state is restored from
+        the last keyframe at or before ts, found by bisection.
+        '''
+        k = bisect.bisect_right(self._keyframeTimes,ts)-1
+        if not (self._now<=ts and (k<0 or self._keyframeTimes[k]<=self._now)):
+            self._restore(self._initial if k<0 else self._keyframes[k])
+        self._applyUntil(ts)
+
+    def currentTime(self):
+        return self._now
+
+    def nextEventTime(self):
+        '''
+        \return the time of the next recorded change, None if there is none
+        '''
+        returnVal = None
+        for (kind,events) in self._events.items():
+            i     = self._indexes[kind]
+            if i<len(events['ts']) and (returnVal is None or events['ts'][i]<returnVal):
+                returnVal = events['ts'][i]
+        return returnVal
+
+    def getMap(self):
+        if self._snapshot is None or self._snapshot['version']!=self.mapVersion:
+            self._snapshot = {
+                'version':  self.mapVersion,
+                'complete': self.mapComplete,
+                'dots':     tuple(self.dots),
+                'lines':    tuple(self.lines),
+            }
+        return self._snapshot
+
+    #======================== private =========================================
+
+    def _applyUntil(self,ts):
+        '''
+        Apply the recorded changes up to ts (included), in the order they were recorded.
+        '''
+
+        # shorthand
+        real                 = self.real
+        view                 = self.orchestrator.dotbotsview
+
+        # real DotBots
+        events               = self._events['trajectory']
+        (start,end)          = (self._indexes['trajectory'],bisect.bisect_right(events['ts'],ts))
+        for i in range(start,end):
+            dotBotId         = events['dotBotId'][i]
+            real['x'][dotBotId]            = events['x'][i]
+            real['y'][dotBotId]            = events['y'][i]
+            real['posTs'][dotBotId]        = events['ts'][i]
+            real['heading'][dotBotId]      = events['heading'][i]
+            real['dx'][dotBotId]           = math.cos(math.radians(events['heading'][i]-90))
+            real['dy'][dotBotId]           = math.sin(math.radians(events['heading'][i]-90))
+            real['speed'][dotBotId]        = events['speed'][i]
+            real['next_bump_x'][dotBotId]  = events['next_bump_x'][i]
+            real['next_bump_y'][dotBotId]  = events['next_bump_y'][i]
+            real['next_bump_ts'][dotBotId] = events['next_bump_ts'][i]
+            real['trajectoryVersion'][dotBotId] += 1
+        self._indexes['trajectory'] = end
+
+        # orchestrator's view
+        events               = self._events['command']
+        (start,end)          = (self._indexes['command'],bisect.bisect_right(events['ts'],ts))
+        for i in range(start,end):
+            dotBotId         = events['dotBotId'][i]
+            view.x[dotBotId]           = events['x'][i]
+            view.y[dotBotId]           = events['y'][i]
+            view.posTs[dotBotId]       = events['posTs'][i]
+            view.heading[dotBotId]     = events['heading'][i]
+            view.dx[dotBotId]          = math.cos(math.radians(events['heading'][i]-90))
+            view.dy[dotBotId]          = math.sin(math.radians(events['heading'][i]-90))
+            view.speed[dotBotId]       = events['speed'][i]
+            view.commandId[dotBotId]   = events['commandId'][i]
+        self._indexes['command']    = end
+
+        # map
+        events               = self._events['mapdelta']
+        (start,end)          = (self._indexes['mapdelta'],bisect.bisect_right(events['ts'],ts))
+        for i in range(start,end):
+            if math.isnan(events['x2'][i]):
+                (elems,elem) = (self.dots,(events['x1'][i],events['y1'][i]))
+            else:
+                (elems,elem) = (self.lines,(events['x1'][i],events['y1'][i],events['x2'][i],events['y2'][i]))
+            if events['added'][i]:
+                elems.add(elem)
+            else:
+                elems.discard(elem)
+        self._indexes['mapdelta']   = end
+        events               = self._events['map']
+        (start,end)          = (self._indexes['map'],bisect.bisect_right(events['ts'],ts))
+        if end>start:
+            self.mapVersion  = events['version'][end-1]
+            self.mapComplete = events['complete'][end-1]==1
+        self._indexes['map']        = end
+
+        self._now            = ts
+
+    def _keyframe(self):
+        view                 = self.orchestrator.dotbotsview
+        return {
+            'now':           self._now,
+            'indexes':       dict(self._indexes),
+            'real':          {field: column[:] for (field,column) in self.real.items()},
+            'view':          {field: getattr(view,field)[:] for field in view.FIELDS},
+            'dots':          frozenset(self.dots),
+            'lines':         frozenset(self.lines),
+            'mapVersion':    self.mapVersion,
+            'mapComplete':   self.mapComplete,
+        }
+
+    def _restore(self,keyframe):
+        view                 = self.orchestrator.dotbotsview
+        for (field,column) in keyframe['real'].items():
+            self.real[field][:]       = column
+        for (field,column) in keyframe['view'].items():
+            getattr(view,field)[:]    = column
+        self._now            = keyframe['now']
+        self._indexes        = dict(keyframe['indexes'])
+        self.dots            = set(keyframe['dots'])
+        self.lines           = set(keyframe['lines'])
+        self.mapVersion      = keyframe['mapVersion']
+        self.mapComplete     = keyframe['mapComplete']
+
+class ReplayEngine(threading.Thread):
+    '''
+    Drives a Replay through time, with the same modes and commands as the SimEngine.
+
+    As nothing is simulated, fastforward moves through time FASTFORWARDSPEED times faster than real time.
+    '''
+
+    MODE_PAUSE          = SimEngine.SimEngine.MODE_PAUSE
+    MODE_FRAMEFORWARD   = SimEngine.SimEngine.MODE_FRAMEFORWARD
+    MODE_PLAY           = SimEngine.SimEngine.MODE_PLAY
+    MODE_FASTFORWARD    = SimEngine.SimEngine.MODE_FASTFORWARD
+
+    TICK                = 0.05 # s (real time), period at which the replay moves forward
+    FASTFORWARDSPEED    = 100
+
+    formatSimulatedTime = SimEngine.SimEngine.formatSimulatedTime
+
+    def __init__(self,replay,headless=False):
+
+        # store params
+        self.replay               = replay
+
+        # local variables
+        self._mode                = self.MODE_PAUSE
+        self._startTsSim          = None
+        self._startTsReal         = None
+        self._playSpeed           = 1.00
+        self.trace                = None # nothing is recorded during a replay
+        self.profiler             = None # nor measured
+        self.dataLock             = threading.Lock()
+
+        # start thread
+        threading.Thread.__init__(self)
+        self.name                 = 'ReplayEngine'
+        self.daemon               = True
+        if not headless:
+            self.start()
+
+    @property
+    def _currentTime(self):
+        return self.replay.currentTime()
+
+    #======================== thread ==========================================
+
+    def run(self):
+        while True:
+            time.sleep(self.TICK)
+            with self.dataLock:
+                if   self._mode==self.MODE_FRAMEFORWARD:
+                    target     = self.replay.nextEventTime()
+                    self._mode = self.MODE_PAUSE
+                elif self._mode==self.MODE_PLAY:
+                    target     = self._startTsSim+(time.time()-self._startTsReal)*self._playSpeed
+                elif self._mode==self.MODE_FASTFORWARD:
+                    target     = self._startTsSim+(time.time()-self._startTsReal)*self.FASTFORWARDSPEED
+                else:
+                    target     = None
+                if target is None:
+                    continue
+                if target>=self.replay.endTs:
+                    target     = self.replay.endTs
+                    self._mode = self.MODE_PAUSE
+                self.replay.seek(target)
+
+    #======================== public ==========================================
+
+    def currentTime(self):
+        return self.replay.currentTime()
+
+    def mode(self):
+        return self._mode
+
+    def stateVersion(self):
+        '''
+        number of recorded changes applied, which along with the current time identifies the state
+        '''
+        return sum(self.replay._indexes.values())
+
+    #=== commands from the GUI
+
+    def commandPause(self):
+        with self.dataLock:
+            self._startTsSim  = None
+            self._startTsReal = None
+            self._mode        = self.MODE_PAUSE
+
+    def commandFrameforward(self):
+        '''
+        move to the next recorded change
+        '''
+        with self.dataLock:
+            self._startTsSim  = None
+            self._startTsReal = None
+            self._mode        = self.MODE_FRAMEFORWARD
+
+    def commandPlay(self,playSpeed):
+        with self.dataLock:
+            self._startTsSim  = self.replay.currentTime()
+            self._startTsReal = time.time()
+            self._playSpeed   = playSpeed
+            self._mode        = self.MODE_PLAY
+
+    def commandFastforward(self):
+        with self.dataLock:
+            self._startTsSim  = self.replay.currentTime()
+            self._startTsReal = time.time()
+            self._mode        = self.MODE_FASTFORWARD
+
+    def commandSeek(self,ts):
+        '''
+        jump to simulated time ts, keeping the current mode
+        '''
+        with self.dataLock:
+            self.replay.seek(min(max(ts,0),self.replay.endTs))
+            if self._startTsSim is not None:
+                self._startTsSim  = self.replay.currentTime()
+                self._startTsReal = time.time()
+
+class ReplayDotBot(object):
+    '''
+    A DotBot of a Replay: exposes the replayed state with the same attributes as a DotBot.
+    '''
+
+    __slots__ = ['replay','dotBotId']
+
+    getAttitude = DotBot.DotBot.getAttitude
+
+    def __init__(self,replay,dotBotId):
+
+        # store params
+        self.replay          = replay
+        self.dotBotId        = dotBotId
+
+    def _field(self,field):
+        return self.replay.real[field][self.dotBotId]
+
+    def _optionalField(self,field):
+        value = self._field(field)
+        return None if math.isnan(value) else value # not known before the first command
+
+    simEngine         = property(lambda self: self.replay.simEngine)
+    x                 = property(lambda self: self._field('x'))
+    y                 = property(lambda self: self._field('y'))
+    posTs             = property(lambda self: self._field('posTs'))
+    dx                = property(lambda self: self._field('dx'))
+    dy                = property(lambda self: self._field('dy'))
+    headingActual     = property(lambda self: self._field('heading'))
+    speedActual       = property(lambda self: self._field('speed'))
+    next_bump_x       = property(lambda self: self._optionalField('next_bump_x'))
+    next_bump_y       = property(lambda self: self._optionalField('next_bump_y'))
+    next_bump_ts      = property(lambda self: self._optionalField('next_bump_ts'))
+    trajectoryVersion = property(lambda self: int(self._field('trajectoryVersion')))
+
+class ReplayOrchestrator(object):
+    '''
+    The orchestrator of a Replay: its view of the DotBots and the map, as replayed.
+    '''
+
+    getView          = Orchestrator.Orchestrator.getView
+    getViewPositions = Orchestrator.Orchestrator.getViewPositions
+
+    def __init__(self,replay,positions):
+
+        # store params
+        self.replay          = replay
+
+        # local variables
+        self.simEngine       = replay.simEngine
+        self.dotbotsview     = Orchestrator.DotBotsView(positions)
+        self.mapBuilder      = ReplayMapBuilder(replay)
+
+class ReplayMapBuilder(object):
+
+    def __init__(self,replay):
+
+        # store params
+        self.replay          = replay
+
+    def getMap(self):
+        return self.replay.getMap()
+
+    def getMapVersion(self):
+        return self.replay.mapVersion
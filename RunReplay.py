@@ -0,0 +1,30 @@
+'''
+Replay a recorded run (see RunSim.py --trace) in the UI, without simulating it again.
+
+Usage:
+    python RunReplay.py run.trace.0
+
+On top of the usual controls, POST {"ts": <simulated time>} to /seek to jump to any time of the run.
+'''
+
+# built-in
+import argparse
+# third-party
+# local
+import Replay
+import SimUI
+
+#============================ main ============================================
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('trace', help='trace file of the run to replay')
+    args   = parser.parse_args()
+    
+    replay = Replay.Replay(args.trace)
+    simUI  = SimUI.SimUI(replay)
+    
+    input('Press Enter to close replay.')
+
+if __name__=='__main__':
+    main()
@@ -1,12 +1,9 @@
 # built-in
+import argparse
+import json
 # third-party
 # local
-import Floorplan
-import DotBot
-import Orchestrator
-import Wireless
-import SimEngine
-import SimUI
+import Simulation
 
 #============================ defines =========================================
 
@@ -27,49 +24,49 @@ SIMSETTINGS = [
 ]
 #============================ helpers =========================================
 
-def oneSim(simSetting):
+def oneSim(simSetting,headless=False,tracePath=None,profile=False):
     '''
     Run a single simulation.
-    '''
-    
-    # create the wireless communication
-    wireless       = Wireless.Wireless()
-    
-    # create the SimEngine
-    simEngine      = SimEngine.SimEngine()
-    
-    # create the floorplan
-    floorplan      = Floorplan.Floorplan(simSetting['floorplanDrawing'])
     
-    # create the DotBots
-    dotBots        = []
-    for dotBotId in range(simSetting['numDotBots']):
-        dotBots   += [DotBot.DotBot(dotBotId,floorplan)]
+    In headless mode, the simulation runs in the calling thread until the map is complete, without UI.
+    If tracePath is set, the run is recorded into that file (see Trace.py).
+    If profile, the SimEngine measures where the time goes, see /stats.json in the UI and 'profile' in the results.
     
-    # drop the DotBots on the floorplan at their initial position
-    (x,y) = simSetting['initialPosition']
-    for dotBot in dotBots:
-        dotBot.setInitialPosition(x,y)
+    \return a dict with the results of the simulation (headless mode only)
+    '''
     
-    # create the orchestrator
-    orchestrator   = Orchestrator.Orchestrator([simSetting['initialPosition']]*len(dotBots),floorplan)
+    # create the simulation
+    simulation     = Simulation.Simulation(simSetting,headless=headless,tracePath=tracePath,profile=profile)
     
-    # indicate the elements to the singletons
-    wireless.indicateElements(dotBots,orchestrator)
+    if headless:
+        result     = simulation.run()
+        simulation.close()
+        return result
     
     # start the UI (call last)
-    simUI          = SimUI.SimUI(floorplan,dotBots,orchestrator)
-    
-    # schedule the first event
-    simEngine.schedule(0,orchestrator.startExploration)
+    import SimUI # imported here so headless runs do not need bottle
+    simUI          = SimUI.SimUI(simulation)
     
     input('Press Enter to close simulation.')
+    simulation.close()
 
 #============================ main ============================================
 
 def main():
-    for simSetting in SIMSETTINGS:
-        oneSim(simSetting)
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--headless', action='store_true', help='run without UI, as fast as possible, until the map is complete')
+    parser.add_argument('--profile',  action='store_true', help='measure the time spent per callback, printed at the end of headless runs')
+    parser.add_argument('--trace',                         help='record the run into this file (one file per simSetting, suffixed with its index)')
+    args   = parser.parse_args()
+    
+    for (i,simSetting) in enumerate(SIMSETTINGS):
+        tracePath = None if args.trace is None else '{0}.{1}'.format(args.trace,i)
+        result = oneSim(simSetting,headless=args.headless,tracePath=tracePath,profile=args.profile)
+        if args.headless:
+            profile = result.pop('profile',None)
+            print(result)
+            if profile is not None:
+                print(json.dumps(profile,indent=4))
 
 if __name__=='__main__':
     main()
@@ -0,0 +1,125 @@
+'''
+Run a parameter sweep of headless simulations, spread over all cores.
+
+Usage:
+    python RunSweep.py [--numDotBots 10 50 100] [--seeds 0 1 2] [--workers 4] [--out results.json] [--resultsDir results]
+
+With --resultsDir, the result of each run is stored in that directory, named after the fingerprint of its simSetting
+(see Simulation.fingerprint()), and runs whose result is already there are skipped.
+'''
+
+# built-in
+import argparse
+import concurrent.futures
+import itertools
+import json
+import os
+# third-party
+# local
+import RunSim
+import Simulation
+
+#============================ defines =========================================
+
+FLOORPLANS = {
+    'default':   RunSim.SIMSETTINGS[0]['floorplanDrawing'],
+    'empty':     # 1m per character
+'''
+..................
+..................
+..................
+..................
+..................
+..................
+''',
+}
+
+INITIALPOSITION = (5,1)
+
+#============================ helpers =========================================
+
+def buildSimSettings(numDotBots,floorplans,seeds):
+    '''
+    \return the list of simSettings covering the grid (numDotBots x floorplans x seeds)
+    '''
+    returnVal = []
+    for (n,floorplan,seed) in itertools.product(numDotBots,floorplans,seeds):
+        returnVal += [{
+            'numDotBots':       n,
+            'floorplan':        floorplan,
+            'floorplanDrawing': FLOORPLANS[floorplan],
+            'initialPosition':  INITIALPOSITION,
+            'seed':             seed,
+        }]
+    return returnVal
+
+def runOne(simSetting):
+    '''
+    Run a single headless simulation. Executed in a worker process.
+    
+    The simulation seeds its own random streams from simSetting['seed'], whichever process runs it.
+    '''
+    
+    result = Simulation.Simulation(simSetting,headless=True).run()
+    result['floorplan'] = simSetting['floorplan']
+    result['seed']      = simSetting['seed']
+    return result
+
+def runSweep(simSettings,numWorkers=None,resultsDir=None):
+    '''
+    Run all simSettings in a pool of worker processes.
+    
+    If resultsDir is set, the results already in it are reused, and the new ones are written to it.
+    
+    \return the list of results, in the same order as simSettings
+    '''
+    
+    # reuse the results on disk
+    results   = [None]*len(simSettings)
+    if resultsDir is not None:
+        os.makedirs(resultsDir,exist_ok=True)
+        for (i,simSetting) in enumerate(simSettings):
+            path = resultPath(resultsDir,simSetting)
+            if os.path.exists(path):
+                with open(path) as f:
+                    results[i] = json.load(f)
+    
+    # run the others
+    todo      = [i for (i,result) in enumerate(results) if result is None]
+    if todo:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=numWorkers) as executor:
+            for (i,result) in zip(todo,executor.map(runOne,[simSettings[i] for i in todo])):
+                results[i] = result
+                if resultsDir is not None:
+                    with open(resultPath(resultsDir,simSettings[i]),'w') as f:
+                        json.dump(result,f,indent=4)
+    
+    return results
+
+def resultPath(resultsDir,simSetting):
+    return os.path.join(resultsDir,'{0}.json'.format(Simulation.fingerprint(simSetting)))
+
+#============================ main ============================================
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--numDotBots', type=int, nargs='+', default=[10,50,100])
+    parser.add_argument('--floorplans', nargs='+',           default=sorted(FLOORPLANS.keys()), choices=sorted(FLOORPLANS.keys()))
+    parser.add_argument('--seeds',      type=int, nargs='+', default=[0,1,2])
+    parser.add_argument('--workers',    type=int,            default=os.cpu_count())
+    parser.add_argument('--out',                             default=None, help='write results to this JSON file')
+    parser.add_argument('--resultsDir',                      default=None, help='cache the result of each run in this directory')
+    args   = parser.parse_args()
+    
+    simSettings = buildSimSettings(args.numDotBots,args.floorplans,args.seeds)
+    results     = runSweep(simSettings,args.workers,args.resultsDir)
+    
+    for result in results:
+        print(result)
+    
+    if args.out:
+        with open(args.out,'w') as f:
+            json.dump(results,f,indent=4)
+
+if __name__=='__main__':
+    main()
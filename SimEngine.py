@@ -2,9 +2,196 @@
 import threading
 import time
 import datetime
+import heapq
+import itertools
 # third-party
 # local
 
+class SimEvent(object):
+    '''
+    Handle on an event scheduled in the SimEngine, returned by schedule().
+    '''
+    
+    def __init__(self,scheduler,ts,cb,args=()):
+        
+        # store params
+        self.scheduler       = scheduler # the object (SimEngine or EventQueue) which cancels/reschedules this event
+        self.ts              = ts
+        self.cb              = cb
+        self.args            = args      # passed to cb
+        
+        # local variables
+        self._entry          = None # the heap entry currently representing this event
+    
+    #======================== public ==========================================
+    
+    def isPending(self):
+        return self._entry is not None
+    
+    def fire(self):
+        self.cb(*self.args)
+    
+    def cancel(self):
+        '''
+        Cancel the event. Cancelling an event which already fired (or was already cancelled) has no effect.
+        '''
+        self.scheduler.cancel(self)
+    
+    def reschedule(self,ts):
+        '''
+        Move the event to a new timestamp, keeping the same handle.
+        '''
+        self.scheduler.reschedule(self,ts)
+
+class EventQueue(object):
+    '''
+    Priority queue of SimEvents, ordered by timestamp.
+    
+    Events with the same timestamp are popped in the order they were scheduled.
+    Cancelling is lazy: the heap entry is only marked as removed, and discarded when it reaches the top of the heap.
+    '''
+    
+    def __init__(self):
+        
+        # local variables
+        self._heap           = [] # entries are [ts,seq,event], event set to None when cancelled
+        self._seq            = itertools.count()
+        self._numEvents      = 0  # number of pending (non-cancelled) events
+    
+    def __len__(self):
+        return self._numEvents
+    
+    #======================== public ==========================================
+    
+    def push(self,ts,cb,scheduler=None,args=()):
+        event                = SimEvent(scheduler or self,ts,cb,args)
+        self._push(event)
+        return event
+    
+    def pop(self):
+        '''
+        \return the next pending SimEvent, None if there is none
+        '''
+        while self._heap:
+            (ts,seq,event)   = heapq.heappop(self._heap)
+            if event is not None:
+                event._entry = None
+                self._numEvents -= 1
+                return event
+        return None
+    
+    def pending(self):
+        '''
+        \return the pending SimEvents, in the order they will be popped
+        '''
+        return [event for (ts,seq,event) in sorted(entry for entry in self._heap if entry[2] is not None)]
+    
+    def peekTime(self):
+        '''
+        \return the timestamp of the next pending event, None if there is none
+        '''
+        while self._heap:
+            if self._heap[0][2] is not None:
+                return self._heap[0][0]
+            heapq.heappop(self._heap)
+        return None
+    
+    def cancel(self,event):
+        if event._entry is None:
+            return
+        event._entry[2]      = None
+        event._entry         = None
+        self._numEvents     -= 1
+    
+    def reschedule(self,event,ts):
+        self.cancel(event)
+        event.ts             = ts
+        self._push(event)
+    
+    #======================== private =========================================
+    
+    def _push(self,event):
+        entry                = [event.ts,next(self._seq),event]
+        event._entry         = entry
+        self._numEvents     += 1
+        heapq.heappush(self._heap,entry)
+
+class Profiler(object):
+    '''
+    Wall time spent in the callbacks of the events, and in the hot paths of the simulation.
+    
+    Per key (the qualified name of a callback, or the name of a hot path), counts the calls, sums their duration and
+    builds a histogram of their durations, in powers of 2 of microseconds. Also samples the depth of the event queue
+    each time an event is handled.
+    '''
+    
+    def __init__(self):
+        
+        # local variables
+        self.numEvents       = 0
+        self.busyTime        = 0  # s (wall clock), handling events and batch end callbacks
+        self.maxQueueDepth   = 0
+        self._sumQueueDepth  = 0
+        self._calls          = {} # key -> [count,totalTime,histogram], histogram[i] counting calls of [2^(i-1),2^i) us
+    
+    #======================== public ==========================================
+    
+    def fire(self,event,queueDepth):
+        '''
+        Call the callback of an event, measuring it.
+        '''
+        self.numEvents      += 1
+        self._sumQueueDepth += queueDepth
+        if queueDepth>self.maxQueueDepth:
+            self.maxQueueDepth = queueDepth
+        self.busyTime       += self.call(getattr(event.cb,'__qualname__',repr(event.cb)),event.cb,*event.args)[1]
+    
+    def call(self,key,cb,*args):
+        '''
+        Call cb(*args), accounting its duration under key.
+        
+        \return (what cb returned, duration)
+        '''
+        startTs              = time.perf_counter()
+        returnVal            = cb(*args)
+        duration             = time.perf_counter()-startTs
+        
+        calls                = self._calls.get(key)
+        if calls is None:
+            calls            = self._calls[key] = [0,0,[]]
+        calls[0]            += 1
+        calls[1]            += duration
+        bucket               = int(duration*1e6).bit_length()
+        histogram            = calls[2]
+        if bucket>=len(histogram):
+            histogram       += [0]*(bucket+1-len(histogram))
+        histogram[bucket]   += 1
+        
+        return (returnVal,duration)
+    
+    def getStats(self):
+        '''
+        \return the measurements, as plain data (JSON-serializable), callbacks sorted by decreasing total time
+        '''
+        return {
+            'enabled':           True,
+            'numEvents':         self.numEvents,
+            'busyTime':          self.busyTime,
+            'eventsPerSecond':   self.numEvents/self.busyTime if self.busyTime else None,
+            'queueDepth':        {
+                'max':           self.maxQueueDepth,
+                'mean':          self._sumQueueDepth/self.numEvents if self.numEvents else None,
+            },
+            'calls':             {
+                key: {
+                    'count':     count,
+                    'totalTime': totalTime,
+                    'meanTime':  totalTime/count,
+                    'histogram': {'<{0}us'.format(2**i): n for (i,n) in enumerate(histogram) if n},
+                } for (key,(count,totalTime,histogram)) in sorted(self._calls.items(),key=lambda item: -item[1][1])
+            },
+        }
+
 class SimEngine(threading.Thread):
     '''
     Discrete-event simulation engine for a swarm of DotBots.
@@ -15,20 +202,16 @@ class SimEngine(threading.Thread):
     MODE_PLAY           = 'play'
     MODE_FASTFORWARD    = 'fastforward'
     
-    # singleton pattern
-    _instance   = None
-    _init       = False
-    def __new__(cls, *args, **kwargs):
-        if not cls._instance:
-            cls._instance = super(SimEngine, cls).__new__(cls, *args, **kwargs)
-        return cls._instance
-    
-    def __init__(self):
+    def __init__(self,headless=False,profile=False):
+        '''
+        In headless mode, no thread is started and the simulation is driven by calling runUntil().
         
-        # singleton patterm
-        if self._init:
-            return
-        self._init = True
+        If profile, the time spent in each callback is measured (see Profiler), as well as the hot paths which check
+        self.profiler. Otherwise, self.profiler is None, and costs nothing but that check.
+        '''
+        
+        # store params
+        self._headless            = headless
         
         # local variables
         self._currentTime         = 0    # what time is it for the DotBots
@@ -36,7 +219,11 @@ class SimEngine(threading.Thread):
         self._startTsSim          = None
         self._startTsReal         = None
         self._playSpeed           = 1.00
-        self.events               = []
+        self._stateVersion        = 0    # incremented each time an event has fired or a batch has ended
+        self.events               = EventQueue()
+        self._batchEndCbs         = []   # called each time all events at the current time have been handled
+        self.trace                = None # Trace.TraceWriter the elements record the run into, if any
+        self.profiler             = Profiler() if profile else None
         self.semNumEvents         = threading.Semaphore(0)
         self.dataLock             = threading.Lock()
         self.semIsRunning         = threading.Lock()
@@ -46,7 +233,8 @@ class SimEngine(threading.Thread):
         threading.Thread.__init__(self)
         self.name                 = 'SimEngine'
         self.daemon               = True
-        self.start()
+        if not self._headless:
+            self.start()
     
     #======================== thread ==========================================
     
@@ -60,11 +248,17 @@ class SimEngine(threading.Thread):
             # wait for at least one event
             self.semNumEvents.acquire()
             
-            # handle next event
-            (ts,cb) = self.events.pop(0)
-            assert self._currentTime<=ts
-            self._currentTime = ts
-            cb()
+            # handle next event (skipping over cancelled ones)
+            # Note: events handled as part of a batch leave their semaphore token behind, hence no event
+            event = self.events.pop()
+            if event is None:
+                continue
+            assert self._currentTime<=event.ts
+            self._currentTime = event.ts
+            self._fire(event)
+            
+            # handle the other events at the same time, as a batch
+            self._handleBatch()
             
             # switch to MODE_PAUSE if in MODE_FRAMEFORWARD
             if self._mode==self.MODE_FRAMEFORWARD:
@@ -80,6 +274,54 @@ class SimEngine(threading.Thread):
     
     #======================== public ==========================================
     
+    #=== headless execution
+    
+    def runUntil(self,untilTs=None,predicate=None):
+        '''
+        Execute events in the calling thread, as fast as possible, until
+        - predicate() returns True (evaluated before each batch of events sharing the same time), or
+        - the next event is scheduled after untilTs, or
+        - there are no more events.
+        
+        Only available in headless mode: no thread, lock or semaphore is involved.
+        
+        \return True if stopped because predicate() returned True, False otherwise
+        '''
+        assert self._headless
+        
+        # shorthand
+        events            = self.events
+        
+        self._mode        = self.MODE_FASTFORWARD
+        self._startTsSim  = self._currentTime
+        self._startTsReal = time.time()
+        
+        returnVal         = False
+        while True:
+            
+            # stop if condition reached
+            if predicate is not None and predicate():
+                returnVal = True
+                break
+            
+            # stop if next event too late or no more events
+            nextTs = events.peekTime()
+            if nextTs is None:
+                break
+            if untilTs is not None and nextTs>untilTs:
+                self._currentTime = untilTs
+                break
+            
+            # handle all events at that time, as a batch
+            event             = events.pop()
+            self._currentTime = event.ts
+            self._fire(event)
+            self._handleBatch()
+        
+        self._mode        = self.MODE_PAUSE
+        
+        return returnVal
+    
     #=== from other elements in simulator
     
     def currentTime(self):
@@ -88,6 +330,13 @@ class SimEngine(threading.Thread):
     def mode(self):
         return self._mode
     
+    def stateVersion(self):
+        '''
+        \return a number which changes each time the state of the simulation may have changed, including between
+        events at the same simulated time
+        '''
+        return self._stateVersion
+    
     def formatSimulatedTime(self):
         returnVal            = []
         returnVal           += ['[']
@@ -104,15 +353,66 @@ class SimEngine(threading.Thread):
         returnVal            = ' '.join(returnVal)
         return returnVal
     
-    def schedule(self,ts,cb):
-        # add new event
-        self.events += [(ts,cb)]
+    def schedule(self,ts,cb,*args):
+        '''
+        Schedule cb(*args) to be called at simulated time ts.
+        
+        Prefer a bound method and its arguments to a closure: the event can then be described in a checkpoint (see
+        Simulation.checkpoint()).
+        
+        \return a SimEvent handle which can be used to cancel or reschedule the event
+        '''
         
-        # reorder list
-        self.events  = sorted(self.events, key = lambda e: e[0])
+        # add new event
+        event = self.events.push(ts,cb,self,args)
         
         # release semaphore
-        self.semNumEvents.release()
+        if not self._headless:
+            self.semNumEvents.release()
+        
+        return event
+    
+    def subscribeBatchEnd(self,cb):
+        '''
+        Have cb called each time all the events at the current time have been handled, e.g. to coalesce what these
+        events produced. Events cb schedules at the current time are handled as a new batch.
+        '''
+        self._batchEndCbs += [cb]
+    
+    def getCheckpoint(self,describe):
+        '''
+        \return the time and pending events, as plain data, each event's callback described by describe(cb)
+        '''
+        return {
+            'currentTime':   self._currentTime,
+            'events':        [(event.ts,describe(event.cb),event.args) for event in self.events.pending()],
+        }
+    
+    def setCheckpoint(self,checkpoint,resolve):
+        '''
+        Replace the time and pending events by those of a checkpoint, resolve(description) giving back each callback.
+        '''
+        self._currentTime         = checkpoint['currentTime']
+        self.events               = EventQueue()
+        for (ts,description,args) in checkpoint['events']:
+            self.schedule(ts,resolve(description),*args)
+        self._stateVersion       += 1
+    
+    def cancel(self,event):
+        '''
+        Cancel a previously scheduled event.
+        '''
+        self.events.cancel(event)
+    
+    def reschedule(self,event,ts):
+        '''
+        Move a previously scheduled event to a new timestamp.
+        '''
+        self.events.reschedule(event,ts)
+        
+        # the new heap entry needs its own semaphore token
+        if not self._headless:
+            self.semNumEvents.release()
     
     #=== commands from the GUI
     
@@ -130,7 +430,7 @@ class SimEngine(threading.Thread):
     
     def commandFrameforward(self):
         '''
-        execute next event in list of events
+        execute next events in list of events (all those at the next time)
         '''
         
         with self.dataLock:
@@ -166,3 +466,28 @@ class SimEngine(threading.Thread):
             self._mode        = self.MODE_FASTFORWARD
     
     #======================== private =========================================
+    
+    def _handleBatch(self):
+        '''
+        Handle the remaining events at the current time, then call the batch end callbacks.
+        '''
+        
+        # shorthand
+        events   = self.events
+        profiler = self.profiler
+        
+        while events.peekTime()==self._currentTime:
+            self._fire(events.pop())
+        for cb in self._batchEndCbs:
+            if profiler is None:
+                cb()
+            else:
+                profiler.busyTime += profiler.call(cb.__qualname__,cb)[1]
+        self._stateVersion += 1
+    
+    def _fire(self,event):
+        if self.profiler is None:
+            event.fire()
+        else:
+            self.profiler.fire(event,len(self.events))
+        self._stateVersion += 1
@@ -2,28 +2,254 @@
 import threading
 import webbrowser
 import time
+import json
+import struct
+import array
+import math
+import itertools
+import sys
+import gzip
+import hashlib
+import os
+import socketserver
+import wsgiref.simple_server
 # third-party
 import bottle
+try:
+    import numpy as np
+except ImportError:
+    np = None # packView() falls back to pure Python
 # local
-import SimEngine
 import SimVersion
+import SimEngine
+import DotBot
+
+class ThreadingWSGIServer(socketserver.ThreadingMixIn,wsgiref.simple_server.WSGIServer):
+    '''
+    wsgiref server handling each request in its own thread, so a client listening to /stream does not block the others.
+    '''
+    daemon_threads = True
+
+class DeltaStream(object):
+    '''
+    The state of the simulation, as a sequence of delta frames for one client of the /stream endpoint.
+    
+    A frame only contains the DotBots whose trajectory changed and the changes to the discovered map since the previous
+    frame; the client extrapolates the position of the DotBots between frames from their heading and speed.
+    '''
+    
+    def __init__(self,simulation):
+        
+        # store params
+        self.simulation      = simulation
+        
+        # local variables
+        self._versions       = [None]*len(simulation.dotBots) # per DotBot, the trajectory last sent to the client
+        self._discomap       = None                           # map snapshot last sent to the client
+    
+    #======================== public ==========================================
+    
+    def nextFrame(self):
+        '''
+        \return the delta frame since the previous call (the full state on the first call)
+        '''
+        
+        # shorthand
+        simEngine            = self.simulation.simEngine
+        orchestratorview     = self.simulation.orchestrator.dotbotsview
+        
+        returnVal = {
+            'now':               simEngine.currentTime(),
+            'mode':              simEngine.mode(),
+            'simulatedTime':     simEngine.formatSimulatedTime(),
+            'dotbots':           [],
+        }
+        
+        # DotBots whose trajectory changed, in reality or in the view of the orchestrator
+        for dotbot in self.simulation.dotBots:
+            i                = dotbot.dotBotId
+            version          = (dotbot.trajectoryVersion,orchestratorview.commandId[i],orchestratorview.posTs[i],orchestratorview.heading[i])
+            if version==self._versions[i]:
+                continue
+            view             = orchestratorview[i]
+            self._versions[dotbot.dotBotId] = version
+            returnVal['dotbots'] += [{
+                'id':            dotbot.dotBotId,
+                'x':             dotbot.x,
+                'y':             dotbot.y,
+                'posTs':         dotbot.posTs,
+                'heading':       dotbot.headingActual,
+                'speed':         dotbot.speedActual,
+                'next_bump_x':   dotbot.next_bump_x,
+                'next_bump_y':   dotbot.next_bump_y,
+                'next_bump_ts':  dotbot.next_bump_ts,
+                'orchestratorview': {
+                    'x':         view['x'],
+                    'y':         view['y'],
+                    'posTs':     view['posTs'],
+                    'heading':   view['heading'],
+                    'speed':     view['speed'],
+                },
+            }]
+        
+        # changes to the discovered map
+        discomap             = self.simulation.orchestrator.mapBuilder.getMap()
+        if discomap is not self._discomap:
+            if self._discomap is None:
+                (oldDots,oldLines) = (set(),set())
+            else:
+                (oldDots,oldLines) = (set(self._discomap['dots']),set(self._discomap['lines']))
+            (newDots,newLines)     = (set(discomap['dots']),set(discomap['lines']))
+            returnVal['discomap']  = {
+                'version':       discomap['version'],
+                'complete':      discomap['complete'],
+                'dotsAdded':     list(newDots-oldDots),
+                'dotsRemoved':   list(oldDots-newDots),
+                'linesAdded':    list(newLines-oldLines),
+                'linesRemoved':  list(oldLines-newLines),
+            }
+            self._discomap   = discomap
+        
+        return returnVal
+
+#=== binary view of the simulation, served on /dotbots.bin
+#
+# All little-endian. A header:
+#     uint32  numDotBots
+#     uint32  numDots       (discovered map)
+#     uint32  numLines      (discovered map)
+#     uint8   mode          (index in BINMODES)
+#     uint8   complete      (discovered map, 0 or 1)
+#     uint16  numFields     (per DotBot, see BINFIELDS)
+#     float64 simulated time, in s
+# followed by float32 arrays:
+#     numDotBots x numFields, NaN for next_bump_x/next_bump_y when unknown
+#     numDots    x 2         (x,y)
+#     numLines   x 4         (x1,y1,x2,y2)
+
+BINHEADER = struct.Struct('<IIIBBHd')
+BINFIELDS = ['x','y','heading','orchestratorview_x','orchestratorview_y','next_bump_x','next_bump_y']
+JSONFIELDS = ['x','y','heading','speed','next_bump_x','next_bump_y','orchestratorview_x','orchestratorview_y'] # /dotbots.json
+BINMODES  = [
+    SimEngine.SimEngine.MODE_PAUSE,
+    SimEngine.SimEngine.MODE_FRAMEFORWARD,
+    SimEngine.SimEngine.MODE_PLAY,
+    SimEngine.SimEngine.MODE_FASTFORWARD,
+]
+
+def viewColumns(simulation):
+    '''
+    \return the state of the DotBots, as one column per field of JSONFIELDS (see DotBot.getAttitudes()), each built in
+    one pass
+    '''
+    columns              = DotBot.getAttitudes(simulation.dotBots,simulation.simEngine.currentTime())
+    (columns['orchestratorview_x'],columns['orchestratorview_y']) = simulation.orchestrator.getViewPositions()
+    return columns
+
+def packView(simulation):
+    '''
+    \return the current state of the simulation, encoded as described above
+    '''
+    
+    # shorthand
+    simEngine            = simulation.simEngine
+    now                  = simEngine.currentTime()
+    numDotBots           = len(simulation.dotBots)
+    discomap             = simulation.orchestrator.mapBuilder.getMap()
+    
+    # DotBots, one column per field
+    columns              = viewColumns(simulation)
+    
+    # interleave the columns into one row per DotBot, then the map
+    if np is not None:
+        values           = np.empty((numDotBots,len(BINFIELDS)),dtype='<f4')
+        for (i,field) in enumerate(BINFIELDS):
+            values[:,i]  = columns[field]
+        values           = b''.join([
+            values.tobytes(),
+            np.array(discomap['dots'], dtype='<f4').tobytes(),
+            np.array(discomap['lines'],dtype='<f4').tobytes(),
+        ])
+    else:
+        values           = array.array('f',bytes(4*len(BINFIELDS)*numDotBots))
+        for (i,field) in enumerate(BINFIELDS):
+            values[i::len(BINFIELDS)] = array.array('f',columns[field])
+        values.extend(itertools.chain.from_iterable(discomap['dots']))
+        values.extend(itertools.chain.from_iterable(discomap['lines']))
+        if sys.byteorder=='big':
+            values.byteswap()
+        values           = values.tobytes()
+    
+    header               = BINHEADER.pack(
+        len(simulation.dotBots),
+        len(discomap['dots']),
+        len(discomap['lines']),
+        BINMODES.index(simEngine.mode()),
+        1 if discomap['complete'] else 0,
+        len(BINFIELDS),
+        now,
+    )
+    return header+values
+
+def unpackView(data):
+    '''
+    Decode the output of packView(), e.g. to inspect the state of a simulation from another process.
+    
+    \return a dict similar to the one served on /dotbots.json
+    '''
+    
+    (numDotBots,numDots,numLines,mode,complete,numFields,now) = BINHEADER.unpack_from(data)
+    values               = array.array('f')
+    values.frombytes(data[BINHEADER.size:])
+    if sys.byteorder=='big':
+        values.byteswap()
+    values               = values.tolist()
+    
+    dotbots              = []
+    for i in range(numDotBots):
+        dotbot           = dict(zip(BINFIELDS,values[i*numFields:(i+1)*numFields]))
+        for k in ['next_bump_x','next_bump_y']:
+            if math.isnan(dotbot[k]):
+                dotbot[k] = None
+        dotbots         += [dotbot]
+    offset               = numDotBots*numFields
+    dots                 = [tuple(values[offset+2*i:offset+2*i+2]) for i in range(numDots)]
+    offset              += 2*numDots
+    lines                = [tuple(values[offset+4*i:offset+4*i+4]) for i in range(numLines)]
+    
+    return {
+        'mode':          BINMODES[mode],
+        'now':           now,
+        'dotbots':       dotbots,
+        'discomap':      {
+            'complete':  complete==1,
+            'dots':      dots,
+            'lines':     lines,
+        },
+    }
 
 class SimUI(object):
     '''
     Web-based User Interface of the simulator.
     '''
     
-    TCPPORT = 8080
+    TCPPORT      = 8080
+    STREAMPERIOD = 0.1 # s, period of the frames pushed on /stream
     
-    def __init__(self,floorplan,dotbots,orchestrator):
+    def __init__(self,simulation):
     
         # store params
-        self.floorplan       = floorplan
-        self.dotbots         = dotbots
-        self.orchestrator    = orchestrator
+        self.simulation      = simulation
         
         # local variables
-        self.simEngine       = SimEngine.SimEngine()
+        self.floorplan       = simulation.floorplan
+        self.dotbots         = simulation.dotBots
+        self.orchestrator    = simulation.orchestrator
+        self.simEngine       = simulation.simEngine
+        self.startTs         = time.time() # Last-Modified of what does not change during the simulation
+        self.floorplanETag   = '"{0}"'.format(
+            hashlib.sha1(json.dumps(self.floorplan.getJSON(),sort_keys=True).encode()).hexdigest()
+        )
         
         # start web server
         self.websrv          = bottle.Bottle()
@@ -31,10 +257,15 @@ class SimUI(object):
         self.websrv.route('/static/<filename>',       'GET',    self._webhandle_static_GET)
         self.websrv.route('/floorplan.json',          'GET',    self._webhandle_floorplan_GET)
         self.websrv.route('/dotbots.json',            'GET',    self._webhandle_dotbots_GET)
+        self.websrv.route('/dotbots.bin',             'GET',    self._webhandle_dotbotsbin_GET)
+        self.websrv.route('/stream',                  'GET',    self._webhandle_stream_GET)
+        self.websrv.route('/stats.json',              'GET',    self._webhandle_stats_GET)
         self.websrv.route('/frameforward',            'POST',   self._webhandle_frameforward_POST)
         self.websrv.route('/play',                    'POST',   self._webhandle_play_POST)
         self.websrv.route('/fastforward',             'POST',   self._webhandle_fastforward_POST)
         self.websrv.route('/pause',                   'POST',   self._webhandle_pause_POST)
+        if hasattr(self.simEngine,'commandSeek'): # replays only (see Replay.py), a live simulation cannot go back
+            self.websrv.route('/seek',                'POST',   self._webhandle_seek_POST)
         webthread = threading.Thread(
             target = self._bottle_try_running_forever,
             args   = (self.websrv.run,),
@@ -43,6 +274,7 @@ class SimUI(object):
                 'port'          : self.TCPPORT,
                 'quiet'         : True,
                 'debug'         : False,
+                'server_class'  : ThreadingWSGIServer,
             }
         )
         webthread.name       = 'WebServer'
@@ -66,27 +298,62 @@ class SimUI(object):
         )
     
     def _webhandle_static_GET(self,filename):
-        return bottle.static_file(filename, root='static/')
+        path = os.path.join('static',filename)
+        if os.path.isfile(path):
+            stat = os.stat(path)
+            etag = '"{0:x}-{1:x}"'.format(stat.st_mtime_ns,stat.st_size)
+            if self._notModified(etag,stat.st_mtime):
+                return ''
+        returnVal = bottle.static_file(filename, root='static/')
+        if os.path.isfile(path):
+            # the headers of the returned response replace those set on bottle.response
+            returnVal.set_header('ETag',etag) # overrides bottle's own, if any
+            returnVal.set_header('Cache-Control','no-cache')
+        return returnVal
     
     def _webhandle_floorplan_GET(self):
+        if self._notModified(self.floorplanETag,self.startTs):
+            return ''
         return self.floorplan.getJSON()
     
     def _webhandle_dotbots_GET(self):
-        simulatedTime = self.simEngine.currentTime()
+        if self._notModified(self._viewETag('json')):
+            return ''
         
-        orchestratorView = self.orchestrator.getView()
+        columns   = viewColumns(self.simulation)
+        for (k,v) in columns.items():
+            columns[k] = v if isinstance(v,list) else v.tolist() # plain floats serialize faster
+        for k in ['next_bump_x','next_bump_y']:
+            columns[k] = [None if math.isnan(v) else v for v in columns[k]]
         returnVal = {
             'mode':                self.simEngine.mode(),
             'simulatedTime':       self.simEngine.formatSimulatedTime(),
-            'dotbots':             [],
-            'discomap':            orchestratorView['discomap'],
+            'dotbots':             [dict(zip(JSONFIELDS,values)) for values in zip(*[columns[k] for k in JSONFIELDS])],
+            'discomap':            self.orchestrator.mapBuilder.getMap(),
         }
-        for dotbot in self.dotbots:
-            returnVal['dotbots'] += [dotbot.getAttitude()]
-        for (dotbot,orchestratorview) in zip(returnVal['dotbots'],orchestratorView['dotbots']):
-            dotbot['orchestratorview_x'] = orchestratorview['x']
-            dotbot['orchestratorview_y'] = orchestratorview['y']
         return returnVal
+    
+    def _webhandle_dotbotsbin_GET(self):
+        useGzip   = 'gzip' in bottle.request.get_header('Accept-Encoding','')
+        bottle.response.set_header('Vary','Accept-Encoding')
+        if self._notModified(self._viewETag('bin-gzip' if useGzip else 'bin')):
+            return ''
+        returnVal = packView(self.simulation)
+        bottle.response.content_type = 'application/octet-stream'
+        if useGzip:
+            returnVal = gzip.compress(returnVal,compresslevel=1)
+            bottle.response.set_header('Content-Encoding','gzip')
+        return returnVal
+    
+    def _webhandle_stream_GET(self):
+        bottle.response.content_type = 'text/event-stream'
+        bottle.response.set_header('Cache-Control','no-cache')
+        return self._streamFrames(DeltaStream(self.simulation))
+     
+    def _webhandle_stats_GET(self):
+        if self.simEngine.profiler is None:
+            return {'enabled': False} # start with RunSim.py --profile
+        return self.simEngine.profiler.getStats()
      
     def _webhandle_frameforward_POST(self):
         self.simEngine.commandFrameforward()
@@ -101,6 +368,61 @@ class SimUI(object):
     def _webhandle_pause_POST(self):
         self.simEngine.commandPause()
     
+    def _webhandle_seek_POST(self):
+        rxjson = bottle.request.json
+        self.simEngine.commandSeek(rxjson['ts'])
+    
+    #=== conditional requests
+    
+    def _viewETag(self,encoding):
+        '''
+        The state of the simulation changes each time an event fires or a batch of events ends (see
+        SimEngine.stateVersion(), which also tells apart the events at the same simulated time), or when the mode
+        changes. The start of the UI tells apart a restarted simulation, e.g. resumed from a checkpoint.
+        '''
+        return '"{0:x}-{1}-{2}-{3}-{4}"'.format(
+            int(self.startTs),
+            self.simEngine.currentTime(),
+            self.simEngine.stateVersion(),
+            self.simEngine.mode(),
+            encoding,
+        )
+    
+    def _notModified(self,etag,lastModified=None):
+        '''
+        Set the validators of the response, and check them against those of the request.
+        
+        \return True if the client's copy is still valid, in which case the status is set to 304 and no body should be sent
+        '''
+        
+        bottle.response.set_header('ETag',etag)
+        bottle.response.set_header('Cache-Control','no-cache') # always revalidate
+        if lastModified is not None:
+            bottle.response.set_header('Last-Modified',bottle.http_date(lastModified))
+        
+        ifNoneMatch     = bottle.request.get_header('If-None-Match')
+        ifModifiedSince = bottle.request.get_header('If-Modified-Since')
+        if   ifNoneMatch is not None:
+            # ETag takes precedence over date
+            notModified = ifNoneMatch.strip()=='*' or etag in [e.strip() for e in ifNoneMatch.split(',')]
+        elif ifModifiedSince is not None and lastModified is not None:
+            since       = bottle.parse_date(ifModifiedSince.split(';')[0].strip())
+            notModified = since is not None and since>=int(lastModified)
+        else:
+            notModified = False
+        
+        if notModified:
+            bottle.response.status = 304
+        return notModified
+    
+    def _streamFrames(self,stream):
+        '''
+        Server-Sent Events, one delta frame every STREAMPERIOD, until the client disconnects.
+        '''
+        while True:
+            yield 'data: {0}\n\n'.format(json.dumps(stream.nextFrame()))
+            time.sleep(self.STREAMPERIOD)
+    
     #=== web server admin
     
     def _bottle_try_running_forever(self,*args,**kwargs):
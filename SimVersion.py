@@ -1,6 +1,7 @@
 MAJOR = 2
 MINOR = 0
 PATCH = 0
+MODEL = 1 # version of the simulation model: bump it whenever a change alters the results of a simSetting
 
 def formatVersion():
     return '{}.{}.{}'.format(MAJOR,MINOR,PATCH)
\ No newline at end of file
@@ -0,0 +1,273 @@
+# built-in
+import time
+import random
+import json
+import hashlib
+import pickle
+# third-party
+# local
+import SimVersion
+import Floorplan
+import DotBot
+import Orchestrator
+import Wireless
+import SimEngine
+import Protocol
+import Trace
+
+def fingerprint(simSetting):
+    '''
+    \return a hex digest identifying the results of simSetting, which includes its seed, e.g. to cache them on disk
+
+    Covers the version of the simulator and of its model (SimVersion.MODEL), so results are recomputed when either
+    changes.
+    '''
+    assert simSetting.get('seed') is not None
+    canonical = json.dumps([SimVersion.formatVersion(),SimVersion.MODEL,simSetting],sort_keys=True)
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+def saveCheckpoint(checkpoint,path):
+    with open(path,'wb') as f:
+        pickle.dump(checkpoint,f,protocol=pickle.HIGHEST_PROTOCOL)
+
+def loadCheckpoint(path):
+    '''
+    \return the checkpoint saved in path by saveCheckpoint()
+    '''
+    with open(path,'rb') as f:
+        checkpoint = pickle.load(f)
+    if checkpoint['version']!=SimVersion.formatVersion():
+        raise ValueError('checkpoint of version {0}, this is version {1}'.format(checkpoint['version'],SimVersion.formatVersion()))
+    return checkpoint
+
+class Simulation(object):
+    '''
+    A single simulation run.
+    
+    Owns every element of the simulation (engine, wireless medium, floorplan, DotBots and orchestrator),
+    so that several simulations can coexist, e.g. one after the other in the same process.
+    
+    Each element draws from its own random stream, derived from simSetting['seed']: the same simSetting gives the
+    same run. Without a seed, one is drawn from the global random module.
+    
+    If tracePath is set, the run is recorded into that file (see Trace.py), complete once close() is called.
+    If profile, the SimEngine measures where the time goes (see SimEngine.Profiler).
+    '''
+    
+    MAXDURATION = 2*60*60 # s, simulated time after which a headless simulation gives up on completing the map
+    
+    def __init__(self,simSetting,headless=False,tracePath=None,profile=False):
+        
+        # store params
+        self.simSetting      = simSetting
+        self.headless        = headless
+        
+        # local variables
+        self.seed            = simSetting.get('seed')
+        if self.seed is None:
+            self.seed        = random.getrandbits(64)
+        self.fingerprint     = fingerprint(dict(simSetting,seed=self.seed))
+        
+        # create the SimEngine
+        self.simEngine       = SimEngine.SimEngine(headless=headless,profile=profile)
+        if tracePath is not None:
+            self.simEngine.trace = Trace.TraceWriter(
+                tracePath,
+                meta         = {
+                    'version':       SimVersion.formatVersion(),
+                    'simSetting':    simSetting,
+                    'seed':          self.seed,
+                    'fingerprint':   self.fingerprint,
+                },
+            )
+        
+        # create the wireless communication
+        # Note: with packedFrames, frames are encoded as in PROTOCOL.md, so headings are limited to Protocol.HEADINGS
+        self.wireless        = Wireless.Wireless(
+            self.simEngine,
+            packed           = simSetting.get('packedFrames',False),
+            pdr              = simSetting.get('pdr'),
+            wirelessRange    = simSetting.get('wirelessRange'),
+            orchestratorPosition = simSetting['initialPosition'], # the DotBots are dropped next to the orchestrator
+            retransmit       = not simSetting.get('slotted',False),
+            rng              = self._stream('wireless'),
+        )
+        
+        # create the floorplan
+        self.floorplan       = Floorplan.Floorplan(
+            simSetting['floorplanDrawing'],
+            mergeObstacles   = simSetting.get('mergeObstacles',False),
+        )
+        
+        # create the DotBots
+        # Note: with packedFrames, they time their moves on the ticks of the timestamps of their reports. With selfTurns
+        #       (packedFrames only), they also turn by themselves while moving (see Protocol.nextTurn).
+        assert self.wireless.packed or not simSetting.get('selfTurns',False)
+        turns                = Protocol.nextTurn if simSetting.get('selfTurns',False) else None
+        self.dotBots         = []
+        for dotBotId in range(simSetting['numDotBots']):
+            self.dotBots    += [DotBot.DotBot(
+                dotBotId,self.floorplan,self.simEngine,self.wireless,
+                seed         = self.seed,
+                clock        = Protocol.quantize if self.wireless.packed else None,
+                turns        = turns,
+            )]
+        
+        # drop the DotBots on the floorplan at their initial position
+        (x,y) = simSetting['initialPosition']
+        for dotBot in self.dotBots:
+            dotBot.setInitialPosition(x,y)
+        
+        # create the orchestrator
+        self.orchestrator    = Orchestrator.Orchestrator(
+            [simSetting['initialPosition']]*len(self.dotBots),
+            self.floorplan,
+            self.simEngine,
+            self.wireless,
+            headings         = Protocol.HEADINGS if self.wireless.packed else None,
+            turns            = turns,
+            cycle            = Wireless.Wireless.CYCLE if simSetting.get('slotted',False) else None,
+            rng              = self._stream('orchestrator'),
+        )
+        
+        # create the optional vectorized backend
+        if simSetting.get('swarmBackend')=='numpy':
+            import DotBotSwarm # imported here so numpy is only needed when used
+            self.swarm       = DotBotSwarm.DotBotSwarm(self.dotBots,self.floorplan,self.simEngine)
+        else:
+            self.swarm       = None
+        
+        # indicate the elements to the wireless medium
+        self.wireless.indicateElements(self.dotBots,self.orchestrator,self.swarm)
+        
+        # schedule the first event
+        self.simEngine.schedule(0,self.orchestrator.startExploration)
+    
+    #======================== public ==========================================
+    
+    def isMapComplete(self):
+        return self.orchestrator.mapBuilder.discoMap['complete']
+    
+    def run(self,untilTs=None):
+        '''
+        Run a headless simulation in the calling thread until the map is complete (or untilTs is reached).
+        
+        \return a dict with the results of the simulation, the measurements of the SimEngine under 'profile' if profiling
+        '''
+        
+        if untilTs is None:
+            untilTs = self.MAXDURATION
+        
+        startTsReal  = time.time()
+        complete     = self.simEngine.runUntil(untilTs=untilTs,predicate=self.isMapComplete)
+        
+        returnVal    = {
+            'numDotBots':      self.simSetting['numDotBots'],
+            'seed':            self.seed,
+            'fingerprint':     self.fingerprint,
+            'complete':        complete,
+            'completionTime':  self.simEngine.currentTime() if complete else None,
+            'wallClockTime':   time.time()-startTsReal,
+        }
+        if self.simEngine.profiler is not None:
+            returnVal['profile'] = self.simEngine.profiler.getStats()
+        
+        return returnVal
+    
+    def checkpoint(self):
+        '''
+        \return the state of the simulation, as plain data (picklable), e.g. to resume it after a crash with
+        fromCheckpoint(), or to run variants of it from that point on.
+        
+        Events are described by the key of the element they call (see _elements()) and the name of the method, rather
+        than by the (bound) method itself. Take checkpoints between calls to run(), or with the simulation paused.
+        '''
+        elements   = {id(element): key for (key,element) in self._elements().items()}
+        
+        def describe(cb):
+            owner  = getattr(cb,'__self__',None)
+            if id(owner) not in elements:
+                raise ValueError('cannot checkpoint event calling {0!r}, not a method of an element'.format(cb))
+            return (elements[id(owner)],cb.__name__)
+        
+        return {
+            'version':       SimVersion.formatVersion(),
+            'simSetting':    self.simSetting,
+            'seed':          self.seed,
+            'fingerprint':   self.fingerprint,
+            'simEngine':     self.simEngine.getCheckpoint(describe),
+            'dotBots':       [dotBot.getCheckpoint() for dotBot in self.dotBots],
+            'orchestrator':  self.orchestrator.getCheckpoint(),
+            'wireless':      self.wireless.getCheckpoint(),
+        }
+    
+    @classmethod
+    def fromCheckpoint(cls,checkpoint,headless=False,tracePath=None,simSetting=None,profile=False):
+        '''
+        \return a Simulation in the state of checkpoint
+        
+        If simSetting is given, the simulation continues with those settings instead, e.g. another PDR. The DotBots,
+        their initial position and the floorplan need to be the same.
+        If profile, the SimEngine measures where the time goes from the checkpoint on (see SimEngine.Profiler).
+        '''
+        
+        original   = checkpoint['simSetting']
+        if simSetting is None:
+            simSetting = original
+        for key in ['numDotBots','floorplanDrawing','initialPosition']:
+            if simSetting[key]!=original[key]:
+                raise ValueError('cannot change {0} of a checkpointed simulation'.format(key))
+        
+        simulation = cls(dict(simSetting,seed=checkpoint['seed']),headless=headless,tracePath=tracePath,profile=profile)
+        if simSetting!=original:
+            # not the same run as from scratch with simSetting
+            simulation.fingerprint = fingerprint(dict(
+                simSetting,
+                seed         = checkpoint['seed'],
+                forkedFrom   = [checkpoint['fingerprint'],checkpoint['simEngine']['currentTime']],
+            ))
+        
+        elements   = simulation._elements()
+        for (dotBot,state) in zip(simulation.dotBots,checkpoint['dotBots']):
+            dotBot.setCheckpoint(state)
+        simulation.orchestrator.setCheckpoint(checkpoint['orchestrator'])
+        simulation.wireless.setCheckpoint(checkpoint['wireless'])
+        simulation.simEngine.setCheckpoint(
+            checkpoint['simEngine'],
+            lambda description: getattr(elements[description[0]],description[1]),
+        )
+        
+        return simulation
+    
+    def close(self):
+        '''
+        Write the end of the trace, if any.
+        '''
+        trace                = self.simEngine.trace
+        if trace is not None:
+            self.simEngine.trace = None # stop recording
+            trace.close()
+    
+    #======================== private =========================================
+    
+    def _elements(self):
+        '''
+        \return the elements events can call, by key
+        '''
+        returnVal = {
+            'orchestrator':  self.orchestrator,
+            'mapBuilder':    self.orchestrator.mapBuilder,
+            'wireless':      self.wireless,
+        }
+        for dotBot in self.dotBots:
+            returnVal['dotBot/{0}'.format(dotBot.dotBotId)] = dotBot
+        return returnVal
+    
+    def _stream(self,name):
+        '''
+        \return the random stream of an element of the simulation
+        
+        Seeding with a string is deterministic across processes (unlike hash()), and streams of different names are
+        independent.
+        '''
+        return random.Random('{0}/{1}'.format(self.seed,name))
@@ -0,0 +1,188 @@
+# built-in
+import struct
+import array
+import json
+import mmap
+import sys
+# third-party
+# local
+
+# Trace of a simulation run, written as it runs and read back for analysis.
+#
+# The file starts with MAGIC, followed by chunks. Each chunk starts with CHUNKHEADER (tag, number of rows, payload
+# length), followed by its payload:
+# - the 'META' chunk (first chunk) carries a JSON object describing the run (simSetting, seed, version...)
+# - the other chunks carry the rows of one record type (see RECORDS), buffered in memory and written CHUNKROWS rows at
+#   a time. The payload is one column after the other, each column an array of its type (little-endian), padded to 8
+#   bytes so that every column is aligned when the file is memory mapped.
+
+#======================== format ==============================================
+
+MAGIC              = b'DBTRACE1'
+CHUNKHEADER        = struct.Struct('<4sIQ') # tag, number of rows, payload length (bytes)
+CHUNKROWS          = 4096                   # rows buffered per record type before being written
+METATAG            = b'META'
+
+RECORDS            = { # record type -> (tag, [(column, array typecode)])
+    'bump':     (b'BUMP', [('ts','d'),('dotBotId','I'),('x','d'),('y','d')]),            # a DotBot bumped, at its real position
+    'trajectory': (b'TRAJ', [('ts','d'),('dotBotId','I'),('x','d'),('y','d'),('heading','d'),('speed','d'),
+                  ('next_bump_x','d'),('next_bump_y','d'),('next_bump_ts','d')]),        # the real trajectory of a DotBot changed, starting at (x,y) at ts
+    'command':  (b'CMND', [('ts','d'),('dotBotId','I'),('commandId','q'),('heading','d'),('speed','d'),
+                  ('x','d'),('y','d'),('posTs','d')]),                                   # the orchestrator changed a command, (x,y) at posTs is its view of the DotBot
+    'map':      (b'MAPC', [('ts','d'),('version','I'),('numDots','I'),('numLines','I'),('complete','B')]), # a consolidation changed the map
+    'mapdelta': (b'MAPD', [('ts','d'),('version','I'),('added','B'),('x1','d'),('y1','d'),('x2','d'),('y2','d')]), # dot (x2,y2 nan) or line added/removed
+    'complete': (b'DONE', [('ts','d')]),                                                   # the map is complete
+}
+
+def _padding(numBytes):
+    return -numBytes%8
+
+#======================== writer ==============================================
+
+class TraceWriter(object):
+    '''
+    Records a simulation run into a trace file.
+
+    Recording a row only appends its values to in-memory columns, the file is written once CHUNKROWS rows of a record
+    type are buffered, and at close().
+    '''
+
+    def __init__(self,path,meta):
+
+        # store params
+        self.path            = path
+
+        # local variables
+        self._file           = open(path,'wb')
+        self._columns        = {
+            kind: [array.array(typecode) for (name,typecode) in columns]
+            for (kind,(tag,columns)) in RECORDS.items()
+        }
+
+        # header
+        self._file.write(MAGIC)
+        self._writeChunk(METATAG,1,json.dumps(meta).encode())
+
+    #======================== public ==========================================
+
+    def record(self,kind,*row):
+        '''
+        Record a row of the given kind, the values in the order of the columns in RECORDS.
+        '''
+        columns = self._columns[kind]
+        for (column,value) in zip(columns,row):
+            column.append(value)
+        if len(columns[0])>=CHUNKROWS:
+            self._flush(kind)
+
+    def close(self):
+        if self._file is None:
+            return
+        for kind in self._columns:
+            self._flush(kind)
+        self._file.close()
+        self._file           = None
+
+    #======================== private =========================================
+
+    def _flush(self,kind):
+        columns = self._columns[kind]
+        if not len(columns[0]):
+            return
+        payload = bytearray()
+        for column in columns:
+            if sys.byteorder=='big':
+                column.byteswap()
+            payload += column.tobytes()
+            payload += bytes(_padding(len(payload)))
+        self._writeChunk(RECORDS[kind][0],len(columns[0]),payload)
+        self._columns[kind] = [array.array(column.typecode) for column in columns]
+
+    def _writeChunk(self,tag,numRows,payload):
+        self._file.write(CHUNKHEADER.pack(tag,numRows,len(payload)))
+        self._file.write(payload)
+        self._file.write(bytes(_padding(len(payload))))
+
+#======================== reader ==============================================
+
+class TraceReader(object):
+    '''
+    Reads a trace file back, memory mapped: columns are views on the file, nothing is copied until concatenated.
+    '''
+
+    def __init__(self,path):
+
+        # store params
+        self.path            = path
+
+        # local variables
+        self._file           = open(path,'rb')
+        self._mmap           = mmap.mmap(self._file.fileno(),0,access=mmap.ACCESS_READ)
+        self.meta            = None
+        self._chunks         = {kind: [] for kind in RECORDS} # kind -> [(offset,numRows)] of its chunks
+
+        assert self._mmap[:len(MAGIC)]==MAGIC, 'not a trace file'
+        kinds                = {tag: kind for (kind,(tag,columns)) in RECORDS.items()}
+        offset               = len(MAGIC)
+        while offset<len(self._mmap):
+            (tag,numRows,length) = CHUNKHEADER.unpack_from(self._mmap,offset)
+            offset          += CHUNKHEADER.size
+            if tag==METATAG:
+                self.meta    = json.loads(bytes(self._mmap[offset:offset+length]))
+            elif tag in kinds:
+                self._chunks[kinds[tag]] += [(offset,numRows)]
+            offset          += length+_padding(length) # unknown tags are skipped
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self,*args):
+        self.close()
+
+    #======================== public ==========================================
+
+    def numRows(self,kind):
+        return sum(numRows for (offset,numRows) in self._chunks[kind])
+
+    def chunks(self,kind):
+        '''
+        \return an iterator over the chunks of a record type, each a dict column -> memoryview on the mapped file
+
+        Assumes a little-endian host. Release the memoryviews before close().
+        '''
+        for spans in self._chunkSpans(kind):
+            yield {
+                name: memoryview(self._mmap)[offset:offset+length].cast(typecode)
+                for (name,typecode,offset,length) in spans
+            }
+
+    def read(self,kind):
+        '''
+        \return all the rows of a record type, as a dict column -> array.array
+        '''
+        returnVal            = {name: array.array(typecode) for (name,typecode) in RECORDS[kind][1]}
+        for spans in self._chunkSpans(kind):
+            for (name,typecode,offset,length) in spans:
+                returnVal[name].frombytes(self._mmap[offset:offset+length])
+        if sys.byteorder=='big':
+            for column in returnVal.values():
+                column.byteswap()
+        return returnVal
+
+    def close(self):
+        self._mmap.close()
+        self._file.close()
+
+    #======================== private =========================================
+
+    def _chunkSpans(self,kind):
+        '''
+        \return an iterator over the chunks of a record type, each a list of (column,typecode,offset,length)
+        '''
+        for (offset,numRows) in self._chunks[kind]:
+            spans            = []
+            for (name,typecode) in RECORDS[kind][1]:
+                length       = numRows*array.array(typecode).itemsize
+                spans       += [(name,typecode,offset,length)]
+                offset      += length+_padding(length)
+            yield spans
@@ -1,53 +1,269 @@
 # built-in
+import random
+import math
+import copy
 # third-party
+try:
+    import numpy as np
+except ImportError:
+    np = None # loss draws fall back to the random module
 # local
+import Protocol
 
 class Wireless(object):
     '''
     The wireless medium through which DotBot and orchestrator communicate.
     '''
     
-    PDR = 1
+    PDR   = 1    # Packet Delivery Ratio of a single transmission, next to the orchestrator
+    RANGE = None # m, distance to the orchestrator at which the PDR drops to 0 (linearly). None for no dependency on distance
+    CYCLE = 1    # s, period after which lost frames are retried (see PROTOCOL.md)
     
-    # singleton pattern
-    _instance   = None
-    _init       = False
-    def __new__(cls, *args, **kwargs):
-        if not cls._instance:
-            cls._instance = super(Wireless, cls).__new__(cls, *args, **kwargs)
-        return cls._instance
-    
-    def __init__(self):
+    def __init__(self,simEngine,packed=False,pdr=None,wirelessRange=None,orchestratorPosition=(0,0),retransmit=True,rng=None):
+        '''
+        If packed, frames are encoded as specified in PROTOCOL.md (see Protocol.py) before being handed over to the
+        receivers, which decode them. Otherwise, the Python objects are handed over as is; frame sizes and airtime are
+        accounted for as if they were encoded.
         
-        # singleton patterm
-        if self._init:
-            return
-        self._init = True
+        Links are lossy if pdr<1 or wirelessRange is set, see _pdr(). If retransmit, the last downstream frame is
+        broadcast again one cycle later while some DotBots missed their command; not needed if the orchestrator
+        broadcasts a frame every cycle anyway.
+        
+        rng is the random.Random instance losses are drawn from, None for the global random module.
+        '''
+        
+        # store params
+        self.simEngine    = simEngine
+        self.packed       = packed
+        self.pdr          = self.PDR   if pdr           is None else pdr
+        self.range        = self.RANGE if wirelessRange is None else wirelessRange
+        self.orchestratorPosition = orchestratorPosition
+        self.retransmit   = retransmit
+        self.rng          = random if rng is None else rng
         
         # local variables
         self.dotbots      = None
         self.orchestrator = None
+        self.swarm        = None # optional vectorized backend receiving downstream packets on behalf of all DotBots
+        self.lossy        = (self.pdr!=1) or (self.range is not None)
+        self.stats        = {
+            'numDownstreamFrames':       0, # number of frames broadcast by the orchestrator
+            'numDownstreamReceptions':   0, # number of (frame,DotBot) receptions, as every DotBot hears every frame
+            'numDownstreamDeliveries':   0, # number of receptions which carried a new command, and woke up a DotBot
+            'numUpstreamFrames':         0, # number of frames sent by DotBots
+            'numDownstreamPackets':      0, # number of frames on the air, a frame carrying at most Protocol.ROBOTSPERFRAME commands
+            'numUpstreamContentions':    0, # number of upstream frames which had to wait for the previous DotBot's slot to end
+            'numDownstreamLosses':       0, # number of new commands a DotBot did not receive (retried next cycle)
+            'numUpstreamLosses':         0, # number of upstream frames lost, to the link or to contention (retried next cycle)
+            'perSecond':                 {}, # second -> counters of the bytes and airtime in that second, see _countPerSecond()
+        }
+        self._downstreamBuf       = None  # payload of the downstream frames, updated in place (packed only)
+        self._upstreamBusyUntil   = 0     # end of the last upstream slot
+        self._pending             = set() # dotBotIds which missed their latest command
+        self._lastFrame           = None  # last downstream frame, retransmitted while some DotBots miss their command
+        self._retransmitScheduled = False
+        if self.lossy and np is not None:
+            self._rng             = np.random.default_rng(self.rng.getrandbits(64)) # reproducible under rng's seed
+        else:
+            self._rng             = None
     
     #======================== public ==========================================
     
-    def indicateElements(self,dotbots,orchestrator):
+    def indicateElements(self,dotbots,orchestrator,swarm=None):
         assert self.dotbots==None
         assert self.orchestrator==None
         
         self.dotbots      = dotbots
         self.orchestrator = orchestrator
+        self.swarm        = swarm
+        if self.packed:
+            self._downstreamBuf = Protocol.newDownstreamBuffer(len(dotbots))
     
-    def toDotBots(self,msg):
-        for dotbot in self.dotbots:
-            if self.PDR==1:
-                dotbot.fromOrchestrator(msg)
-            else:
-                raise NotImplementedError()
+    def toDotBots(self,msg,dotBotIds=None):
+        '''
+        Broadcast a downstream frame.
+        
+        dotBotIds lists the DotBots whose command in the frame is new. Only those are woken up, as the others would
+        discard it as duplicate anyway. If None, all DotBots are woken up.
+        '''
+        profiler = self.simEngine.profiler
+        if profiler is None:
+            self._toDotBots(msg,dotBotIds)
+        else:
+            profiler.call('Wireless.toDotBots',self._toDotBots,msg,dotBotIds)
     
     def toOrchestrator(self,msg):
-        if self.PDR==1:
-            self.orchestrator.fromDotBot(msg)
-        else:
-            raise NotImplementedError()
+        
+        now       = self.simEngine.currentTime()
+        
+        # encode/decode
+        # Note: timestamps are relative to when the frame is sent, so it is encoded again at every attempt
+        if self.packed:
+            msg = Protocol.decodeUpstream(Protocol.encodeUpstream(msg,now),now)
+        
+        # one DotBot at a time: measure how often a DotBot reports while the previous one still holds the medium
+        # Note: over lossless links, the frame is still delivered, contention is accounted for but not simulated
+        contended = now<self._upstreamBusyUntil
+        if contended:
+            self.stats['numUpstreamContentions'] += 1
+        self._upstreamBusyUntil = max(now,self._upstreamBusyUntil)+Protocol.UPSTREAMSLOT
+        
+        self.stats['numUpstreamFrames']         += 1
+        self._countPerSecond(
+            now,
+            upstreamBytes     = Protocol.UPSTREAMFRAMELEN,
+            upstreamAirtime   = Protocol.UPSTREAMSLOT,
+        )
+        
+        # over lossy links, a frame is lost if it collides or does not make it through; the DotBot retries in a
+        # random slot of the next cycle
+        if self.lossy and (contended or self.rng.random()>=self._pdr(self.dotbots[msg['dotBotId']])):
+            self.stats['numUpstreamLosses']     += 1
+            slot = self.rng.randrange(int(self.CYCLE/Protocol.UPSTREAMSLOT))
+            self.simEngine.schedule(
+                math.floor(now)+self.CYCLE+slot*Protocol.UPSTREAMSLOT,
+                self.toOrchestrator,
+                msg,
+            )
+            return
+        
+        self.orchestrator.fromDotBot(msg)
+    
+    def getCheckpoint(self):
+        '''
+        \return the state of the wireless medium, as plain data (see Simulation.checkpoint())
+        '''
+        return {
+            'stats':               copy.deepcopy(self.stats),
+            'downstreamBuf':       None if self._downstreamBuf is None else bytes(self._downstreamBuf),
+            'upstreamBusyUntil':   self._upstreamBusyUntil,
+            'pending':             sorted(self._pending),
+            'lastFrame':           self._lastFrame is not None, # always the orchestrator's frame, updated in place
+            'retransmitScheduled': self._retransmitScheduled,
+            'rng':                 self.rng.getstate() if isinstance(self.rng,random.Random) else None,
+            'npRng':               None if self._rng is None else self._rng.bit_generator.state,
+        }
+    
+    def setCheckpoint(self,checkpoint):
+        self.stats                 = copy.deepcopy(checkpoint['stats'])
+        if checkpoint['downstreamBuf'] is not None:
+            self._downstreamBuf    = bytearray(checkpoint['downstreamBuf'])
+        self._upstreamBusyUntil    = checkpoint['upstreamBusyUntil']
+        self._pending              = set(checkpoint['pending'])
+        self._lastFrame            = self.orchestrator.downstreamFrame if checkpoint['lastFrame'] else None
+        self._retransmitScheduled  = checkpoint['retransmitScheduled']
+        if checkpoint['rng'] is not None:
+            self.rng.setstate(checkpoint['rng'])
+        if checkpoint['npRng'] is not None and self._rng is not None:
+            self._rng.bit_generator.state = checkpoint['npRng']
     
     #======================== private =========================================
+    
+    def _toDotBots(self,msg,dotBotIds):
+        
+        if dotBotIds is None:
+            dotBotIds = range(len(self.dotbots))
+        
+        # encode (only the commands which changed)
+        if self.packed:
+            for dotBotId in dotBotIds:
+                command = msg[dotBotId]
+                Protocol.setCommand(self._downstreamBuf,dotBotId,Protocol.encodeCommand(command['heading'],command['speed']))
+            frame   = Protocol.DownstreamFrames(Protocol.splitDownstream(self._downstreamBuf))
+        else:
+            frame   = msg
+        
+        # every DotBot hears the frame
+        numBytes  = (len(self.dotbots)+1)//2
+        self.stats['numDownstreamFrames']       += 1
+        self.stats['numDownstreamPackets']      += -(-numBytes//Protocol.MAXFRAMELEN)
+        self.stats['numDownstreamReceptions']   += len(self.dotbots)
+        self._countPerSecond(
+            self.simEngine.currentTime(),
+            downstreamBytes   = numBytes,
+            downstreamAirtime = Protocol.downstreamAirtime(numBytes),
+        )
+        
+        # decide which DotBots receive it, including those which missed a previous command
+        if self.lossy:
+            (dotBotIds,lost) = self._drawDownstreamLosses(sorted(self._pending.union(dotBotIds)))
+            self.stats['numDownstreamLosses']   += len(lost)
+            self._pending    = set(lost)
+            self._lastFrame  = msg
+            if self.retransmit and self._pending and not self._retransmitScheduled:
+                self._retransmitScheduled = True
+                self.simEngine.schedule(
+                    self.simEngine.currentTime()+self.CYCLE,
+                    self._retransmitDownstream,
+                )
+        self.stats['numDownstreamDeliveries']   += len(dotBotIds)
+        
+        # deliver
+        if self.swarm is not None:
+            self.swarm.fromOrchestrator(frame,dotBotIds)
+        else:
+            for dotBotId in dotBotIds:
+                self.dotbots[dotBotId].fromOrchestrator(frame)
+    
+    def _pdr(self,dotbot):
+        '''
+        \return the PDR of a single transmission between a DotBot and the orchestrator
+        
+        Uses the position of the DotBot at its last bump, i.e. its current position for the DotBots that communicate
+        (they are stopped).
+        '''
+        if self.range is None:
+            return self.pdr
+        d = math.hypot(dotbot.x-self.orchestratorPosition[0],dotbot.y-self.orchestratorPosition[1])
+        return self.pdr*max(0,1-d/self.range)
+    
+    def _drawDownstreamLosses(self,dotBotIds):
+        '''
+        Decide which DotBots receive a downstream frame, sent NUMRETRANSMISSIONS times (constructive interference).
+        One batched draw for the whole frame if numpy is available.
+        
+        \return (received,lost) lists of dotBotIds
+        '''
+        if not dotBotIds:
+            return ([],[])
+        
+        n       = Protocol.NUMRETRANSMISSIONS
+        if self._rng is not None:
+            if self.range is None:
+                pdr = self.pdr
+            else:
+                x   = np.fromiter((self.dotbots[i].x for i in dotBotIds),dtype=float,count=len(dotBotIds))
+                y   = np.fromiter((self.dotbots[i].y for i in dotBotIds),dtype=float,count=len(dotBotIds))
+                d   = np.hypot(x-self.orchestratorPosition[0],y-self.orchestratorPosition[1])
+                pdr = self.pdr*np.maximum(0,1-d/self.range)
+            ok      = (self._rng.random(len(dotBotIds)) < 1-(1-pdr)**n).tolist()
+        else:
+            ok      = [self.rng.random() < 1-(1-self._pdr(self.dotbots[i]))**n for i in dotBotIds]
+        
+        received    = [i for (i,o) in zip(dotBotIds,ok) if o]
+        lost        = [i for (i,o) in zip(dotBotIds,ok) if not o]
+        return (received,lost)
+    
+    def _retransmitDownstream(self):
+        '''
+        Next cycle: the orchestrator broadcasts its frame again, for the DotBots which missed it.
+        '''
+        self._retransmitScheduled = False
+        if self._pending:
+            self.toDotBots(self._lastFrame,[])
+    
+    def _countPerSecond(self,ts,**counters):
+        '''
+        Add to the counters of second ts. Airtimes are in s, so a downstream+upstream airtime above 1 means the
+        wireless medium could not carry that second's traffic.
+        '''
+        second = int(ts)
+        if second not in self.stats['perSecond']:
+            self.stats['perSecond'][second] = {
+                'downstreamBytes':   0,
+                'downstreamAirtime': 0,
+                'upstreamBytes':     0,
+                'upstreamAirtime':   0,
+            }
+        for (k,v) in counters.items():
+            self.stats['perSecond'][second][k] += v
@@ -0,0 +1,94 @@
+'''
+Micro-benchmark of the SimEngine event queue.
+
+Run from the root of the repository:
+    python -m benchmarks.BenchEventQueue
+'''
+
+# built-in
+import random
+import time
+# third-party
+# local
+import SimEngine
+
+#============================ defines =========================================
+
+NUMPENDING       = [10**3,10**4,10**5,10**6] # number of events pending in the queue
+NUMOPS           = 10**4                     # number of schedule/pop pairs timed at each size
+LEGACYMAXPENDING = 10**4                     # the sorted-list queue is too slow beyond this
+
+#============================ helpers =========================================
+
+class LegacyEventQueue(object):
+    '''
+    The sorted-list event queue SimEngine used to have, for comparison.
+    '''
+    
+    def __init__(self):
+        self.events  = []
+    
+    def push(self,ts,cb):
+        self.events += [(ts,cb)]
+        self.events  = sorted(self.events, key = lambda e: e[0])
+    
+    def pop(self):
+        return self.events.pop(0)
+
+def _cb():
+    pass
+
+def benchQueue(eventQueue,numPending,numOps,rng):
+    '''
+    Fill the queue with numPending events, then time numOps (pop, schedule later) pairs,
+    which is what a DotBot does at each bump.
+    
+    \return the number of (pop,schedule) pairs per second
+    '''
+    
+    # fill
+    for _ in range(numPending):
+        eventQueue.push(rng.random(),_cb)
+    
+    # time steady state
+    startTs = time.perf_counter()
+    for _ in range(numOps):
+        eventQueue.pop()
+        eventQueue.push(1+rng.random(),_cb)
+    duration = time.perf_counter()-startTs
+    
+    return numOps/duration
+
+def benchCancel(numPending,rng):
+    '''
+    \return the number of cancel operations per second in a queue holding numPending events
+    '''
+    
+    eventQueue = SimEngine.EventQueue()
+    events     = [eventQueue.push(rng.random(),_cb) for _ in range(numPending)]
+    rng.shuffle(events)
+    
+    numOps     = min(NUMOPS,numPending)
+    startTs    = time.perf_counter()
+    for event in events[:numOps]:
+        event.cancel()
+    duration   = time.perf_counter()-startTs
+    
+    return numOps/duration
+
+#============================ main ============================================
+
+def main():
+    rng = random.Random(0)
+    print('{0:>10} {1:>18} {2:>18} {3:>18}'.format('pending','heap ops/s','sorted-list ops/s','cancel ops/s'))
+    for numPending in NUMPENDING:
+        heapRate       = benchQueue(SimEngine.EventQueue(),numPending,NUMOPS,rng)
+        if numPending<=LEGACYMAXPENDING:
+            legacyRate = '{0:>18.0f}'.format(benchQueue(LegacyEventQueue(),numPending,NUMOPS//100,rng))
+        else:
+            legacyRate = '{0:>18}'.format('-')
+        cancelRate     = benchCancel(numPending,rng)
+        print('{0:>10} {1:>18.0f} {2} {3:>18.0f}'.format(numPending,heapRate,legacyRate,cancelRate))
+
+if __name__=='__main__':
+    main()
@@ -0,0 +1,84 @@
+'''
+Memory used per DotBot by the state of the swarm: the DotBot objects (slotted) and the orchestrator's view
+(typed arrays), compared to the previous layout (one __dict__ per DotBot, one dict per DotBot in the view).
+
+Run from the root of the repository:
+    python -m benchmarks.BenchMemory
+'''
+
+# built-in
+import random
+import types
+import math
+import tracemalloc
+# third-party
+# local
+import DotBot
+import Orchestrator
+
+#============================ defines =========================================
+
+NUMDOTBOTS       = [1000,10000,100000]
+
+#============================ helpers =========================================
+
+def measure(build):
+    '''
+    \return the number of bytes allocated by build(), and still referenced once it returns
+    '''
+    tracemalloc.start()
+    startSize     = tracemalloc.get_traced_memory()[0]
+    result        = build()
+    size          = tracemalloc.get_traced_memory()[0]-startSize
+    tracemalloc.stop()
+    del result
+    return size
+
+def slottedDotBots(positions):
+    dotbots = []
+    for (dotBotId,(x,y)) in enumerate(positions):
+        dotbot   = DotBot.DotBot(dotBotId,None,None,None)
+        dotbot.x = x
+        dotbot.y = y
+        dotbots += [dotbot]
+    return dotbots
+
+def dictDotBots(positions):
+    # same attributes, in a per-instance __dict__
+    dotbots = []
+    for (dotBotId,(x,y)) in enumerate(positions):
+        dotbot   = DotBot.DotBot(dotBotId,None,None,None)
+        dotbot.x = x
+        dotbot.y = y
+        dotbots += [types.SimpleNamespace(**{k: getattr(dotbot,k) for k in DotBot.DotBot.__slots__})]
+    return dotbots
+
+def arrayView(positions):
+    return Orchestrator.DotBotsView(positions)
+
+def dictView(positions):
+    return [
+        {
+            'x':           x,
+            'y':           y,
+            'posTs':       0,
+            'heading':     0,
+            'dx':          math.cos(math.radians(-90)),
+            'dy':          math.sin(math.radians(-90)),
+            'speed':       0,
+            'commandId':   0,
+        } for (x,y) in positions
+    ]
+
+#============================ main ============================================
+
+def main():
+    rng = random.Random(0)
+    print('{0:>10} {1:>14} {2:>14} {3:>14} {4:>14}'.format('DotBots','dotbot B/bot','(dict) B/bot','view B/bot','(dict) B/bot'))
+    for numDotBots in NUMDOTBOTS:
+        positions    = [(rng.uniform(0,100),rng.uniform(0,100)) for _ in range(numDotBots)]
+        sizes        = [measure(lambda: build(positions)) for build in [slottedDotBots,dictDotBots,arrayView,dictView]]
+        print('{0:>10} {1:>14.0f} {2:>14.0f} {3:>14.0f} {4:>14.0f}'.format(numDotBots,*[size/numDotBots for size in sizes]))
+
+if __name__=='__main__':
+    main()
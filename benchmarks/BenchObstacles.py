@@ -0,0 +1,63 @@
+'''
+Benchmark of DotBot._computeNextBump versus the number of obstacles in the floorplan,
+with and without the obstacle index.
+
+Run from the root of the repository:
+    python -m benchmarks.BenchObstacles
+'''
+
+# built-in
+import random
+import time
+# third-party
+# local
+import Floorplan
+import DotBot
+
+#============================ defines =========================================
+
+SIZES            = [20,50,100,200] # side, in m, of the (square) floorplans
+DENSITY          = 0.10            # portion of the floorplan covered by obstacles
+NUMBUMPS         = 1000            # number of bumps computed per floorplan
+
+#============================ helpers =========================================
+
+def randomDrawing(size,density,rng):
+    return '\n'.join(
+        ''.join('#' if rng.random()<density else '.' for _ in range(size))
+        for _ in range(size)
+    )
+
+def benchNextBump(floorplan,trajectories):
+    '''
+    \return the number of bumps computed per second
+    '''
+    dotBot = DotBot.DotBot(0,floorplan,None,None)
+    
+    startTs = time.perf_counter()
+    for (x,y,heading) in trajectories:
+        dotBot.x             = x
+        dotBot.y             = y
+        dotBot._setHeading(heading)
+        dotBot.speedActual   = 1
+        dotBot._computeNextBump()
+    duration = time.perf_counter()-startTs
+    
+    return len(trajectories)/duration
+
+#============================ main ============================================
+
+def main():
+    rng = random.Random(0)
+    print('{0:>10} {1:>18} {2:>18} {3:>10}'.format('obstacles','indexed bumps/s','linear bumps/s','speedup'))
+    for size in SIZES:
+        drawing      = randomDrawing(size,DENSITY,rng)
+        trajectories = [(round(rng.uniform(0,size),3),round(rng.uniform(0,size),3),rng.randint(0,359)) for _ in range(NUMBUMPS)]
+        indexed      = Floorplan.Floorplan(drawing,indexObstacles=True)
+        linear       = Floorplan.Floorplan(drawing,indexObstacles=False)
+        indexedRate  = benchNextBump(indexed,trajectories)
+        linearRate   = benchNextBump(linear, trajectories)
+        print('{0:>10} {1:>18.0f} {2:>18.0f} {3:>9.1f}x'.format(len(indexed.obstacles),indexedRate,linearRate,indexedRate/linearRate))
+
+if __name__=='__main__':
+    main()
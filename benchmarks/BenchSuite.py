@@ -0,0 +1,308 @@
+'''
+Benchmark suite of the hot paths of the simulator, and of complete runs, with results emitted as JSON so they can be
+compared across commits.
+
+All inputs are drawn from fixed seeds. Every metric is a duration in seconds (lower is better), the best of REPEAT
+measurements.
+
+Run from the root of the repository:
+    python -m benchmarks.BenchSuite --out bench.json
+    python -m benchmarks.BenchSuite --quick --compare bench.json
+'''
+
+# built-in
+import argparse
+import json
+import platform
+import random
+import subprocess
+import sys
+import time
+import timeit
+# third-party
+try:
+    import numpy
+except ImportError:
+    numpy = None
+# local
+import SimVersion
+import SimEngine
+import Floorplan
+import Orchestrator
+import Simulation
+import RunSim
+from benchmarks import BenchEventQueue
+from benchmarks import BenchObstacles
+
+#============================ defines =========================================
+
+REPEAT           = 5
+REGRESSION       = 1.2 # ratio to the baseline above which --compare flags a metric
+
+SIZES            = { # parameters of each benchmark, full and --quick
+    'eventQueue':    ([10**3,10**4,10**5,10**6], [10**3,10**5]),          # number of pending events
+    'nextBump':      ([20,50,100,200],           [20,100]),               # side of the floorplan, in m
+    'map':           ([10**2,10**3,10**4],       [10**2,10**3]),          # number of dots
+    'view':          ([10,10**2,10**3,10**4],    [10,10**3]),             # number of DotBots
+    'endToEnd':      ([10,10**2,10**3,10**4],    [10,10**2]),             # number of DotBots
+    'swarm':         ([32,128,512,2048],         [32,512]),               # number of DotBots computing their next bump at once
+}
+
+#============================ helpers =========================================
+
+def best(stmt,number=None,setup=None):
+    '''
+    \return the shortest duration of stmt(), in s per call, over REPEAT measurements of number calls (by default, as
+    many as take 0.2 s)
+    '''
+    timer      = timeit.Timer(stmt,setup=setup or (lambda: None),timer=time.perf_counter)
+    if number is None:
+        (number,_) = timer.autorange()
+    return min(timer.repeat(repeat=REPEAT,number=number))/number
+
+def gitCommit():
+    try:
+        return subprocess.check_output(['git','rev-parse','HEAD'],stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError,subprocess.CalledProcessError):
+        return None
+
+#=== benchmarks, each returns a list of rows {'params','metrics'[,'info']}
+
+def benchEventQueue(sizes):
+    returnVal = []
+    for numPending in sizes:
+        rng        = random.Random(0)
+        queue      = SimEngine.EventQueue()
+        for _ in range(numPending):
+            queue.push(rng.random(),BenchEventQueue._cb)
+
+        def popPush():
+            queue.pop()
+            queue.push(1+rng.random(),BenchEventQueue._cb)
+
+        returnVal += [{
+            'params':      {'numPending': numPending},
+            'metrics':     {'popPush': best(popPush)},
+        }]
+    return returnVal
+
+def benchNextBump(sizes):
+    returnVal = []
+    rng       = random.Random(0)
+    for size in sizes:
+        drawing      = BenchObstacles.randomDrawing(size,BenchObstacles.DENSITY,rng)
+        floorplan    = Floorplan.Floorplan(drawing)
+        trajectories = [(round(rng.uniform(0,size),3),round(rng.uniform(0,size),3),rng.randint(0,359)) for _ in range(BenchObstacles.NUMBUMPS)]
+        returnVal   += [{
+            'params':      {'size': size, 'numObstacles': len(floorplan.obstacles)},
+            'metrics':     {'nextBump': 1/max(BenchObstacles.benchNextBump(floorplan,trajectories) for _ in range(REPEAT))},
+        }]
+    return returnVal
+
+def closedRooms(numDots,rng):
+    '''
+    \return numDots dots (about) on the walls of square rooms, in random order: a complete map once consolidated
+    '''
+    (side,spacing) = (6,0.5)
+    perRoom        = int(4*side/spacing)
+    numRooms       = max(1,numDots//perRoom)
+    perRow         = int(numRooms**0.5)+1
+    dots           = []
+    for room in range(numRooms):
+        (x0,y0)    = (10*(room%perRow),10*(room//perRow))
+        for i in range(int(side/spacing)):
+            d      = i*spacing
+            dots  += [(x0+d,y0),(x0+side,y0+d),(x0+side-d,y0+side),(x0,y0+side-d)]
+    rng.shuffle(dots)
+    return dots
+
+def benchMap(sizes):
+    returnVal = []
+    for numDots in sizes:
+        dots              = closedRooms(numDots,random.Random(0))
+        mapBuilders       = []
+
+        def newMapBuilder():
+            mapBuilder    = Orchestrator.MapBuilder(SimEngine.SimEngine(headless=True),periodic=False)
+            for (x,y) in dots:
+                mapBuilder.notifBump(x,y)
+            mapBuilders.append(mapBuilder)
+
+        def isMapComplete():
+            assert mapBuilders[-1]._isMapComplete()
+
+        returnVal        += [{
+            'params':      {'numDots': len(dots)},
+            'metrics':     {
+                'consolidateMap': best(lambda: mapBuilders[-1]._consolidateMap(),number=1,setup=newMapBuilder),
+                'isMapComplete':  best(isMapComplete),
+            },
+        }]
+    return returnVal
+
+def benchView(sizes):
+    import bottle # imported here so the other benchmarks do not need bottle
+    import SimUI
+    returnVal = []
+    for numDotBots in sizes:
+        simulation     = Simulation.Simulation(dict(RunSim.SIMSETTINGS[0],numDotBots=numDotBots,seed=0),headless=True)
+        simulation.run(untilTs=10)
+
+        # the web handler, without starting the web server
+        simUI          = SimUI.SimUI.__new__(SimUI.SimUI)
+        simUI.dotbots  = simulation.dotBots
+        simUI.orchestrator = simulation.orchestrator
+        simUI.simEngine    = simulation.simEngine
+        simUI.startTs      = time.time()
+        bottle.request.bind({})
+        bottle.response.bind()
+
+        returnVal     += [{
+            'params':      {'numDotBots': numDotBots},
+            'metrics':     {
+                'getView':           best(simulation.orchestrator.getView),
+                'dotbotsJSON':       best(lambda: json.dumps(simUI._webhandle_dotbots_GET())),
+                'packView':          best(lambda: SimUI.packView(simulation)),
+            },
+        }]
+    return returnVal
+
+def benchEndToEnd(sizes):
+    returnVal = []
+    for numDotBots in sizes:
+        simSetting     = dict(RunSim.SIMSETTINGS[0],numDotBots=numDotBots,seed=0)
+        results        = []
+
+        def run():
+            results.append(Simulation.Simulation(simSetting,headless=True).run())
+
+        returnVal     += [{
+            'params':      {'numDotBots': numDotBots},
+            'metrics':     {'timeToComplete': best(run,number=1)},
+            'info':        {'completionTime': results[-1]['completionTime']}, # simulated, the same for every repetition
+        }]
+    return returnVal
+
+def benchSwarm(sizes):
+    '''
+    Next bump of a batch of DotBots one by one (DotBot._computeNextBump()) vs vectorized
+    (DotBotSwarm.computeNextBumps(), MINBATCH ignored), and slotted runs with either backend.
+    '''
+    if numpy is None:
+        return []
+    import DotBot
+    import DotBotSwarm
+    returnVal = []
+    rng       = random.Random(0)
+    floorplan = Floorplan.Floorplan(BenchObstacles.randomDrawing(100,BenchObstacles.DENSITY,rng))
+    for numDotBots in sizes:
+        dotbots        = []
+        for dotBotId in range(numDotBots):
+            dotbot              = DotBot.DotBot(dotBotId,floorplan,None,None)
+            (dotbot.x,dotbot.y) = (round(rng.uniform(0,floorplan.width),3),round(rng.uniform(0,floorplan.height),3))
+            dotbot.posTs        = 0
+            dotbot._setHeading(rng.randint(0,359))
+            dotbot.speedActual  = 1
+            dotbots            += [dotbot]
+        swarm          = DotBotSwarm.DotBotSwarm(dotbots,floorplan)
+        swarm.MINBATCH = 0
+
+        def run(swarmBackend):
+            simSetting = dict(RunSim.SIMSETTINGS[0],numDotBots=numDotBots,slotted=True,seed=0,swarmBackend=swarmBackend)
+            return best(lambda: Simulation.Simulation(simSetting,headless=True).run(),number=1)
+
+        returnVal     += [{
+            'params':      {'numDotBots': numDotBots},
+            'metrics':     {
+                'scalarBatch':    best(lambda: [dotbot._computeNextBump() for dotbot in dotbots]),
+                'numpyBatch':     best(lambda: swarm.computeNextBumps(dotbots)),
+                'scalarRun':      run(None),
+                'numpyRun':       run('numpy'),
+            },
+        }]
+    return returnVal
+
+BENCHMARKS = {
+    'eventQueue':    benchEventQueue,
+    'nextBump':      benchNextBump,
+    'map':           benchMap,
+    'view':          benchView,
+    'endToEnd':      benchEndToEnd,
+    'swarm':         benchSwarm,
+}
+
+#=== output
+
+def runSuite(names,quick=False):
+    '''
+    \return the results of the benchmarks, as plain data (JSON-serializable)
+    '''
+    returnVal = {
+        'meta':        {
+            'version':     SimVersion.formatVersion(),
+            'commit':      gitCommit(),
+            'python':      platform.python_version(),
+            'platform':    platform.platform(),
+            'numpy':       None if numpy is None else numpy.__version__,
+            'quick':       quick,
+            'timestamp':   time.strftime('%Y-%m-%dT%H:%M:%S'),
+        },
+        'results':     {},
+    }
+    for name in names:
+        print('running {0}...'.format(name),file=sys.stderr)
+        returnVal['results'][name] = BENCHMARKS[name](SIZES[name][1 if quick else 0])
+    return returnVal
+
+def compare(baseline,current):
+    '''
+    Print, for each metric measured in both, the ratio current/baseline.
+
+    \return the number of metrics at least REGRESSION times slower than in the baseline
+    '''
+    numRegressions = 0
+    for (name,rows) in current['results'].items():
+        baselineRows = {json.dumps(row['params'],sort_keys=True): row for row in baseline['results'].get(name,[])}
+        for row in rows:
+            baselineRow = baselineRows.get(json.dumps(row['params'],sort_keys=True))
+            if baselineRow is None:
+                continue
+            for (metric,value) in row['metrics'].items():
+                if metric not in baselineRow['metrics']:
+                    continue
+                ratio   = value/baselineRow['metrics'][metric]
+                flag    = ''
+                if ratio>=REGRESSION:
+                    flag = 'REGRESSION'
+                    numRegressions += 1
+                print('{0:<10} {1:<40} {2:<16} {3:>12.3g} {4:>12.3g} {5:>7.2f}x {6}'.format(
+                    name,json.dumps(row['params']),metric,baselineRow['metrics'][metric],value,ratio,flag,
+                ))
+    return numRegressions
+
+#============================ main ============================================
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--only',    nargs='+', choices=sorted(BENCHMARKS), default=list(BENCHMARKS), help='benchmarks to run')
+    parser.add_argument('--quick',   action='store_true', help='smaller sizes, e.g. to check a change')
+    parser.add_argument('--out',     help='write the results to this JSON file (default: stdout)')
+    parser.add_argument('--compare', help='JSON file of a previous run, to compare the results to')
+    args   = parser.parse_args()
+
+    results = runSuite(args.only,quick=args.quick)
+
+    if args.out:
+        with open(args.out,'w') as f:
+            json.dump(results,f,indent=4)
+    else:
+        print(json.dumps(results,indent=4))
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if compare(baseline,results):
+            sys.exit(1)
+
+if __name__=='__main__':
+    main()
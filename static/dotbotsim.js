@@ -1,6 +1,8 @@
 var scaleFactor    = 1;
 var dotbotcolors   = d3.scaleOrdinal(d3.schemeCategory10).range();
 
+var streamState    = null; // state of the simulation, as received from /stream
+
 var playbuttonMinX     = 175
 var playbuttonMaxX     = 285
 var playbuttonMinSpeed =   1.00
@@ -81,6 +83,166 @@ function getDotBots() {
     });
 }
 
+function getDotBotsBin() {
+    fetch("/dotbots.bin")
+        .then(function(response) { return response.arrayBuffer(); })
+        .then(function(buffer)   { drawDotBots(decodeDotBotsBin(buffer)); });
+}
+
+function decodeDotBotsBin(buffer) {
+    // see packView() in SimUI.py for the format
+    var binmodes   = ['pause','frameforward','play','fastforward'];
+    var header     = new DataView(buffer,0,24);
+    var numDotBots = header.getUint32( 0,true);
+    var numDots    = header.getUint32( 4,true);
+    var numLines   = header.getUint32( 8,true);
+    var mode       = header.getUint8(  12);
+    var complete   = header.getUint8(  13);
+    var numFields  = header.getUint16( 14,true);
+    var now        = header.getFloat64(16,true);
+    var values     = new Float32Array(buffer,24,numDotBots*numFields+2*numDots+4*numLines);
+    var dotbots    = [];
+    for (var i=0; i<numDotBots; i++) {
+        var o = i*numFields;
+        dotbots.push({
+            x:                  values[o+0],
+            y:                  values[o+1],
+            heading:            values[o+2],
+            orchestratorview_x: values[o+3],
+            orchestratorview_y: values[o+4],
+            next_bump_x:        isNaN(values[o+5]) ? null : values[o+5],
+            next_bump_y:        isNaN(values[o+6]) ? null : values[o+6],
+        });
+    }
+    var offset     = numDotBots*numFields;
+    var dots       = [];
+    for (var i=0; i<numDots; i++) {
+        dots.push(Array.from(values.subarray(offset+2*i,offset+2*i+2)));
+    }
+    offset        += 2*numDots;
+    var lines      = [];
+    for (var i=0; i<numLines; i++) {
+        lines.push(Array.from(values.subarray(offset+4*i,offset+4*i+4)));
+    }
+    return {
+        mode:          binmodes[mode],
+        simulatedTime: '[ '+new Date(now*1000).toISOString().substr(11,8)+' simulated ]',
+        dotbots:       dotbots,
+        discomap:      {
+            complete:  complete==1,
+            dots:      dots,
+            lines:     lines,
+        },
+    };
+}
+
+function startPolling() {
+    // binary payload if the browser can decode it
+    var poll = (typeof(fetch)=="undefined" || typeof(DataView)=="undefined") ? getDotBots : getDotBotsBin;
+    poll();
+    setInterval(poll, 100);
+}
+
+function listenToStream() {
+    // receive delta frames from the server, extrapolate positions in between
+    // returns false if not supported by the browser, in which case the caller falls back to polling
+    if (typeof(EventSource)=="undefined") {
+        return false;
+    }
+    streamState = {
+        now:           0,     // simulated time in last frame
+        wall:          0,     // wall-clock time (s) at which last frame was received
+        rate:          0,     // simulated seconds per wall-clock second, estimated from the last two frames
+        mode:          'pause',
+        simulatedTime: '',
+        dotbots:       [],
+        complete:      false,
+        dots:          new Map(),
+        lines:         new Map(),
+    };
+    var opened = false;
+    var source = new EventSource("/stream");
+    source.onopen = function() {
+        // the server starts each connection with the full state
+        opened = true;
+        streamState.dots.clear();
+        streamState.lines.clear();
+    };
+    source.onmessage = function(e) {
+        applyDeltaFrame(JSON.parse(e.data));
+    };
+    source.onerror = function() {
+        if (opened==false) {
+            // server does not stream, poll instead
+            source.close();
+            startPolling();
+        }
+    };
+    setInterval(function() {
+        if (opened==true) {
+            drawDotBots(extrapolateStreamState());
+        }
+    }, 100);
+    return true;
+}
+
+function applyDeltaFrame(frame) {
+    var wall = Date.now()/1000;
+    if (streamState.wall>0 && wall>streamState.wall) {
+        streamState.rate = (frame.now-streamState.now)/(wall-streamState.wall);
+    }
+    streamState.now           = frame.now;
+    streamState.wall          = wall;
+    streamState.mode          = frame.mode;
+    streamState.simulatedTime = frame.simulatedTime;
+    frame.dotbots.forEach(function(d) {
+        streamState.dotbots[d.id] = d;
+    });
+    if (frame.discomap !== undefined) {
+        streamState.complete = frame.discomap.complete;
+        frame.discomap.dotsRemoved.forEach( function(d) { streamState.dots.delete(d.join());  });
+        frame.discomap.dotsAdded.forEach(   function(d) { streamState.dots.set(d.join(),d);   });
+        frame.discomap.linesRemoved.forEach(function(l) { streamState.lines.delete(l.join()); });
+        frame.discomap.linesAdded.forEach(  function(l) { streamState.lines.set(l.join(),l);  });
+    }
+}
+
+function extrapolateStreamState() {
+    // where the DotBots are now, given where they were, their heading and speed
+    var now = streamState.now;
+    if (streamState.mode=='play' || streamState.mode=='fastforward') {
+        now += streamState.rate*(Date.now()/1000-streamState.wall);
+    }
+    function position(d,t) {
+        var angle = (d.heading-90)*Math.PI/180;
+        return [d.x+(t-d.posTs)*Math.cos(angle)*d.speed, d.y+(t-d.posTs)*Math.sin(angle)*d.speed];
+    }
+    var dotbots = streamState.dotbots.map(function(d) {
+        // a DotBot stops at its next bump
+        var t    = (d.next_bump_ts!==null && now>d.next_bump_ts) ? d.next_bump_ts : now;
+        var pos  = position(d,t);
+        var view = position(d.orchestratorview,now);
+        return {
+            x:                  pos[0],
+            y:                  pos[1],
+            next_bump_x:        d.next_bump_x,
+            next_bump_y:        d.next_bump_y,
+            orchestratorview_x: view[0],
+            orchestratorview_y: view[1],
+        };
+    });
+    return {
+        mode:          streamState.mode,
+        simulatedTime: streamState.simulatedTime,
+        dotbots:       dotbots,
+        discomap:      {
+            complete:  streamState.complete,
+            dots:      Array.from(streamState.dots.values()),
+            lines:     Array.from(streamState.lines.values()),
+        },
+    };
+}
+
 function drawDotBots(data) {
     var svg    = d3.select("#floorplan");
     
@@ -0,0 +1,58 @@
+import math
+import random
+
+import pytest
+
+import Floorplan
+import DotBot
+import RunSim
+import Simulation
+
+def _nextBump(floorplan,x,y,heading):
+    dotBot               = DotBot.DotBot(0,floorplan,None,None)
+    dotBot.x             = x
+    dotBot.y             = y
+    dotBot._setHeading(heading)
+    dotBot.speedActual   = 1
+    return dotBot._computeNextBump()
+
+def test_obstacle_index_same_bump_as_linear_search():
+    rng = random.Random(0)
+    for _ in range(50):
+        (width,height) = (rng.randint(3,30),rng.randint(3,30))
+        drawing        = '\n'.join(''.join('#' if rng.random()<0.2 else '.' for _ in range(width)) for _ in range(height))
+        indexed        = Floorplan.Floorplan(drawing,indexObstacles=True)
+        linear         = Floorplan.Floorplan(drawing,indexObstacles=False)
+        for _ in range(20):
+            if rng.random()<0.5:
+                # on the grid, to exercise trajectories along cell borders
+                (x,y)  = (rng.randint(0,width),rng.randint(0,height))
+            else:
+                (x,y)  = (round(rng.uniform(0,width),3),round(rng.uniform(0,height),3))
+            heading    = rng.choice([0,90,180,270,45,rng.randint(0,359)])
+            assert _nextBump(indexed,x,y,heading) == _nextBump(linear,x,y,heading)
+
+def test_inaccuracy_stream():
+    headings = []
+    for _ in range(2):
+        dotBot                   = DotBot.DotBot(3,None,None,None,seed=7)
+        dotBot.headingInaccuracy = 5
+        dotBot._setHeading(90)
+        headings                += [dotBot.headingActual]
+    assert headings[0] == headings[1]
+    assert headings[0] != 90
+
+@pytest.mark.parametrize('withNumpy',[True,False])
+def test_attitudes_match_attitude(withNumpy,monkeypatch):
+    if not withNumpy:
+        monkeypatch.setattr(DotBot,'np',None)
+    random.seed(0)
+    simulation = Simulation.Simulation(RunSim.SIMSETTINGS[0],headless=True)
+    simulation.simEngine.runUntil(untilTs=20.5)
+    attitudes  = DotBot.getAttitudes(simulation.dotBots,simulation.simEngine.currentTime())
+    for (i,dotbot) in enumerate(simulation.dotBots):
+        for (k,v) in dotbot.getAttitude().items():
+            if v is None:
+                assert math.isnan(attitudes[k][i])
+            else:
+                assert attitudes[k][i]==v
@@ -0,0 +1,43 @@
+import random
+
+import pytest
+
+import Floorplan
+import DotBot
+import RunSim
+import Simulation
+
+np          = pytest.importorskip('numpy')
+DotBotSwarm = pytest.importorskip('DotBotSwarm')
+
+@pytest.mark.parametrize('indexObstacles',[True,False])
+def test_vectorized_bumps_match_scalar(indexObstacles):
+    rng = random.Random(0)
+    for _ in range(30):
+        (width,height) = (rng.randint(3,30),rng.randint(3,30))
+        drawing        = '\n'.join(''.join('#' if rng.random()<0.15 else '.' for _ in range(width)) for _ in range(height))
+        floorplan      = Floorplan.Floorplan(drawing,indexObstacles=indexObstacles)
+        dotbots        = []
+        for dotBotId in range(20):
+            dotbot               = DotBot.DotBot(dotBotId,floorplan,None,None)
+            if rng.random()<0.5:
+                (dotbot.x,dotbot.y) = (rng.randint(0,width),rng.randint(0,height))
+            else:
+                (dotbot.x,dotbot.y) = (round(rng.uniform(0,width),3),round(rng.uniform(0,height),3))
+            dotbot.posTs         = 1.5
+            dotbot._setHeading(rng.choice([0,90,180,270,rng.randint(0,359)]))
+            dotbot.speedActual   = 1
+            dotbots             += [dotbot]
+        swarm                   = DotBotSwarm.DotBotSwarm(dotbots,floorplan)
+        swarm.MINBATCH          = 0 # vectorized, even for a few DotBots
+        (bump_x,bump_y,bump_ts) = swarm.computeNextBumps(dotbots)
+        for (i,dotbot) in enumerate(dotbots):
+            assert dotbot._computeNextBump()==(bump_x[i],bump_y[i],bump_ts[i])
+
+def test_swarm_backend_same_run():
+    results = []
+    for swarmBackend in [None,'numpy']:
+        simSetting = dict(RunSim.SIMSETTINGS[0],numDotBots=500,slotted=True,seed=0,swarmBackend=swarmBackend)
+        results   += [Simulation.Simulation(simSetting,headless=True).run()]
+    assert results[0]['complete']
+    assert results[0]['completionTime']==results[1]['completionTime']
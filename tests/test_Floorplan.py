@@ -0,0 +1,25 @@
+import random
+
+import Floorplan
+
+def _cells(obstacles):
+    cells = []
+    for o in obstacles:
+        cells += [(o['x']+i,o['y']+j) for i in range(o['width']) for j in range(o['height'])]
+    return cells
+
+def test_merge_obstacles_covers_same_cells():
+    rng = random.Random(0)
+    for _ in range(50):
+        drawing  = '\n'.join(''.join('#' if rng.random()<0.5 else '.' for _ in range(rng.randint(1,20))) for _ in range(rng.randint(1,20)))
+        single   = Floorplan.Floorplan(drawing)
+        merged   = Floorplan.Floorplan(drawing,mergeObstacles=True)
+        assert (merged.width,merged.height) == (single.width,single.height)
+        assert len(merged.obstacles) <= len(single.obstacles)
+        cells    = _cells(merged.obstacles)
+        assert len(cells) == len(set(cells)) # no overlap
+        assert set(cells) == set(_cells(single.obstacles))
+
+def test_merge_obstacles_block():
+    floorplan = Floorplan.Floorplan('.##.\n.##.\n....',mergeObstacles=True)
+    assert floorplan.obstacles == [{'x': 1, 'y': 0, 'width': 2, 'height': 2}]
@@ -0,0 +1,66 @@
+import SimEngine
+import Orchestrator
+
+def _mapBuilder():
+    return Orchestrator.MapBuilder(SimEngine.SimEngine(headless=True))
+
+def test_consolidate_dots_into_lines():
+    mapBuilder = _mapBuilder()
+    for (x,y) in [(0,0),(0.5,0),(1.2,0),(5,0),(3,3),(3,3.8)]:
+        mapBuilder.notifBump(x,y)
+    assert mapBuilder._consolidateMap() == True
+    assert mapBuilder.discoMap['lines'] == {(0,0,1.2,0),(3,3,3,3.8)}
+    assert mapBuilder.discoMap['dots']  == {(5,0)}
+
+    # quiet tick
+    assert mapBuilder._consolidateMap() == False
+
+    # extend existing line, swallowing the lonely dot
+    for (x,y) in [(2,0),(3,0),(4,0)]:
+        mapBuilder.notifBump(x,y)
+    assert mapBuilder._consolidateMap() == True
+    assert mapBuilder.discoMap['lines'] == {(0,0,5,0),(3,3,3,3.8)}
+    assert mapBuilder.discoMap['dots']  == set()
+
+def test_map_complete_closed_loop():
+    mapBuilder = _mapBuilder()
+    # three sides of a square
+    for (x,y) in [(0,0),(1,0),(2,0),(2,1),(2,2),(1,2),(0,2)]:
+        mapBuilder.notifBump(x,y)
+    mapBuilder._consolidateMap()
+    assert mapBuilder._isMapComplete() == False
+    # close the square
+    mapBuilder.notifBump(0,0.5)
+    mapBuilder.notifBump(0,1.5)
+    mapBuilder._consolidateMap()
+    assert mapBuilder._isMapComplete() == True
+    # a dot far away
+    mapBuilder.notifBump(10,10)
+    mapBuilder._consolidateMap()
+    assert mapBuilder._isMapComplete() == False
+
+def test_map_snapshots():
+    mapBuilder = _mapBuilder()
+    snapshot   = mapBuilder.getMap()
+    assert snapshot['version'] == 0
+    # quiet tick publishes nothing
+    mapBuilder._houseKeeping()
+    assert mapBuilder.getMap() is snapshot
+    # new line
+    for (x,y) in [(0,0),(1,0)]:
+        mapBuilder.notifBump(x,y)
+    mapBuilder._houseKeeping()
+    assert mapBuilder.getMapVersion() == 1
+    assert mapBuilder.getMap()['lines'] == ((0,0,1,0),)
+    # previous snapshot untouched
+    assert snapshot['lines'] == ()
+
+def test_dotbots_view():
+    view = Orchestrator.DotBotsView([(1,2),(3,4)])
+    assert len(view) == 2
+    view.heading[1]   = 90
+    view.commandId[1] = 7
+    assert view[1]['x'] == 3
+    assert view[1]['heading'] == 90
+    assert view[1]['commandId'] == 7
+    assert view[0]['commandId'] == 0
@@ -0,0 +1,75 @@
+import random
+import struct
+
+import pytest
+
+import Protocol
+import RunSim
+import Simulation
+
+def test_downstream_codec():
+    commands = [{'heading': random.choice(Protocol.HEADINGS),'speed': random.choice([0,1])} for _ in range(1001)]
+    frames   = Protocol.encodeDownstream(commands)
+    assert [len(frame) for frame in frames] == [255,246]
+    received = Protocol.DownstreamFrames(frames)
+    for (dotBotId,command) in enumerate(commands):
+        if command['speed']==0:
+            assert received[dotBotId]['speed']   == 0
+        else:
+            assert received[dotBotId]['heading'] == command['heading']
+
+def test_upstream_codec():
+    msg      = {'dotBotId': 70000,'startTs': 1.5,'bumpTs': Protocol.quantize(3.14159)}
+    frame    = Protocol.encodeUpstream(msg,now=60.002)
+    assert len(frame)*8 == 160
+    assert Protocol.UPSTREAMFRAMELEN-Protocol.FRAMEOVERHEAD == 4
+    assert Protocol.decodeUpstream(frame,now=60.002) == {'dotBotId': 70000,'startTs': 1.5,'bumpTs': 3.142}
+    with pytest.raises(struct.error):
+        Protocol.encodeUpstream(msg,now=70) # reported too late
+
+def test_next_turn():
+    (turnTs,heading) = Protocol.nextTurn(3,1.5,90)
+    assert (turnTs,heading) == Protocol.nextTurn(3,1.5,90) # the orchestrator draws the same turn
+    assert 1.5 < turnTs <= 1.5+Protocol.MAXLEG/Protocol.TICKS
+    assert turnTs == Protocol.quantize(turnTs)
+    assert heading in Protocol.HEADINGS and heading != 90
+
+@pytest.mark.parametrize('slotted',[False,True])
+@pytest.mark.parametrize('seed',[0,1,2])
+def test_packed_simulation(seed,slotted):
+    simSetting = dict(RunSim.SIMSETTINGS[0],packedFrames=True,seed=seed,slotted=slotted,pdr=0.8)
+    simulation = Simulation.Simulation(simSetting,headless=True)
+    # where the DotBots bump, and where the orchestrator locates the bumps
+    (bumps,located) = (set(),[])
+    toOrchestrator  = simulation.wireless.toOrchestrator
+    def reportBump(msg):
+        dotbot      = simulation.dotBots[msg['dotBotId']]
+        bumps.add((dotbot.x,dotbot.y))
+        toOrchestrator(msg)
+    simulation.wireless.toOrchestrator          = reportBump
+    notifBump       = simulation.orchestrator.mapBuilder.notifBump
+    def locateBump(x,y):
+        located.append((x,y))
+        notifBump(x,y)
+    simulation.orchestrator.mapBuilder.notifBump = locateBump
+    simulation.run(untilTs=200)
+    # the orchestrator locates every bump exactly, over lossy links too
+    assert located and set(located) <= bumps
+    stats      = simulation.wireless.stats
+    assert stats['numUpstreamFrames'] > 0
+    assert stats['numDownstreamPackets'] == stats['numDownstreamFrames'] # 50 DotBots fit in one frame
+    perSecond  = stats['perSecond']
+    assert sum(s['upstreamBytes']   for s in perSecond.values()) == 20*stats['numUpstreamFrames']
+    assert sum(s['downstreamBytes'] for s in perSecond.values()) == 25*stats['numDownstreamFrames']
+    # DotBots only move along the 8 headings
+    assert all(dotbot.headingActual in Protocol.HEADINGS for dotbot in simulation.dotBots)
+
+@pytest.mark.parametrize('slotted',[False,True])
+@pytest.mark.parametrize('seed',[0,1,2])
+def test_self_turns(seed,slotted):
+    simSetting = dict(RunSim.SIMSETTINGS[0],packedFrames=True,selfTurns=True,seed=seed,slotted=slotted)
+    result     = Simulation.Simulation(simSetting,headless=True).run()
+    # the orchestrator follows the turns, the map completes
+    assert result['complete']
+    unpacked   = Simulation.Simulation(dict(simSetting,packedFrames=False,selfTurns=False),headless=True).run()
+    assert result['completionTime'] <= 2.5*unpacked['completionTime']
@@ -0,0 +1,33 @@
+import RunSim
+import Simulation
+import Replay
+
+def _state(simulation):
+    view = simulation.orchestrator.getView()
+    return (
+        [dotbot.getAttitude() for dotbot in simulation.dotBots],
+        view['dotbots'],
+        set(view['discomap']['dots']),
+        set(view['discomap']['lines']),
+        view['discomap']['complete'],
+    )
+
+def test_replay(tmp_path,monkeypatch):
+    monkeypatch.setattr(Replay.Replay,'KEYFRAMEEVENTS',100)
+    path       = str(tmp_path/'run.trace')
+    simulation = Simulation.Simulation(dict(RunSim.SIMSETTINGS[0],seed=0),headless=True,tracePath=path)
+    states     = {}
+    for ts in [0.5,7,13.25,30.125]:
+        simulation.simEngine.runUntil(untilTs=ts)
+        states[ts] = _state(simulation)
+    result     = simulation.run()
+    states[result['completionTime']] = _state(simulation)
+    simulation.close()
+    
+    replay     = Replay.Replay(path,headless=True)
+    assert len(replay._keyframes) > 1
+    # forward, then backward
+    for ts in sorted(states)+sorted(states,reverse=True):
+        replay.seek(ts)
+        assert replay.simEngine.currentTime() == ts
+        assert _state(replay) == states[ts]
@@ -0,0 +1,64 @@
+import SimEngine
+
+def test_eventqueue_order():
+    eventQueue = SimEngine.EventQueue()
+    for (ts,name) in [(2,'c'),(1,'a'),(2,'d'),(1,'b'),(0,'start')]:
+        eventQueue.push(ts,name)
+    order = []
+    while len(eventQueue):
+        order += [eventQueue.pop().cb]
+    assert order == ['start','a','b','c','d']
+    assert eventQueue.pop() is None
+
+def test_eventqueue_cancel_reschedule():
+    eventQueue = SimEngine.EventQueue()
+    e1 = eventQueue.push(1,'e1')
+    e2 = eventQueue.push(2,'e2')
+    e3 = eventQueue.push(3,'e3')
+    e1.cancel()
+    e1.cancel() # no effect
+    e3.reschedule(0.5)
+    assert len(eventQueue) == 2
+    assert eventQueue.peekTime() == 0.5
+    assert eventQueue.pop() is e3
+    assert eventQueue.pop() is e2
+    assert not e1.isPending()
+    assert eventQueue.pop() is None
+
+def test_rununtil_headless():
+    simEngine = SimEngine.SimEngine(headless=True)
+    fired     = []
+    def tick():
+        fired.append(simEngine.currentTime())
+        simEngine.schedule(simEngine.currentTime()+1,tick)
+    simEngine.schedule(simEngine.currentTime(),tick)
+    start     = simEngine.currentTime()
+    assert simEngine.runUntil(untilTs=start+2.5) == False
+    assert fired == [start,start+1,start+2]
+    assert simEngine.currentTime() == start+2.5
+    assert simEngine.runUntil(predicate=lambda: len(fired)==5) == True
+    assert len(fired) == 5
+
+def test_batch_end():
+    simEngine = SimEngine.SimEngine(headless=True)
+    log       = []
+    simEngine.subscribeBatchEnd(lambda: log.append(('end',simEngine.currentTime())))
+    for (ts,name) in [(1,'a'),(2,'c'),(1,'b')]:
+        simEngine.schedule(ts,lambda name=name: log.append(name))
+    simEngine.runUntil()
+    assert log == ['a','b',('end',1),'c',('end',2)]
+
+def test_profiler():
+    simEngine = SimEngine.SimEngine(headless=True,profile=True)
+    log       = []
+    for ts in [1,2,2]:
+        simEngine.schedule(ts,log.append,ts)
+    simEngine.runUntil()
+    assert log == [1,2,2]
+    stats     = simEngine.profiler.getStats()
+    assert stats['numEvents'] == 3
+    assert stats['queueDepth']['max'] == 2
+    assert stats['calls']['list.append']['count'] == 3
+    assert sum(stats['calls']['list.append']['histogram'].values()) == 3
+    
+    assert SimEngine.SimEngine(headless=True).profiler is None
@@ -0,0 +1,128 @@
+import os
+import random
+
+import bottle
+import pytest
+
+import DotBot
+import RunSim
+import Simulation
+import SimUI
+
+def test_delta_stream():
+    random.seed(0)
+    simulation = Simulation.Simulation(RunSim.SIMSETTINGS[0],headless=True)
+    stream     = SimUI.DeltaStream(simulation)
+    numDotBots = len(simulation.dotBots)
+
+    # first frame is the full state
+    frame      = stream.nextFrame()
+    assert len(frame['dotbots']) == numDotBots
+    assert frame['discomap']['version'] == 0
+
+    # nothing happened
+    frame      = stream.nextFrame()
+    assert frame['dotbots'] == []
+    assert 'discomap' not in frame
+
+    # run, replaying the deltas must give the current map
+    (dots,lines) = (set(),set())
+    for untilTs in range(1,30):
+        simulation.simEngine.runUntil(untilTs=untilTs)
+        frame  = stream.nextFrame()
+        if untilTs>1: # all DotBots start moving at t=0
+            assert len(frame['dotbots']) < numDotBots
+        if 'discomap' in frame:
+            dots  = (dots -set(frame['discomap']['dotsRemoved'])) |set(frame['discomap']['dotsAdded'])
+            lines = (lines-set(frame['discomap']['linesRemoved']))|set(frame['discomap']['linesAdded'])
+    discomap   = simulation.orchestrator.mapBuilder.getMap()
+    assert dots  == set(discomap['dots'])
+    assert lines == set(discomap['lines'])
+
+@pytest.mark.parametrize('withNumpy',[True,False])
+def test_pack_view(withNumpy,monkeypatch):
+    if not withNumpy:
+        monkeypatch.setattr(SimUI, 'np',None)
+        monkeypatch.setattr(DotBot,'np',None)
+    random.seed(0)
+    simulation = Simulation.Simulation(RunSim.SIMSETTINGS[0],headless=True)
+    simulation.simEngine.runUntil(untilTs=30)
+    view       = SimUI.unpackView(SimUI.packView(simulation))
+    assert view['now'] == 30
+    assert len(view['dotbots']) == len(simulation.dotBots)
+    for (dotbot,attitude) in zip(view['dotbots'],[dotbot.getAttitude() for dotbot in simulation.dotBots]):
+        assert abs(dotbot['x']-attitude['x']) < 1e-3
+        assert abs(dotbot['next_bump_y']-attitude['next_bump_y']) < 1e-3
+    discomap   = simulation.orchestrator.mapBuilder.getMap()
+    assert len(view['discomap']['lines']) == len(discomap['lines'])
+
+#=== conditional requests
+
+def newSimUI(simulation):
+    # the web handlers, without starting the web server
+    simUI               = SimUI.SimUI.__new__(SimUI.SimUI)
+    simUI.simulation    = simulation
+    simUI.floorplan     = simulation.floorplan
+    simUI.dotbots       = simulation.dotBots
+    simUI.orchestrator  = simulation.orchestrator
+    simUI.simEngine     = simulation.simEngine
+    simUI.startTs       = 1e9
+    simUI.floorplanETag = '"floorplan"'
+    return simUI
+
+def get(handler,*args,**headers):
+    '''
+    \return (status,headers,body) of the response of handler to a GET request with headers (e.g. If_None_Match)
+    '''
+    environ  = {'REQUEST_METHOD': 'GET'}
+    environ.update({'HTTP_'+name.upper(): value for (name,value) in headers.items()})
+    bottle.request.bind(environ)
+    bottle.response.bind()
+    body     = handler(*args)
+    response = body if isinstance(body,bottle.HTTPResponse) else bottle.response
+    return (response.status_code,response.headers,body)
+
+def test_conditional_requests(monkeypatch):
+    monkeypatch.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))) # static/ is relative to the root
+    random.seed(0)
+    simulation = Simulation.Simulation(RunSim.SIMSETTINGS[0],headless=True)
+    simUI      = newSimUI(simulation)
+    simulation.simEngine.runUntil(untilTs=5)
+    handlers   = [
+        (simUI._webhandle_dotbots_GET,),
+        (simUI._webhandle_dotbotsbin_GET,),
+        (simUI._webhandle_floorplan_GET,),
+        (simUI._webhandle_static_GET,'dotbotsim.js'),
+    ]
+    
+    # 304 with the ETag of the previous response, always revalidated
+    etags      = []
+    for handler in handlers:
+        (status,headers,_)  = get(*handler)
+        assert status==200
+        assert headers['Cache-Control']=='no-cache'
+        etags              += [headers['ETag']]
+        (status,headers,_)  = get(*handler,If_None_Match=etags[-1])
+        assert status==304
+        assert headers['Cache-Control']=='no-cache'
+    
+    # If-Modified-Since, on static files
+    (_,headers,_)  = get(simUI._webhandle_static_GET,'dotbotsim.js')
+    (status,_,_)   = get(simUI._webhandle_static_GET,'dotbotsim.js',If_Modified_Since=headers['Last-Modified'])
+    assert status==304
+    (status,_,_)   = get(simUI._webhandle_static_GET,'dotbotsim.js',If_Modified_Since=bottle.http_date(0))
+    assert status==200
+    
+    # an event at the same simulated time changes the state, hence the views
+    dotbot     = simulation.dotBots[0]
+    simulation.simEngine.schedule(5,dotbot._setHeading,(dotbot.headingActual+90)%360)
+    simulation.simEngine.runUntil(untilTs=5)
+    assert simulation.simEngine.currentTime()==5
+    for (handler,etag) in zip(handlers[:2],etags[:2]):
+        (status,headers,body) = get(*handler,If_None_Match=etag)
+        assert status==200
+        assert headers['ETag']!=etag
+        assert body
+    for (handler,etag) in zip(handlers[2:],etags[2:]):
+        (status,_,_) = get(*handler,If_None_Match=etag)
+        assert status==304
@@ -0,0 +1,80 @@
+import random
+
+import RunSim
+import Simulation
+import SimVersion
+
+def test_two_simulations_same_process():
+    random.seed(0)
+    results = []
+    for _ in range(2):
+        simulation = Simulation.Simulation(RunSim.SIMSETTINGS[0],headless=True)
+        results   += [simulation.run(untilTs=600)]
+    for result in results:
+        assert result['numDotBots'] == RunSim.SIMSETTINGS[0]['numDotBots']
+        assert result['complete']
+
+def test_downstream_wakes_only_changed_dotbots():
+    random.seed(0)
+    simulation = Simulation.Simulation(RunSim.SIMSETTINGS[0],headless=True)
+    simulation.run(untilTs=60)
+    stats      = simulation.wireless.stats
+    numDotBots = len(simulation.dotBots)
+    # one delivery per DotBot at start, then one per bump
+    assert stats['numDownstreamDeliveries'] == numDotBots+stats['numUpstreamFrames']
+    # yet every frame is heard by every DotBot
+    assert stats['numDownstreamReceptions'] == numDotBots*stats['numDownstreamFrames']
+
+def test_slotted():
+    random.seed(0)
+    simSetting = dict(RunSim.SIMSETTINGS[0],slotted=True)
+    simulation = Simulation.Simulation(simSetting,headless=True)
+    result     = simulation.run()
+    assert result['complete']
+    # one frame at start, then one per cycle
+    assert simulation.wireless.stats['numDownstreamFrames'] == 1+int(result['completionTime'])
+
+def test_seed():
+    simSetting = dict(RunSim.SIMSETTINGS[0],seed=3,pdr=0.8)
+    results    = []
+    for globalSeed in [0,1]:
+        random.seed(globalSeed) # the global random module plays no role
+        simulation = Simulation.Simulation(simSetting,headless=True)
+        results   += [simulation.run()]
+        assert simulation.fingerprint == Simulation.fingerprint(simSetting)
+    assert results[0]['completionTime'] == results[1]['completionTime']
+    assert results[0]['fingerprint'] != Simulation.fingerprint(dict(simSetting,seed=4))
+
+def test_fingerprint_model_version(monkeypatch):
+    simSetting = dict(RunSim.SIMSETTINGS[0],seed=3)
+    before     = Simulation.fingerprint(simSetting)
+    monkeypatch.setattr(SimVersion,'MODEL',SimVersion.MODEL+1)
+    assert Simulation.fingerprint(simSetting) != before
+
+def test_checkpoint(tmp_path):
+    simSetting = dict(RunSim.SIMSETTINGS[0],seed=5,pdr=0.5)
+    reference  = Simulation.Simulation(simSetting,headless=True).run()
+    
+    # resume after 20 s, from disk
+    simulation = Simulation.Simulation(simSetting,headless=True)
+    simulation.run(untilTs=20.3)
+    path       = str(tmp_path/'checkpoint')
+    Simulation.saveCheckpoint(simulation.checkpoint(),path)
+    resumed    = Simulation.Simulation.fromCheckpoint(Simulation.loadCheckpoint(path),headless=True)
+    result     = resumed.run()
+    assert result['completionTime'] == reference['completionTime']
+    assert result['fingerprint']    == reference['fingerprint']
+    simulation.run()
+    assert resumed.wireless.stats   == simulation.wireless.stats
+    
+    # fork a variant
+    fork       = Simulation.Simulation.fromCheckpoint(
+        Simulation.loadCheckpoint(path),
+        headless   = True,
+        simSetting = dict(simSetting,pdr=1),
+        profile    = True,
+    )
+    assert fork.fingerprint != Simulation.fingerprint(dict(simSetting,pdr=1))
+    result     = fork.run()
+    assert result['complete']
+    assert result['profile']['numEvents'] > 0 # profiled from the checkpoint on
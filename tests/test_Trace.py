@@ -0,0 +1,45 @@
+import math
+
+import RunSim
+import Simulation
+import Trace
+
+def test_trace(tmp_path,monkeypatch):
+    monkeypatch.setattr(Trace,'CHUNKROWS',256)
+    path       = str(tmp_path/'run.trace')
+    simulation = Simulation.Simulation(dict(RunSim.SIMSETTINGS[0],seed=0),headless=True,tracePath=path)
+    result     = simulation.run()
+    simulation.close()
+    
+    with Trace.TraceReader(path) as reader:
+        assert reader.meta['fingerprint'] == result['fingerprint']
+        
+        # one command per DotBot at start, then one per bump handled
+        bumps    = reader.read('bump')
+        commands = reader.read('command')
+        assert len(commands['dotBotId']) >= RunSim.SIMSETTINGS[0]['numDotBots']
+        assert len(bumps['ts']) > Trace.CHUNKROWS # spans several chunks
+        assert list(bumps['ts']) == sorted(bumps['ts'])
+        
+        # replaying the map deltas gives the final map
+        (dots,lines) = (set(),set())
+        deltas       = reader.read('mapdelta')
+        for (added,x1,y1,x2,y2) in zip(deltas['added'],deltas['x1'],deltas['y1'],deltas['x2'],deltas['y2']):
+            (elems,elem) = (dots,(x1,y1)) if math.isnan(x2) else (lines,(x1,y1,x2,y2))
+            if added:
+                elems.add(elem)
+            else:
+                elems.remove(elem)
+        discomap     = simulation.orchestrator.mapBuilder.getMap()
+        assert dots  == set(discomap['dots'])
+        assert lines == set(discomap['lines'])
+        
+        assert list(reader.read('complete')['ts']) == [result['completionTime']]
+        
+        # chunks are views on the file
+        numRows      = 0
+        for chunk in reader.chunks('bump'):
+            numRows += len(chunk['x'])
+            for column in chunk.values():
+                column.release()
+        assert numRows == reader.numRows('bump') == len(bumps['ts'])
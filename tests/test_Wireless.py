@@ -0,0 +1,21 @@
+import random
+
+import pytest
+
+import RunSim
+import Simulation
+import Wireless
+
+@pytest.mark.parametrize('useNumpy',[True,False])
+def test_lossy_links(monkeypatch,useNumpy):
+    if not useNumpy:
+        monkeypatch.setattr(Wireless,'np',None)
+    random.seed(0)
+    simSetting = dict(RunSim.SIMSETTINGS[0],pdr=0.5,wirelessRange=40)
+    simulation = Simulation.Simulation(simSetting,headless=True)
+    result     = simulation.run()
+    stats      = simulation.wireless.stats
+    assert stats['numDownstreamLosses'] > 0
+    assert stats['numUpstreamLosses']   > 0
+    # lost frames are retried until the map is complete
+    assert result['complete']
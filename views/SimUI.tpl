@@ -24,10 +24,9 @@
     $(document).ready(function() {
         gettingThingsInPlace();
         getFloorplan();
-        getDotBots();
-        // periodically refresh
-        setInterval(function() {
-            getDotBots()
-        }, 100);
+        // receive updates pushed by the server, or periodically poll if not possible
+        if (listenToStream()==false) {
+            startPolling();
+        }
     });
 </script>
\ No newline at end of file